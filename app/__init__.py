@@ -63,6 +63,10 @@ def create_app(config_name=None):
     cache.init_app(app)
     limiter.init_app(app)
 
+    # Warnung, wenn der Cache nicht zwischen den Workern geteilt ist
+    from .utils import geteilter_cache
+    geteilter_cache.init_app(app)
+
     # Security headers
     if not app.debug:
         Talisman(app, **{
@@ -79,10 +83,15 @@ def create_app(config_name=None):
         })
 
     # Prometheus metrics
+    metrics = None
     if app.config.get('ENABLE_METRICS'):
         metrics = PrometheusMetrics(app)
         metrics.info('app_info', 'Application info', version='1.0.0')
 
+    # SQL-Anweisungen und Datenbankzeit je Request, Budget-Warnungen
+    from .utils import abfrage_budget
+    abfrage_budget.init_app(app, metrics)
+
     # Login manager configuration
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Bitte melden Sie sich an, um diese Seite zu sehen.'
@@ -94,7 +103,11 @@ def create_app(config_name=None):
         return User.query.get(int(user_id))
 
     # Import models to ensure they are registered with SQLAlchemy
-    from .models import user, aufmass, bautagebuch, material, kabel_kategorie
+    from .models import user, aufmass, bautagebuch, material, kabel_kategorie, duplikat, statistik
+
+    # {% fragment %}-Tag für gecachte Template-Teile
+    from .utils.fragment_cache import FragmentCache
+    app.jinja_env.add_extension(FragmentCache)
 
     # Template context processors
     @app.context_processor
@@ -6,7 +6,9 @@ Models Package - Import aller Modelle
 from .user import User
 from .material import Material
 from .aufmass import AufmassEntry, AufmassDocument
-from .bautagebuch import BautagebuchEntry, Bautagebuch, WochenExport
+from .bautagebuch import BautagebuchEntry, Bautagebuch, WochenExport, ExportAuftrag
+from .duplikat import DuplikatKandidat, DuplikatAusnahme
+from .statistik import AufmassTagesstatistik, AufmassGesamtzahl
 
 # Alle Modelle für Import verfügbar machen
 __all__ = [
@@ -16,5 +18,10 @@ __all__ = [
     'AufmassDocument',
     'BautagebuchEntry',
     'Bautagebuch',
-    'WochenExport'
+    'WochenExport',
+    'ExportAuftrag',
+    'DuplikatKandidat',
+    'DuplikatAusnahme',
+    'AufmassTagesstatistik',
+    'AufmassGesamtzahl'
 ]
@@ -1,7 +1,8 @@
 from app import db
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, Boolean, Index
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, Boolean, Index, event
+from sqlalchemy.orm import relationship, validates
+from app.utils.zeitraum import als_tag, kalenderwoche
 
 
 class AufmassEntry(db.Model):
@@ -22,6 +23,11 @@ class AufmassEntry(db.Model):
     datum = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
     bemerkungen = Column(Text, nullable=True)
 
+    # Aus datum abgeleitet (siehe datumsfelder), für Filter ohne func.date()
+    tag = Column(Date, nullable=True, index=True)
+    kalenderwoche = Column(Integer, nullable=True)
+    jahr = Column(Integer, nullable=True)
+
     # Status-Felder
     is_duplicate_checked = Column(Boolean, default=False, index=True)
     is_approved = Column(Boolean, default=True, index=True)
@@ -61,11 +67,28 @@ class AufmassEntry(db.Model):
         Index('idx_aufmass_mitarbeiter_date', 'mitarbeiter_id', 'datum'),
         Index('idx_aufmass_ort_date', 'ort', 'datum'),
         Index('idx_aufmass_active', 'is_deleted', 'is_approved'),
+        Index('idx_aufmass_mitarbeiter_tag', 'mitarbeiter_id', 'tag'),
+        Index('idx_aufmass_material_tag', 'material_id', 'tag'),
+        Index('idx_aufmass_woche_mitarbeiter', 'jahr', 'kalenderwoche', 'mitarbeiter_id'),
     )
 
     def __repr__(self):
         return f'<AufmassEntry {self.id} - {self.ort}>'
 
+    @staticmethod
+    def datumsfelder(datum):
+        """tag, kalenderwoche und jahr (ISO-Woche) zu einem Datum"""
+        if datum is None:
+            return {'tag': None, 'kalenderwoche': None, 'jahr': None}
+        jahr, kw = kalenderwoche(datum)
+        return {'tag': als_tag(datum), 'kalenderwoche': kw, 'jahr': jahr}
+
+    @validates('datum')
+    def _setze_datumsfelder(self, key, datum):
+        for feld, wert in self.datumsfelder(datum).items():
+            setattr(self, feld, wert)
+        return datum
+
     def soft_delete(self, user_id=None):
         """Soft delete the entry."""
         self.is_deleted = True
@@ -112,7 +135,7 @@ class AufmassEntry(db.Model):
         # Sicherstellen, dass Beziehungen geladen sind
         mitarbeiter_name = self.mitarbeiter.username if self.mitarbeiter else 'Unbekannt'
         material_name = self.material.name if self.material else 'Unbekannt'
-        material_einheit = self.material.einheit if self.material else ''
+        material_einheit = self.material.unit if self.material else ''
         
         return (f"Am {datum_str} führte {mitarbeiter_name} "
                 f"in {self.ort}{raum_text} folgende Leistung aus: "
@@ -138,6 +161,13 @@ class AufmassEntry(db.Model):
         return errors
 
 
+@event.listens_for(AufmassEntry, 'before_insert')
+def _datum_vorbelegen(mapper, connection, target):
+    """Setzt das Standard-Datum vorab, damit tag, kalenderwoche und jahr gefüllt werden"""
+    if target.datum is None:
+        target.datum = datetime.now(timezone.utc)
+
+
 class AufmassDocument(db.Model):
     """Dokumente/Bilder zu Aufmaß-Einträgen"""
     __tablename__ = 'aufmass_documents'
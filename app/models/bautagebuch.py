@@ -57,6 +57,10 @@ class BautagebuchEntry(db.Model):
     jahr = Column(Integer, nullable=False)
     erstellt_am = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (
+        Index('idx_bautagebuch_jahr_kw', 'jahr', 'kalenderwoche'),
+    )
+
     # Beziehungen - String-Referenz statt Import
     aufmass_entry = relationship(
         'AufmassEntry',
@@ -89,6 +93,10 @@ class WochenExport(db.Model):
     exportiert_von = Column(String(100), nullable=False)
     dateiname = Column(String(200))
 
+    __table_args__ = (
+        Index('idx_wochen_export_jahr_kw', 'jahr', 'kalenderwoche'),
+    )
+
     def __repr__(self):
         return f'<WochenExport {self.id} - KW{self.kalenderwoche}/{self.jahr}>'
 
@@ -103,6 +111,69 @@ class WochenExport(db.Model):
         }
 
 
+class ExportAuftrag(db.Model):
+    """Export eines Wochenberichts, der im Hintergrund erstellt wird
+
+    Status: 'wartet' -> 'laeuft' -> 'fertig' (Datei unter datei) oder 'fehler'.
+    Mit kalenderwoche_bis umfasst der Export die Wochen kalenderwoche bis
+    kalenderwoche_bis des Jahres; fortschritt zählt die fertigen Wochen,
+    fortschritt_am hält den Zeitpunkt des letzten Fortschritts fest.
+    """
+    __tablename__ = 'export_jobs'
+
+    id = Column(String(32), primary_key=True)
+    kalenderwoche = Column(Integer, nullable=False)
+    kalenderwoche_bis = Column(Integer, nullable=True)
+    jahr = Column(Integer, nullable=False)
+    format = Column(String(10), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=True, index=True)
+    angefordert_von = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False, default='wartet')
+    datei = Column(String(500), nullable=True)
+    dateiname = Column(String(200), nullable=True)
+    fehler = Column(Text, nullable=True)
+    fortschritt = Column(Integer, nullable=False, default=0)
+    gesamt = Column(Integer, nullable=True)
+    fortschritt_am = Column(DateTime, nullable=True)
+    erstellt_am = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    fertig_am = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<ExportAuftrag {self.id} - KW{self.wochen}/{self.jahr} {self.format} ({self.status})>'
+
+    @property
+    def abgeschlossen(self):
+        return self.status in ('fertig', 'fehler')
+
+    @property
+    def ist_bereich(self):
+        return self.kalenderwoche_bis is not None
+
+    @property
+    def wochen(self):
+        """'10' bzw. '1-52' für Anzeige und Dateinamen"""
+        if self.ist_bereich:
+            return f'{self.kalenderwoche}-{self.kalenderwoche_bis}'
+        return str(self.kalenderwoche)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kalenderwoche': self.kalenderwoche,
+            'kalenderwoche_bis': self.kalenderwoche_bis,
+            'jahr': self.jahr,
+            'format': self.format,
+            'status': self.status,
+            'fortschritt': self.fortschritt,
+            'gesamt': self.gesamt,
+            'fortschritt_am': self.fortschritt_am.isoformat() if self.fortschritt_am else None,
+            'dateiname': self.dateiname,
+            'fehler': self.fehler,
+            'erstellt_am': self.erstellt_am.isoformat() if self.erstellt_am else None,
+            'fertig_am': self.fertig_am.isoformat() if self.fertig_am else None
+        }
+
+
 # Event-Listener - mit spätem Import um zirkuläre Imports zu vermeiden
 @event.listens_for(db.Model, 'mapper_configured', propagate=True)
 def receive_mapper_configured(mapper, cls):
@@ -111,16 +182,15 @@ def receive_mapper_configured(mapper, cls):
         @event.listens_for(cls, 'after_insert')
         def create_bautagebuch_eintrag(mapper, connection, target):
             """Erstellt automatisch einen Bautagebuch-Eintrag nach dem Speichern eines Aufmaßes"""
-            from datetime import date
             from sqlalchemy import text
 
-            # Kalenderwoche berechnen
-            kw = target.datum.isocalendar()[1]
-            jahr = target.datum.year
+            # Kalenderwoche (ISO) aus den abgeleiteten Datumsfeldern
+            kw = target.kalenderwoche
+            jahr = target.jahr
 
             # Text generieren mit SQL-Query um Beziehungen zu laden
             user_query = text("SELECT username FROM users WHERE id = :user_id")
-            material_query = text("SELECT name, einheit FROM materialien WHERE id = :material_id")
+            material_query = text("SELECT name, unit FROM materialien WHERE id = :material_id")
             
             user_result = connection.execute(user_query, {"user_id": target.mitarbeiter_id}).fetchone()
             material_result = connection.execute(material_query, {"material_id": target.material_id}).fetchone()
@@ -145,7 +215,7 @@ def receive_mapper_configured(mapper, cls):
                     BautagebuchEntry.__table__.insert().values(
                         aufmass_entry_id=target.id,
                         text=bautagebuch_text,
-                        datum=target.datum.date(),
+                        datum=target.tag,
                         kalenderwoche=kw,
                         jahr=jahr
                     )
@@ -0,0 +1,139 @@
+"""
+Modelle für gespeicherte Duplikat-Kandidaten und geprüfte Ausnahmen
+"""
+import json
+from datetime import datetime, timezone
+from app import db
+from sqlalchemy import Column, Integer, Float, Text, DateTime, ForeignKey, Index, UniqueConstraint, and_, or_
+from sqlalchemy.orm import relationship
+
+
+class DuplikatKandidat(db.Model):
+    """Paar von Aufmaßen, die als mögliches Duplikat erkannt wurden.
+
+    entry_a ist dabei immer der Haupteintrag (neueres Datum, bei gleichem
+    Datum die höhere ID), entry_b der ähnliche Eintrag.
+    """
+    __tablename__ = 'duplicate_candidates'
+
+    id = Column(Integer, primary_key=True)
+    entry_a_id = Column(Integer, ForeignKey('aufmass_entries.id', ondelete='CASCADE'), nullable=False, index=True)
+    entry_b_id = Column(Integer, ForeignKey('aufmass_entries.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = Column(Float, nullable=False)
+    risiko = Column(Integer, nullable=False, index=True)
+    kriterien = Column(Text, nullable=True)  # JSON-String mit den Ähnlichkeitskriterien
+    erstellt_am = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    # Beziehungen
+    entry_a = relationship('AufmassEntry', foreign_keys=[entry_a_id])
+    entry_b = relationship('AufmassEntry', foreign_keys=[entry_b_id])
+
+    __table_args__ = (
+        UniqueConstraint('entry_a_id', 'entry_b_id', name='uq_duplicate_candidates_pair'),
+        Index('idx_duplicate_candidates_risiko', 'risiko', 'entry_a_id'),
+    )
+
+    def __repr__(self):
+        return f'<DuplikatKandidat {self.entry_a_id} ~ {self.entry_b_id} ({self.score:.2f})>'
+
+    def get_kriterien(self):
+        """Gibt die Kriterien als Dictionary zurück"""
+        return json.loads(self.kriterien) if self.kriterien else {}
+
+    def set_kriterien(self, kriterien):
+        """Speichert die Kriterien als JSON-String"""
+        self.kriterien = json.dumps(kriterien)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'entry_a_id': self.entry_a_id,
+            'entry_b_id': self.entry_b_id,
+            'score': self.score,
+            'risiko': self.risiko,
+            'kriterien': self.get_kriterien(),
+            'erstellt_am': self.erstellt_am.isoformat() if self.erstellt_am else None
+        }
+
+    @staticmethod
+    def entferne_fuer_eintrag(aufmass_id):
+        """Entfernt alle Paare, an denen das Aufmaß beteiligt ist"""
+        return DuplikatKandidat.query.filter(or_(
+            DuplikatKandidat.entry_a_id == aufmass_id,
+            DuplikatKandidat.entry_b_id == aufmass_id
+        )).delete(synchronize_session=False)
+
+    @staticmethod
+    def anzahl_gruppen():
+        """Anzahl der Duplikat-Gruppen (Zusammenhangskomponenten der Paare)"""
+        # Später Import, um zirkuläre Imports zu vermeiden
+        from app.utils.aehnlichkeit import DisjunkteMengen
+
+        mengen = DisjunkteMengen()
+        for entry_a_id, entry_b_id in db.session.query(DuplikatKandidat.entry_a_id, DuplikatKandidat.entry_b_id):
+            mengen.vereinige(entry_a_id, entry_b_id)
+        return mengen.anzahl_mengen()
+
+
+class DuplikatAusnahme(db.Model):
+    """Paar von Aufmaßen, das als "kein Duplikat" bestätigt wurde.
+
+    Die Paare werden bei allen weiteren Scans übersprungen. entry_a_id ist
+    immer die kleinere ID, damit jedes Paar nur einmal gespeichert wird.
+    """
+    __tablename__ = 'duplicate_suppressions'
+
+    id = Column(Integer, primary_key=True)
+    entry_a_id = Column(Integer, ForeignKey('aufmass_entries.id', ondelete='CASCADE'), nullable=False, index=True)
+    entry_b_id = Column(Integer, ForeignKey('aufmass_entries.id', ondelete='CASCADE'), nullable=False, index=True)
+    decided_by = Column(Integer, ForeignKey('users.id'), nullable=True)
+    decided_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    # Beziehungen
+    entscheider = relationship('User', foreign_keys=[decided_by])
+
+    __table_args__ = (
+        UniqueConstraint('entry_a_id', 'entry_b_id', name='uq_duplicate_suppressions_pair'),
+    )
+
+    def __repr__(self):
+        return f'<DuplikatAusnahme {self.entry_a_id} ~ {self.entry_b_id}>'
+
+    @staticmethod
+    def packe(a, b):
+        """Packt ein Paar unabhängig von der Reihenfolge in einen Integer"""
+        return (min(a, b) << 32) | max(a, b)
+
+    @staticmethod
+    def lade_gepackt():
+        """Alle Ausnahmen als Menge gepackter Paare (siehe packe)"""
+        return {
+            DuplikatAusnahme.packe(a, b)
+            for a, b in db.session.query(DuplikatAusnahme.entry_a_id, DuplikatAusnahme.entry_b_id)
+        }
+
+    @staticmethod
+    def partner_von(aufmass_id):
+        """IDs aller Einträge, die mit dem Aufmaß als "kein Duplikat" bestätigt wurden"""
+        partner = set()
+        for a, b in db.session.query(DuplikatAusnahme.entry_a_id, DuplikatAusnahme.entry_b_id).filter(or_(
+            DuplikatAusnahme.entry_a_id == aufmass_id,
+            DuplikatAusnahme.entry_b_id == aufmass_id
+        )):
+            partner.add(b if a == aufmass_id else a)
+        return partner
+
+    @staticmethod
+    def markiere(a, b, user_id):
+        """Speichert das Paar als Ausnahme und entfernt den Duplikat-Kandidaten.
+
+        Der Commit erfolgt durch den Aufrufer.
+        """
+        entry_a_id, entry_b_id = min(a, b), max(a, b)
+        if not DuplikatAusnahme.query.filter_by(entry_a_id=entry_a_id, entry_b_id=entry_b_id).first():
+            db.session.add(DuplikatAusnahme(entry_a_id=entry_a_id, entry_b_id=entry_b_id, decided_by=user_id))
+
+        DuplikatKandidat.query.filter(or_(
+            and_(DuplikatKandidat.entry_a_id == a, DuplikatKandidat.entry_b_id == b),
+            and_(DuplikatKandidat.entry_a_id == b, DuplikatKandidat.entry_b_id == a)
+        )).delete(synchronize_session=False)
@@ -0,0 +1,285 @@
+"""
+Tagesstatistik der Aufmaße für die Dashboards
+
+Je (Tag, Mitarbeiter, Material) werden Anzahl und Mengensumme der aktiven
+Aufmaße gespeichert. Die Tabelle wird beim Flush in derselben Transaktion
+wie das Aufmaß fortgeschrieben (Neuanlage, Bearbeitung, Soft-Delete und
+Löschen), so dass Dashboard-Abfragen nur noch Tageszeilen summieren.
+
+Die Gesamtzahl aller aktiven Aufmaße steht zusätzlich in einer einzigen
+Zeile (AufmassGesamtzahl), damit sie nicht über alle Tageszeilen summiert
+werden muss.
+"""
+from collections import defaultdict
+from app import db
+from sqlalchemy import Column, Integer, Float, Date, ForeignKey, event, func, inspect, select, bindparam, literal, or_
+from sqlalchemy.orm import Session
+from .aufmass import AufmassEntry
+from .user import User
+from app.utils.zeitraum import filter_zeitraum
+
+# Felder des Aufmaßes, die in die Tagesstatistik eingehen
+STATISTIK_FELDER = ('datum', 'mitarbeiter_id', 'material_id', 'menge', 'is_deleted')
+
+
+class AufmassTagesstatistik(db.Model):
+    """Anzahl und Mengensumme der aktiven Aufmaße je Tag, Mitarbeiter und Material"""
+    __tablename__ = 'aufmass_daily_rollup'
+
+    tag = Column(Date, primary_key=True)
+    mitarbeiter_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True, index=True)
+    material_id = Column(Integer, ForeignKey('materialien.id', ondelete='CASCADE'), primary_key=True, index=True)
+    anzahl = Column(Integer, nullable=False, default=0)
+    menge_summe = Column(Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<AufmassTagesstatistik {self.tag} {self.mitarbeiter_id}/{self.material_id}: {self.anzahl}>'
+
+    # ------------------------------------------------------------------
+    # Abfragen
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _filter(cls, query, von=None, bis=None, mitarbeiter_id=None):
+        query = filter_zeitraum(query, cls.tag, von, bis)
+        if mitarbeiter_id is not None:
+            query = query.filter(cls.mitarbeiter_id == mitarbeiter_id)
+        return query
+
+    @classmethod
+    def anzahl_aufmasse(cls, von=None, bis=None, mitarbeiter_id=None):
+        """Anzahl aktiver Aufmaße im Zeitraum (Tage einschließlich)"""
+        query = cls._filter(db.session.query(func.coalesce(func.sum(cls.anzahl), 0)), von, bis, mitarbeiter_id)
+        return int(query.scalar())
+
+    @classmethod
+    def aktivitaet(cls, mitarbeiter_id=None):
+        """[(username, anzahl, letzter_tag)] je Benutzer, auch ohne Aufmaße"""
+        query = db.session.query(
+            User.username,
+            func.coalesce(func.sum(cls.anzahl), 0).label('entry_count'),
+            func.max(cls.tag).label('last_activity')
+        ).outerjoin(cls, cls.mitarbeiter_id == User.id)
+        if mitarbeiter_id is not None:
+            query = query.filter(User.id == mitarbeiter_id)
+        return query.group_by(User.id, User.username).order_by(User.username).all()
+
+    # ------------------------------------------------------------------
+    # Pflege
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def baue_neu(cls):
+        """Berechnet die Tabelle vollständig aus aufmass_entries neu
+
+        Der Commit erfolgt durch den Aufrufer.
+
+        Returns:
+            int: Anzahl der Tageszeilen
+        """
+        db.session.query(cls).delete(synchronize_session=False)
+        quelle = select(
+            AufmassEntry.tag,
+            AufmassEntry.mitarbeiter_id,
+            AufmassEntry.material_id,
+            func.count(AufmassEntry.id),
+            func.sum(AufmassEntry.menge)
+        ).where(
+            or_(AufmassEntry.is_deleted == False, AufmassEntry.is_deleted.is_(None))
+        ).group_by(
+            AufmassEntry.tag, AufmassEntry.mitarbeiter_id, AufmassEntry.material_id
+        )
+        db.session.execute(cls.__table__.insert().from_select(
+            ['tag', 'mitarbeiter_id', 'material_id', 'anzahl', 'menge_summe'], quelle
+        ))
+        db.session.query(AufmassGesamtzahl).delete(synchronize_session=False)
+        AufmassGesamtzahl.lege_an()
+        return db.session.query(func.count()).select_from(cls).scalar()
+
+    @classmethod
+    def baue_auf_falls_leer(cls):
+        """Baut die Tabelle auf, wenn sie leer ist, es aber aktive Aufmaße gibt
+
+        Für bestehende Datenbanken, in denen die Tabelle erst per
+        db.create_all() entstanden ist. Der Commit erfolgt durch den Aufrufer.
+
+        Returns:
+            int | None: Anzahl der Tageszeilen oder None, wenn nichts zu tun war
+        """
+        if db.session.query(cls.tag).limit(1).first() is not None:
+            return None
+        aktiv = db.session.query(AufmassEntry.id).filter(
+            or_(AufmassEntry.is_deleted == False, AufmassEntry.is_deleted.is_(None))
+        ).limit(1).first()
+        if aktiv is None:
+            return None
+        return cls.baue_neu()
+
+    @classmethod
+    def wende_an(cls, connection, deltas):
+        """Addiert {(tag, mitarbeiter_id, material_id): (anzahl, menge)} auf die Tageszeilen
+
+        PostgreSQL und SQLite schreiben per INSERT ... ON CONFLICT DO UPDATE,
+        andere Datenbanken per UPDATE mit anschließendem INSERT. Zeilen ohne
+        aktive Aufmaße werden entfernt.
+        """
+        werte = [
+            {'b_tag': tag, 'b_mitarbeiter_id': mitarbeiter_id, 'b_material_id': material_id,
+             'b_anzahl': anzahl, 'b_menge': menge}
+            for (tag, mitarbeiter_id, material_id), (anzahl, menge) in deltas.items()
+            if anzahl or menge
+        ]
+        if not werte:
+            return
+
+        tabelle = cls.__table__
+        schluessel = (
+            (tabelle.c.tag == bindparam('b_tag'))
+            & (tabelle.c.mitarbeiter_id == bindparam('b_mitarbeiter_id'))
+            & (tabelle.c.material_id == bindparam('b_material_id'))
+        )
+        neue_zeile = {
+            'tag': bindparam('b_tag'),
+            'mitarbeiter_id': bindparam('b_mitarbeiter_id'),
+            'material_id': bindparam('b_material_id'),
+            'anzahl': bindparam('b_anzahl'),
+            'menge_summe': bindparam('b_menge'),
+        }
+
+        dialekt = connection.dialect.name
+        if dialekt in ('postgresql', 'sqlite'):
+            if dialekt == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(tabelle).values(neue_zeile)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['tag', 'mitarbeiter_id', 'material_id'],
+                set_={
+                    'anzahl': tabelle.c.anzahl + stmt.excluded.anzahl,
+                    'menge_summe': tabelle.c.menge_summe + stmt.excluded.menge_summe,
+                }
+            )
+            connection.execute(stmt, werte)
+        else:
+            aktualisieren = tabelle.update().where(schluessel).values(
+                anzahl=tabelle.c.anzahl + bindparam('b_anzahl'),
+                menge_summe=tabelle.c.menge_summe + bindparam('b_menge')
+            )
+            for wert in werte:
+                if connection.execute(aktualisieren, wert).rowcount == 0:
+                    connection.execute(tabelle.insert().values(neue_zeile), wert)
+
+        connection.execute(tabelle.delete().where(schluessel & (tabelle.c.anzahl <= 0)), werte)
+
+        AufmassGesamtzahl.addiere(connection, sum(wert['b_anzahl'] for wert in werte))
+
+
+class AufmassGesamtzahl(db.Model):
+    """Anzahl aller aktiven Aufmaße als Zählerzeile (id=1)
+
+    Wird in derselben Transaktion wie die Tageszeilen fortgeschrieben. Fehlt
+    die Zeile (bestehende Datenbank vor lege_an()), summieren die Abfragen
+    die Tagesstatistik.
+    """
+    __tablename__ = 'aufmass_total'
+
+    ZEILE = 1
+
+    id = Column(Integer, primary_key=True)
+    anzahl = Column(Integer, nullable=False, default=0)
+
+    @classmethod
+    def anzahl_abfrage(cls):
+        """Skalare Unterabfrage auf den Zähler, NULL ohne Zählerzeile"""
+        return select(cls.anzahl).where(cls.id == cls.ZEILE).scalar_subquery()
+
+    @classmethod
+    def lege_an(cls):
+        """Legt die Zählerzeile aus der Tagesstatistik an, falls sie fehlt
+
+        Der Commit erfolgt durch den Aufrufer.
+
+        Returns:
+            bool: True, wenn die Zeile neu angelegt wurde
+        """
+        if db.session.get(cls, cls.ZEILE) is not None:
+            return False
+        quelle = select(
+            literal(cls.ZEILE), func.coalesce(func.sum(AufmassTagesstatistik.anzahl), 0)
+        )
+        db.session.execute(cls.__table__.insert().from_select(['id', 'anzahl'], quelle))
+        return True
+
+    @classmethod
+    def addiere(cls, connection, anzahl):
+        """Addiert anzahl auf den Zähler (ohne Zählerzeile wirkungslos)"""
+        if anzahl:
+            tabelle = cls.__table__
+            connection.execute(
+                tabelle.update().where(tabelle.c.id == cls.ZEILE).values(anzahl=tabelle.c.anzahl + anzahl)
+            )
+
+
+# ----------------------------------------------------------------------
+# Fortschreibung beim Flush
+# ----------------------------------------------------------------------
+
+def _beitrag(deltas, tag, mitarbeiter_id, material_id, menge, vorzeichen):
+    anzahl, summe = deltas[(tag, mitarbeiter_id, material_id)]
+    deltas[(tag, mitarbeiter_id, material_id)] = (anzahl + vorzeichen, summe + vorzeichen * (menge or 0.0))
+
+
+def _statistik_geaendert(obj):
+    zustand = inspect(obj)
+    return any(zustand.attrs[feld].history.has_changes() for feld in STATISTIK_FELDER)
+
+
+@event.listens_for(Session, 'before_flush')
+def _merke_alte_werte(session, flush_context, instances):
+    """Liest den Datenbankstand geänderter und gelöschter Aufmaße vor dem Flush
+
+    Die Attribut-History enthält den alten Wert nicht, wenn das Attribut vor
+    der Änderung nicht geladen war (z.B. nach einem Commit).
+    """
+    ids = [
+        obj.id for obj in session.dirty
+        if isinstance(obj, AufmassEntry) and obj.id is not None and _statistik_geaendert(obj)
+    ] + [
+        obj.id for obj in session.deleted
+        if isinstance(obj, AufmassEntry) and obj.id is not None
+    ]
+    if not ids:
+        return
+
+    zeilen = session.connection().execute(
+        select(
+            AufmassEntry.id, AufmassEntry.tag, AufmassEntry.mitarbeiter_id,
+            AufmassEntry.material_id, AufmassEntry.menge, AufmassEntry.is_deleted
+        ).where(AufmassEntry.id.in_(ids))
+    )
+    session.info['tagesstatistik_alt'] = {zeile.id: zeile for zeile in zeilen}
+
+
+@event.listens_for(Session, 'after_flush')
+def _schreibe_tagesstatistik(session, flush_context):
+    alte_werte = session.info.pop('tagesstatistik_alt', {})
+    deltas = defaultdict(lambda: (0, 0.0))
+
+    for zeile in alte_werte.values():
+        if not zeile.is_deleted:
+            _beitrag(deltas, zeile.tag, zeile.mitarbeiter_id, zeile.material_id, zeile.menge, -1)
+
+    geaendert = [obj for obj in session.dirty if isinstance(obj, AufmassEntry) and obj.id in alte_werte]
+    for obj in list(session.new) + geaendert:
+        if isinstance(obj, AufmassEntry) and obj not in session.deleted and not obj.is_deleted:
+            _beitrag(deltas, obj.tag, obj.mitarbeiter_id, obj.material_id, obj.menge, +1)
+
+    if deltas:
+        AufmassTagesstatistik.wende_an(session.connection(), deltas)
+
+        # Für Live-Updates nach dem Commit (siehe app/utils/dashboard_events.py)
+        session.info.setdefault('tagesstatistik_deltas', []).extend(
+            (tag, mitarbeiter_id, anzahl)
+            for (tag, mitarbeiter_id, _), (anzahl, _) in deltas.items() if anzahl
+        )
@@ -8,6 +8,8 @@ from app.models.material import Material  # Fixed import path
 from app.models.user import User  # Fixed import path
 from app.forms.material_forms import MaterialForm, BulkMaterialForm, MaterialSearchForm  # Fixed import path
 from app.forms.auth import RegistrationForm, PasswordChangeForm
+from app.utils.dashboard_statistik import DashboardStatistik
+from app.utils import dashboard_cache
 
 logger = logging.getLogger(__name__)
 
@@ -35,17 +37,14 @@ def admin_required(f):
 @admin_required
 def dashboard():
     """Admin Dashboard"""
-    # Statistiken sammeln
-    total_materials = Material.query.count()
-    active_materials = Material.query.filter_by(is_active=True).count()
-    inactive_materials = total_materials - active_materials
-    total_users = User.query.count()
+    # Statistiken aus dem Hintergrund-Cache (gemeinsam mit dashboard.admin)
+    zaehler = dashboard_cache.hole_mit_hintergrund('system_kennzahlen', DashboardStatistik.system_kennzahlen)
 
     stats = {
-        'total_materials': total_materials,
-        'active_materials': active_materials,
-        'inactive_materials': inactive_materials,
-        'total_users': total_users
+        'total_materials': zaehler['gesamt_materialien'],
+        'active_materials': zaehler['aktive_materialien'],
+        'inactive_materials': zaehler['gesamt_materialien'] - zaehler['aktive_materialien'],
+        'total_users': zaehler['gesamt_benutzer']
     }
 
     return render_template('admin/dashboard.html', stats=stats)
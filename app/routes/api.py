@@ -2,13 +2,17 @@
 API Routes für AJAX-Anfragen
 """
 import logging
-from flask import Blueprint, jsonify, request, current_app
+import time
+from flask import Blueprint, jsonify, request, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from app import db, cache
 from app.models.material import Material
 from app.models.aufmass import AufmassEntry
-from app.models.user import User
-from sqlalchemy import func
+from app.models.statistik import AufmassTagesstatistik
+from app.utils.dashboard_statistik import DashboardStatistik
+from app.utils import dashboard_cache, dashboard_events, zeitraum
+from app.utils.zeitraum import parse_tag
+from app.utils.zeitreihe import zeitreihe
 from datetime import datetime, timedelta, timezone
 
 api_bp = Blueprint('api', __name__)
@@ -39,46 +43,11 @@ def get_material(material_id):
 
 @api_bp.route('/dashboard/stats')
 @login_required
-@cache.cached(timeout=60)  # Cache for 1 minute
 def dashboard_stats():
     """Get dashboard statistics."""
     try:
-        # Base query depending on user role
-        if current_user.is_admin():
-            base_query = AufmassEntry.query
-        elif current_user.is_bauleiter():
-            # Bauleiter can see all entries (could be filtered by project in future)
-            base_query = AufmassEntry.query
-        else:
-            # Mitarbeiter can only see their own entries
-            base_query = AufmassEntry.query.filter_by(mitarbeiter_id=current_user.id)
-
-        # Calculate statistics
-        total_entries = base_query.count()
-        
-        # Entries this month
-        start_of_month = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        entries_this_month = base_query.filter(AufmassEntry.created_at >= start_of_month).count()
-        
-        # Entries today
-        start_of_day = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        entries_today = base_query.filter(AufmassEntry.created_at >= start_of_day).count()
-        
-        # Active materials count
-        active_materials = Material.query.filter_by(ist_aktiv=True).count()
-        
-        # Recent entries (last 7 days)
-        week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        recent_entries = base_query.filter(AufmassEntry.created_at >= week_ago).count()
-        
-        stats = {
-            'total_entries': total_entries,
-            'entries_this_month': entries_this_month,
-            'entries_today': entries_today,
-            'active_materials': active_materials,
-            'recent_entries': recent_entries
-        }
-        
+        # Je Benutzer gecacht, ungültig nach jedem Schreibvorgang (siehe dashboard_cache)
+        stats = dashboard_cache.hole('dashboard_stats', berechne_dashboard_stats)
         return jsonify({'success': True, 'stats': stats})
         
     except Exception as e:
@@ -86,6 +55,162 @@ def dashboard_stats():
         return jsonify({'success': False, 'error': 'Fehler beim Laden der Statistiken'}), 500
 
 
+def berechne_dashboard_stats():
+    """Kennzahlen für /api/dashboard/stats aus der Tagesstatistik"""
+    # Mitarbeiter sehen nur ihre eigenen Einträge, Admins und Bauleiter alle
+    if current_user.is_admin() or current_user.is_bauleiter():
+        mitarbeiter_id = None
+    else:
+        mitarbeiter_id = current_user.id
+
+    # Alle Zähler mit einer Abfrage (nach Aufmaß-Datum)
+    zaehler = DashboardStatistik.zaehler(mitarbeiter_id=mitarbeiter_id)
+
+    return {
+        'total_entries': zaehler['gesamt_aufmasse'],
+        'entries_this_month': zaehler['aufmasse_monat'],
+        'entries_today': zaehler['aufmasse_heute'],
+        'entries_this_week': zaehler['aufmasse_woche'],
+        'active_materials': zaehler['aktive_materialien'],
+        'recent_entries': zaehler['aufmasse_7_tage']
+    }
+
+
+@api_bp.route('/dashboard/stream')
+@login_required
+def dashboard_stream():
+    """Live-Updates der Dashboard-Kennzahlen als Server-Sent Events
+
+    Sendet zuerst den vollständigen Stand ("stats", wie /dashboard/stats),
+    danach nur Änderungen der Zähler ("delta") sowie "neu_laden", wenn der
+    Client /dashboard/stats erneut abrufen soll. Die Verbindung endet nach
+    DASHBOARD_SSE_MAX_DAUER Sekunden, EventSource verbindet sich selbst neu.
+    Ist der Stream abgeschaltet oder hält der Worker bereits
+    DASHBOARD_SSE_MAX_STREAMS Streams offen, antwortet der Endpunkt mit 204
+    und der Client fragt weiter /dashboard/stats ab. Jeder Stream belegt
+    einen gthread-Thread des Workers, ohne Obergrenze blieben für normale
+    Anfragen keine Threads übrig.
+    """
+    if not current_app.config.get('DASHBOARD_SSE_ENABLED', True):
+        return '', 204
+
+    # Vor dem Stand abonnieren, damit keine Änderung dazwischen verloren geht
+    broadcaster = dashboard_events.get_broadcaster()
+    abo = broadcaster.abonniere(max_abos=current_app.config.get('DASHBOARD_SSE_MAX_STREAMS', 2))
+    if abo is None:
+        return '', 204
+    try:
+        stats = dashboard_cache.hole('dashboard_stats', berechne_dashboard_stats)
+        mitarbeiter_id = None if current_user.is_admin() or current_user.is_bauleiter() else current_user.id
+    except Exception:
+        broadcaster.kuendige(abo)
+        raise
+
+    max_dauer = current_app.config.get('DASHBOARD_SSE_MAX_DAUER', 300)
+    heartbeat = current_app.config.get('DASHBOARD_SSE_HEARTBEAT', 15)
+    # Die Verbindung zur Datenbank nicht für die Dauer des Streams belegen
+    db.session.close()
+
+    def ereignisse():
+        ende = time.monotonic() + max_dauer
+        try:
+            yield 'retry: 5000\n\n'
+            yield dashboard_events.sse('stats', stats)
+            while True:
+                rest = ende - time.monotonic()
+                if rest <= 0:
+                    return
+                nachricht = abo.hole(timeout=min(heartbeat, rest))
+                if abo.ueberlauf:
+                    abo.leere()
+                    yield dashboard_events.sse('neu_laden', {})
+                elif nachricht is None:
+                    yield ': ping\n\n'
+                elif nachricht['art'] == 'aufmass':
+                    delta = dashboard_events.zaehler_delta(nachricht['deltas'], mitarbeiter_id=mitarbeiter_id)
+                    if delta:
+                        yield dashboard_events.sse('delta', delta)
+                else:
+                    yield dashboard_events.sse('neu_laden', {})
+        finally:
+            broadcaster.kuendige(abo)
+
+    return Response(stream_with_context(ereignisse()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+# Parameter von /stats/timeseries
+ZEITREIHE_METRIKEN = {'count': 'anzahl', 'quantity': 'menge'}
+ZEITREIHE_GRUPPIERUNGEN = {'none': None, 'material': 'material', 'user': 'mitarbeiter'}
+ZEITREIHE_INTERVALLE = {'day': 'tag', 'week': 'woche', 'month': 'monat'}
+
+
+@api_bp.route('/stats/timeseries')
+@login_required
+def stats_timeseries():
+    """Anzahl oder Menge der Aufmaße im Zeitverlauf für Diagramme
+
+    Query-Parameter: metric (count|quantity), group_by (none|material|user),
+    bucket (day|week|month), from/to (YYYY-MM-DD) und max_points. Liegen im
+    Zeitraum mehr Intervalle als max_points, antwortet der Endpunkt mit
+    gröberen Intervallen (bucket und step in der Antwort). Mitarbeiter sehen
+    nur ihre eigenen Aufmaße.
+    """
+    args = request.args
+    metrik = ZEITREIHE_METRIKEN.get(args.get('metric', 'count'))
+    gruppierung = ZEITREIHE_GRUPPIERUNGEN.get(args.get('group_by', 'none'), False)
+    intervall = ZEITREIHE_INTERVALLE.get(args.get('bucket', 'day'))
+    von = parse_tag(args.get('from'))
+    bis = parse_tag(args.get('to'))
+    grenze = current_app.config.get('ZEITREIHE_MAX_PUNKTE', 500)
+    max_punkte = min(args.get('max_points', grenze, type=int), grenze)
+
+    if metrik is None or gruppierung is False or intervall is None:
+        return jsonify({'success': False, 'error': 'Ungültige Parameter'}), 400
+    if (args.get('from') and von is None) or (args.get('to') and bis is None):
+        return jsonify({'success': False, 'error': 'Ungültiger Zeitraum'}), 400
+    if max_punkte < 1:
+        return jsonify({'success': False, 'error': 'max_points muss mindestens 1 sein'}), 400
+
+    # Ohne Enddatum bis heute, damit der Cache-Schlüssel mit dem Tag wechselt
+    bis = bis or zeitraum.heute()
+    if von and von > bis:
+        return jsonify({'success': False, 'error': 'Ungültiger Zeitraum'}), 400
+
+    # Mitarbeiter sehen nur ihre eigenen Einträge, Admins und Bauleiter alle
+    mitarbeiter_id = None if current_user.is_admin() or current_user.is_bauleiter() else current_user.id
+
+    def berechne():
+        daten = zeitreihe(metrik=metrik, gruppierung=gruppierung, intervall=intervall, von=von, bis=bis,
+                          mitarbeiter_id=mitarbeiter_id, max_punkte=max_punkte)
+        umkehr = {wert: name for name, wert in ZEITREIHE_INTERVALLE.items()}
+        return {
+            'metric': args.get('metric', 'count'),
+            'group_by': args.get('group_by', 'none'),
+            'bucket': umkehr[daten['intervall']],
+            'step': daten['schritt'],
+            'from': daten['von'].isoformat(),
+            'to': daten['bis'].isoformat(),
+            'buckets': [tag.isoformat() for tag in daten['zeitpunkte']],
+            'series': [
+                {'id': reihe['id'], 'name': reihe['name'], 'values': reihe['werte']}
+                for reihe in daten['reihen']
+            ],
+        }
+
+    try:
+        # Je Benutzer und Parametern gecacht, ungültig nach jedem Schreibvorgang
+        schluessel = 'timeseries:' + ':'.join(
+            str(teil) for teil in (metrik, gruppierung, intervall, von, bis, max_punkte)
+        )
+        return jsonify({'success': True, **dashboard_cache.hole(schluessel, berechne)})
+    except Exception as e:
+        logger.error(f"Error fetching timeseries: {e}")
+        return jsonify({'success': False, 'error': 'Fehler beim Laden der Zeitreihe'}), 500
+
+
 @api_bp.route('/search/suggestions')
 @login_required
 @cache.cached(timeout=3600)  # Cache for 1 hour
@@ -173,33 +298,12 @@ def user_activity():
     try:
         # Get activity for current user or all users (admin only)
         if current_user.is_admin() and request.args.get('all') == 'true':
-            # Admin can see all user activity
-            activity_data = db.session.query(
-                User.username,
-                func.count(AufmassEntry.id).label('entry_count'),
-                func.max(AufmassEntry.created_at).label('last_activity')
-            ).outerjoin(AufmassEntry).group_by(User.id).all()
-            
-            activity = [
-                {
-                    'username': row.username,
-                    'entry_count': row.entry_count,
-                    'last_activity': row.last_activity.isoformat() if row.last_activity else None
-                }
-                for row in activity_data
-            ]
+            activity = dashboard_cache.hole('user_activity_all', berechne_user_activity)
         else:
-            # Regular users see only their own activity
-            entry_count = AufmassEntry.query.filter_by(mitarbeiter_id=current_user.id).count()
-            last_entry = AufmassEntry.query.filter_by(mitarbeiter_id=current_user.id)\
-                .order_by(AufmassEntry.created_at.desc()).first()
-            
-            activity = [{
-                'username': current_user.username,
-                'entry_count': entry_count,
-                'last_activity': last_entry.created_at.isoformat() if last_entry else None
-            }]
-        
+            activity = dashboard_cache.hole(
+                'user_activity', lambda: berechne_user_activity(mitarbeiter_id=current_user.id)
+            )
+
         return jsonify({'success': True, 'activity': activity})
         
     except Exception as e:
@@ -207,6 +311,18 @@ def user_activity():
         return jsonify({'success': False, 'error': 'Fehler beim Laden der Benutzeraktivität'}), 500
 
 
+def berechne_user_activity(mitarbeiter_id=None):
+    """Anzahl Aufmaße und letzter Aufmaß-Tag je Benutzer aus der Tagesstatistik"""
+    return [
+        {
+            'username': row.username,
+            'entry_count': row.entry_count,
+            'last_activity': row.last_activity.isoformat() if row.last_activity else None
+        }
+        for row in AufmassTagesstatistik.aktivitaet(mitarbeiter_id=mitarbeiter_id)
+    ]
+
+
 @api_bp.route('/materials/search')
 @login_required
 @cache.cached(timeout=300)
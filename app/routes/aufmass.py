@@ -10,9 +10,13 @@ from app import db
 from app.models.aufmass import AufmassEntry, AufmassDocument  # Add AufmassDocument import
 from app.models.material import Material
 from app.models.bautagebuch import BautagebuchEntry
+from app.models.duplikat import DuplikatKandidat
+from app.routes.duplikate import DuplikatsPruefer
 from app.forms.aufmass_forms import AufmassForm, SearchFilterForm  # Fixed import path
 from app.utils.decorators import role_required  # Fixed import path
 from app.utils.file_utils import allowed_file  # Fixed import path
+from app.utils.duplikat_index import get_live_index
+from app.utils.zeitraum import filter_zeitraum, parse_tag, zeitraum_bedingungen
 
 aufmass_bp = Blueprint('aufmass', __name__, url_prefix='/aufmass')
 
@@ -33,10 +37,7 @@ def eingabe():
             # Duplikatsprüfung
             similar_entries = AufmassEntry.query.filter(
                 and_(
-                    AufmassEntry.datum.between(
-                        datetime.combine(datum, datetime.min.time()),
-                        datetime.combine(datum, datetime.max.time())
-                    ),
+                    *zeitraum_bedingungen(AufmassEntry.tag, datum, datum),
                     AufmassEntry.material_id == material_id,
                     AufmassEntry.ort.ilike(f"%{ort}%")
                 )
@@ -81,15 +82,11 @@ def eingabe():
                         )
                         db.session.add(document)
 
-            # Bautagebuch-Eintrag automatisch erzeugen
-            eintrag = BautagebuchEntry(
-                datum=datum.date(),
-                text=aufmass.to_bautagebuch_text(),
-                aufmass_entry_id=aufmass.id,
-                kalenderwoche=datum.isocalendar()[1],
-                jahr=datum.year
-            )
-            db.session.add(eintrag)
+            # Den Bautagebuch-Eintrag legt der after_insert-Listener des Aufmaßes an
+            # (siehe app/models/bautagebuch.py)
+
+            # Neuen Eintrag mit seinen Nachbarn vergleichen
+            DuplikatsPruefer.pruefe_eintrag(aufmass)
             db.session.commit()
 
             flash('Aufmaß erfolgreich gespeichert und Bautagebuch-Eintrag erstellt!', 'success')
@@ -125,14 +122,11 @@ def liste():
     if request.args.get('material_filter') and request.args.get('material_filter').isdigit():
         query = query.filter(AufmassEntry.material_id == int(request.args.get('material_filter')))
 
-    if request.args.get('datum_von'):
-        datum_von = datetime.strptime(request.args.get('datum_von'), '%Y-%m-%d')
-        query = query.filter(AufmassEntry.datum >= datum_von)
-
-    if request.args.get('datum_bis'):
-        datum_bis = datetime.strptime(request.args.get('datum_bis'), '%Y-%m-%d')
-        datum_bis = datum_bis.replace(hour=23, minute=59, second=59)
-        query = query.filter(AufmassEntry.datum <= datum_bis)
+    query = filter_zeitraum(
+        query, AufmassEntry.tag,
+        parse_tag(request.args.get('datum_von')),
+        parse_tag(request.args.get('datum_bis'))
+    )
 
     sort = request.args.get('sort', 'datum_desc')
     if sort == 'datum_asc':
@@ -172,9 +166,11 @@ def bearbeiten(id):
             if eintrag:
                 eintrag.text = aufmass.to_bautagebuch_text()
                 eintrag.datum = aufmass.datum.date()
-                eintrag.kalenderwoche = aufmass.datum.isocalendar()[1]
-                eintrag.jahr = aufmass.datum.year
+                eintrag.kalenderwoche = aufmass.kalenderwoche
+                eintrag.jahr = aufmass.jahr
 
+            # Geänderten Eintrag erneut mit seinen Nachbarn vergleichen
+            DuplikatsPruefer.pruefe_eintrag(aufmass)
             db.session.commit()
             flash('Aufmaß erfolgreich aktualisiert!', 'success')
             return redirect(url_for('aufmass.details', id=id))
@@ -202,6 +198,7 @@ def loeschen(id):
                 os.remove(path)
             db.session.delete(doc)
 
+        DuplikatKandidat.entferne_fuer_eintrag(id)
         db.session.delete(aufmass)
         db.session.commit()
         flash('Aufmaß erfolgreich gelöscht!', 'success')
@@ -227,16 +224,9 @@ def api_material_details(material_id):
 def api_check_duplicate():
     data = request.get_json()
     datum = datetime.strptime(data['datum'], '%Y-%m-%d').date()
-    similar_entries = AufmassEntry.query.filter(
-        and_(
-            AufmassEntry.datum.between(
-                datetime.combine(datum, datetime.min.time()),
-                datetime.combine(datum, datetime.max.time())
-            ),
-            AufmassEntry.material_id == data['material_id'],
-            AufmassEntry.ort.ilike(f"%{data['ort']}%")
-        )
-    ).all()
+
+    # Prüfung gegen den Live-Index statt ilike-Abfrage
+    similar_entries = get_live_index().suche(int(data['material_id']), datum, data['ort'])
 
     if similar_entries:
         return jsonify({
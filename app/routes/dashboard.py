@@ -1,14 +1,17 @@
 """
 Dashboard-Routen für verschiedene Benutzerrollen
 """
+import click
 from flask import Blueprint, render_template, redirect, url_for
 from flask_login import login_required, current_user
-from datetime import datetime, timedelta, timezone
-from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from app import db
 from app.models.user import User
 from app.models.aufmass import AufmassEntry
-from app.models.material import Material
+from app.models.statistik import AufmassTagesstatistik
+from app.utils.dashboard_statistik import DashboardStatistik
+from app.utils import dashboard_cache
+from app.utils.fragment_cache import Verzoegert
 
 bp = Blueprint('dashboard', __name__)
 
@@ -32,27 +35,19 @@ def mitarbeiter():
         return redirect(url_for('dashboard.index'))
     
     # Statistiken für den aktuellen Benutzer
-    heute = datetime.now(timezone.utc).date()
-    diese_woche = heute - timedelta(days=heute.weekday())
+    zaehler = DashboardStatistik.zaehler(mitarbeiter_id=current_user.id)
     
-    aufmasse_heute = AufmassEntry.query.filter(
-        AufmassEntry.mitarbeiter_id == current_user.id,
-        func.date(AufmassEntry.datum) == heute
-    ).count()
-    
-    aufmasse_woche = AufmassEntry.query.filter(
-        AufmassEntry.mitarbeiter_id == current_user.id,
-        func.date(AufmassEntry.datum) >= diese_woche
-    ).count()
-    
-    # Letzte Einträge
-    letzte_aufmasse = AufmassEntry.query.filter_by(
-        mitarbeiter_id=current_user.id
-    ).order_by(AufmassEntry.created_at.desc()).limit(5).all()
+    # Letzte Einträge (erst beim Rendern, entfällt bei gecachtem Fragment)
+    mitarbeiter_id = current_user.id
+    letzte_aufmasse = Verzoegert(lambda: AufmassEntry.query.options(
+        joinedload(AufmassEntry.material)
+    ).filter_by(
+        mitarbeiter_id=mitarbeiter_id
+    ).order_by(AufmassEntry.created_at.desc()).limit(5).all())
     
     stats = {
-        'aufmasse_heute': aufmasse_heute,
-        'aufmasse_woche': aufmasse_woche,
+        'aufmasse_heute': zaehler['aufmasse_heute'],
+        'aufmasse_woche': zaehler['aufmasse_woche'],
         'letzte_aufmasse': letzte_aufmasse
     }
     
@@ -67,51 +62,25 @@ def bauleiter():
     if not current_user.is_bauleiter():
         return redirect(url_for('dashboard.index'))
     
-    # Umfassende Statistiken
-    heute = datetime.now(timezone.utc).date()
-    diese_woche = heute - timedelta(days=heute.weekday())
-    dieser_monat = heute.replace(day=1)
-    
-    # Gesamtstatistiken
-    gesamt_aufmasse = AufmassEntry.query.count()
-    aufmasse_heute = AufmassEntry.query.filter(
-        func.date(AufmassEntry.datum) == heute
-    ).count()
-    aufmasse_woche = AufmassEntry.query.filter(
-        func.date(AufmassEntry.datum) >= diese_woche
-    ).count()
-    aufmasse_monat = AufmassEntry.query.filter(
-        func.date(AufmassEntry.datum) >= dieser_monat
-    ).count()
-    
-    # Mitarbeiter-Aktivität
-    aktive_mitarbeiter = db.session.query(
-        User.username, 
-        func.count(AufmassEntry.id).label('anzahl')
-    ).join(AufmassEntry).filter(
-        func.date(AufmassEntry.datum) >= diese_woche
-    ).group_by(User.id).order_by(func.count(AufmassEntry.id).desc()).limit(5).all()
-    
-    # Häufigste Materialien
-    top_materialien = db.session.query(
-        Material.name,
-        func.sum(AufmassEntry.menge).label('gesamt_menge')
-    ).join(AufmassEntry).filter(
-        func.date(AufmassEntry.datum) >= diese_woche
-    ).group_by(Material.id).order_by(func.sum(AufmassEntry.menge).desc()).limit(5).all()
+    # Zähler mit einer Abfrage; Top-Listen der Woche und letzte Aktivitäten
+    # erst beim Rendern, sie entfallen bei gecachten Fragmenten
+    zaehler = DashboardStatistik.zaehler()
+    top_listen = Verzoegert(lambda: DashboardStatistik.top_listen(von=DashboardStatistik.zeitraeume()['woche']))
     
-    # Letzte Aktivitäten
-    letzte_aufmasse = AufmassEntry.query.order_by(
+    letzte_aufmasse = Verzoegert(lambda: AufmassEntry.query.options(
+        joinedload(AufmassEntry.material),
+        joinedload(AufmassEntry.mitarbeiter)
+    ).order_by(
         AufmassEntry.created_at.desc()
-    ).limit(10).all()
+    ).limit(10).all())
     
     stats = {
-        'gesamt_aufmasse': gesamt_aufmasse,
-        'aufmasse_heute': aufmasse_heute,
-        'aufmasse_woche': aufmasse_woche,
-        'aufmasse_monat': aufmasse_monat,
-        'aktive_mitarbeiter': aktive_mitarbeiter,
-        'top_materialien': top_materialien,
+        'gesamt_aufmasse': zaehler['gesamt_aufmasse'],
+        'aufmasse_heute': zaehler['aufmasse_heute'],
+        'aufmasse_woche': zaehler['aufmasse_woche'],
+        'aufmasse_monat': zaehler['aufmasse_monat'],
+        'aktive_mitarbeiter': Verzoegert(lambda: top_listen['aktive_mitarbeiter']),
+        'top_materialien': Verzoegert(lambda: top_listen['top_materialien']),
         'letzte_aufmasse': letzte_aufmasse
     }
     
@@ -126,45 +95,34 @@ def admin():
     if not current_user.is_admin():
         return redirect(url_for('dashboard.index'))
     
-    # System-Statistiken
-    gesamt_benutzer = User.query.count()
-    aktive_benutzer = User.query.filter_by(is_active=True).count()
-    gesamt_materialien = Material.query.count()
-    gesamt_aufmasse = AufmassEntry.query.count()
+    # System-Statistiken, Rollen und verdächtige Duplikate; ältere Werte
+    # werden sofort geliefert und im Hintergrund aktualisiert
+    zaehler = dashboard_cache.hole_mit_hintergrund('system_kennzahlen', DashboardStatistik.system_kennzahlen)
     
-    # Benutzer nach Rollen
-    rollen_stats = db.session.query(
-        User.role, 
-        func.count(User.id).label('anzahl')
-    ).group_by(User.role).all()
-    
-    # Verdächtige Duplikate (vereinfacht)
-    verdaechtige_duplikate = db.session.query(
-        AufmassEntry.datum,
-        AufmassEntry.ort,
-        AufmassEntry.material_id,
-        func.count(AufmassEntry.id).label('anzahl')
-    ).group_by(
-        AufmassEntry.datum, 
-        AufmassEntry.ort, 
-        AufmassEntry.material_id
-    ).having(func.count(AufmassEntry.id) > 1).count()
-    
-    # Letzte Benutzeraktivitäten
-    letzte_logins = User.query.filter(
+    # Letzte Benutzeraktivitäten (erst beim Rendern, entfällt bei gecachtem Fragment)
+    letzte_logins = Verzoegert(lambda: User.query.filter(
         User.last_login.isnot(None)
-    ).order_by(User.last_login.desc()).limit(5).all()
+    ).order_by(User.last_login.desc()).limit(5).all())
     
     stats = {
-        'gesamt_benutzer': gesamt_benutzer,
-        'aktive_benutzer': aktive_benutzer,
-        'gesamt_materialien': gesamt_materialien,
-        'gesamt_aufmasse': gesamt_aufmasse,
-        'rollen_stats': rollen_stats,
-        'verdaechtige_duplikate': verdaechtige_duplikate,
+        'gesamt_benutzer': zaehler['gesamt_benutzer'],
+        'aktive_benutzer': zaehler['aktive_benutzer'],
+        'gesamt_materialien': zaehler['gesamt_materialien'],
+        'gesamt_aufmasse': zaehler['gesamt_aufmasse'],
+        'rollen_stats': zaehler['rollen'],
+        'verdaechtige_duplikate': zaehler['verdaechtige_duplikate'],
         'letzte_logins': letzte_logins
     }
     
     return render_template('dashboard/admin.html', 
                          title='Admin Dashboard', 
                          stats=stats)
+
+
+@bp.cli.command('statistik-aufbauen')
+def statistik_aufbauen():
+    """Baut die Tagesstatistik (aufmass_daily_rollup) aus allen Aufmaßen neu auf"""
+    anzahl = AufmassTagesstatistik.baue_neu()
+    db.session.commit()
+    dashboard_cache.erhoehe_generation()
+    click.echo(f"{anzahl} Tageszeilen in aufmass_daily_rollup gespeichert")
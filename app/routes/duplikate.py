@@ -1,43 +1,698 @@
 # routes/duplikate.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+import click
+import csv
+import json
+import logging
+import threading
+import time
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
-from app import db
+from app import db, cache
 from app.models.aufmass import AufmassEntry
 from app.models.bautagebuch import BautagebuchEntry
 from app.models.user import User
 from app.models.material import Material
+from app.models.duplikat import DuplikatKandidat, DuplikatAusnahme
+from app.utils import geteilter_cache
+from app.utils.duplikat_index import get_live_index
+from app.utils.zeitraum import zeitraum_bedingungen
+from app.utils.aehnlichkeit import AufmassSpalten, AufmassZeile, DisjunkteMengen, lade_aufmass_zeilen, packe_paare
 from datetime import datetime, timedelta, timezone
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func, select, union, literal
+from sqlalchemy.orm import joinedload
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, repeat
+import numpy as np
 
 duplikate_bp = Blueprint('duplikate', __name__)
 
+# Zeitfenster für die Kandidatenerzeugung (siehe DuplikatsPruefer._erzeuge_kandidaten)
+FENSTER_GLEICHER_TAG = timedelta(days=1)
+FENSTER_NACHBARTAG = timedelta(days=2)
+FENSTER_WOCHE = timedelta(days=8)
+
+# Ab dieser Anzahl ungeprüfter Einträge wird die Kandidaten-Tabelle komplett neu aufgebaut
+VOLLSCAN_SCHWELLE = 500
+
+# Ab so vielen Einträgen lädt entferne_ausnahmen alle Ausnahmen statt einer IN-Liste
+AUSNAHMEN_IN_LISTE_MAX = 1000
+
+# Zeilen je Abschnitt im parallelen Scan (ohne Überlappung)
+SHARD_GROESSE = 20000
+
+# Cache-Schlüssel für den vorberechneten Duplikat-Bericht
+BERICHT_CACHE_KEY = 'duplikate:bericht'
+BERICHT_LAUF_KEY = 'duplikate:bericht:laeuft'
+
+# Nach dieser Zeit (Sekunden) gilt eine nicht freigegebene Berechnungssperre als verwaist
+BERICHT_SPERRE_TIMEOUT = 3600
+
+logger = logging.getLogger(__name__)
+
 class DuplikatsPruefer:
     """Klasse für die Duplikatserkennung"""
     
     @staticmethod
     def finde_duplikate():
-        """Findet potentielle Duplikate basierend auf verschiedenen Kriterien"""
+        """Findet potentielle Duplikate basierend auf verschiedenen Kriterien
         
-        duplikate = []
+        Jede Gruppe ist eine Zusammenhangskomponente der ähnlichen Paare, ein
+        Eintrag erscheint also in höchstens einer Gruppe. Die Gruppen enthalten
+        Aufmaß-IDs; für die Anzeige werden sie mit materialisiere_gruppen durch
+        ORM-Objekte ersetzt.
+        """
+        
+        # Alle Aufmaße als schlanke Projektion laden (eine Abfrage, keine Beziehungen)
+        aufmaesse = lade_aufmass_zeilen()
+        
+        paare = DuplikatsPruefer.finde_paare(aufmaesse)
+        schluessel = {a.id: DuplikatsPruefer._sortierschluessel(a) for a in aufmaesse}
+        
+        return DuplikatsPruefer._bilde_gruppen(paare, schluessel)
+    
+    @staticmethod
+    def finde_paare(aufmaesse):
+        """Bewertet alle Kandidatenpaare und liefert die Paare über dem Schwellenwert
         
-        # Alle Aufmaße laden
-        aufmaesse = AufmassEntry.query.order_by(AufmassEntry.datum.desc()).all()
+        Erwartet die Aufmaße wie von lade_aufmass_zeilen sortiert. Jedes Paar
+        ist ein Dict mit a (Haupteintrag), b, aehnlichkeit, risiko und kriterien.
+        Als "kein Duplikat" bestätigte Paare werden vor der Bewertung verworfen.
+        """
+        # Nur Paare bewerten, die sich einen Blocking-Schlüssel teilen
+        kandidaten = DuplikatsPruefer._erzeuge_kandidaten(aufmaesse)
         
+        # Alle Kandidatenpaare in einem Durchlauf bewerten
+        idx_a, idx_b = DuplikatsPruefer._kandidaten_arrays(kandidaten)
+        return DuplikatsPruefer._bewerte_kandidaten(
+            aufmaesse, idx_a, idx_b, DuplikatsPruefer._lade_ausnahmen()
+        )
+    
+    @staticmethod
+    def finde_paare_parallel(aufmaesse, workers=None, shard_groesse=SHARD_GROESSE):
+        """Wie finde_paare, jedoch auf mehrere Prozesse verteilt
+        
+        Die Aufmaße werden nach Material aufgeteilt. Verwandte Materialien
+        (gleicher oder enthaltener Name) landen im selben Shard, da sie
+        miteinander verglichen werden. Große Shards werden zusätzlich nach
+        Datum in Abschnitte zerlegt, jeder Abschnitt enthält die Einträge
+        der folgenden 7 Tage als Überlappung. Paare über Shard-Grenzen hinweg
+        werden gesondert bewertet:
+        
+        - identische Einträge mehr als 7 Tage auseinander (Fernpaare)
+        - Materialien ohne Bezug am selben Tag, gleicher Ort und Mitarbeiter
+        
+        Das Ergebnis entspricht finde_paare, inklusive Reihenfolge.
+        """
+        aufgaben = DuplikatsPruefer._bilde_shards(aufmaesse, shard_groesse)
+        ausnahmen = DuplikatsPruefer._lade_ausnahmen()
+        
+        if workers == 1:
+            ergebnisse = [DuplikatsPruefer._bewerte_shards(aufgabe, ausnahmen) for aufgabe in aufgaben]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                ergebnisse = list(executor.map(
+                    DuplikatsPruefer._bewerte_shards, aufgaben, repeat(ausnahmen, len(aufgaben))
+                ))
+        
+        position = {aufmass.id: i for i, aufmass in enumerate(aufmaesse)}
+        paare = [paar for ergebnis in ergebnisse for paar in ergebnis]
+        paare.sort(key=lambda p: (position[p['a']], position[p['b']]))
+        return paare
+    
+    @staticmethod
+    def _bilde_shards(aufmaesse, shard_groesse):
+        """Teilt die (nach Datum absteigend sortierten) Aufmaße in Aufgaben auf
+        
+        Jede Aufgabe ist eine Liste von Teilaufgaben, gebündelt auf etwa
+        shard_groesse Zeilen, damit kleine Materialien nicht je einen
+        eigenen Prozessaufruf kosten.
+        """
+        # Verwandte Materialnamen zu Komponenten zusammenfassen
+        mengen = DisjunkteMengen()
+        namen = sorted({a.material.lower() for a in aufmaesse})
+        for name in namen:
+            mengen.finde(name)
+        for a, b in combinations(namen, 2):
+            if a in b or b in a:
+                mengen.vereinige(a, b)
+        komponente = [mengen.finde(a.material.lower()) for a in aufmaesse]
+        
+        nach_komponente = defaultdict(list)
+        exakt = defaultdict(list)
+        ort_mitarbeiter = defaultdict(list)
         for i, aufmass in enumerate(aufmaesse):
-            # Suche nach ähnlichen Einträgen
-            aehnliche = DuplikatsPruefer._finde_aehnliche_eintraege(aufmass, aufmaesse[i+1:])
+            nach_komponente[komponente[i]].append(aufmass)
+            exakt[(aufmass.material.lower(), aufmass.ort.lower(), aufmass.mitarbeiter.lower(), aufmass.menge)].append(i)
+            ort_mitarbeiter[(aufmass.ort.lower(), aufmass.mitarbeiter.lower())].append(i)
+        
+        teilaufgaben = []
+        
+        # Abschnitte je Komponente: Kern plus 7 Tage ältere Einträge als Überlappung
+        for zeilen in nach_komponente.values():
+            for start in range(0, len(zeilen), shard_groesse):
+                ende = min(start + shard_groesse, len(zeilen))
+                grenze = zeilen[ende - 1].datum - FENSTER_WOCHE
+                ueberlappung = ende
+                while ueberlappung < len(zeilen) and zeilen[ueberlappung].datum > grenze:
+                    ueberlappung += 1
+                teilaufgaben.append(('abschnitt', zeilen[start:ueberlappung], ende - start))
+        
+        # Identische Einträge, die mehr als 7 Tage auseinanderliegen
+        fern = [
+            indizes for indizes in exakt.values()
+            if len(indizes) > 1 and aufmaesse[indizes[0]].datum - aufmaesse[indizes[-1]].datum >= FENSTER_WOCHE
+        ]
+        for indizes in DuplikatsPruefer._buendle_buckets(fern, shard_groesse):
+            teilaufgaben.append(('fern', [aufmaesse[i] for i in indizes], None))
+        
+        # Gleicher Ort und Mitarbeiter in verschiedenen Komponenten
+        kanten = [
+            indizes for indizes in ort_mitarbeiter.values()
+            if len({komponente[i] for i in indizes}) > 1
+        ]
+        for indizes in DuplikatsPruefer._buendle_buckets(kanten, shard_groesse):
+            teilaufgaben.append(('kanten', [aufmaesse[i] for i in indizes], [komponente[i] for i in indizes]))
+        
+        # Größte Teilaufgaben zuerst, kleine bis zur Shard-Größe bündeln
+        teilaufgaben.sort(key=lambda t: len(t[1]), reverse=True)
+        aufgaben = []
+        zeilen_in_aufgabe = 0
+        for teilaufgabe in teilaufgaben:
+            if not aufgaben or zeilen_in_aufgabe + len(teilaufgabe[1]) > shard_groesse:
+                aufgaben.append([])
+                zeilen_in_aufgabe = 0
+            aufgaben[-1].append(teilaufgabe)
+            zeilen_in_aufgabe += len(teilaufgabe[1])
+        
+        return aufgaben
+    
+    @staticmethod
+    def _buendle_buckets(buckets, shard_groesse):
+        """Fasst Buckets zu Index-Listen von etwa shard_groesse zusammen.
+        
+        Ein Bucket wird nie geteilt, die Indizes bleiben aufsteigend sortiert.
+        """
+        buendel = []
+        aktuell = []
+        for indizes in buckets:
+            if aktuell and len(aktuell) + len(indizes) > shard_groesse:
+                buendel.append(sorted(aktuell))
+                aktuell = []
+            aktuell.extend(indizes)
+        if aktuell:
+            buendel.append(sorted(aktuell))
+        return buendel
+    
+    @staticmethod
+    def _bewerte_shards(aufgabe, ausnahmen=None):
+        """Bewertet die Teilaufgaben einer Aufgabe (läuft im Worker-Prozess)"""
+        paare = []
+        for art, zeilen, zusatz in aufgabe:
+            daten = [z.datum for z in zeilen]
+            kandidaten = defaultdict(set)
             
-            if aehnliche:
-                duplikat_gruppe = {
-                    'haupteintrag': aufmass,
-                    'aehnliche': aehnliche,
-                    'kriterien': DuplikatsPruefer._bewerte_aehnlichkeit(aufmass, aehnliche),
-                    'risiko': DuplikatsPruefer._bewerte_risiko(aufmass, aehnliche)
-                }
-                duplikate.append(duplikat_gruppe)
+            if art == 'abschnitt':
+                # Nur Paare mit Haupteintrag im Kern, Fernpaare kommen aus 'fern'
+                for i, partner in DuplikatsPruefer._erzeuge_kandidaten(zeilen).items():
+                    if i < zusatz:
+                        kandidaten[i] = {j for j in partner if daten[i] - daten[j] < FENSTER_WOCHE}
+            
+            elif art == 'fern':
+                exakt = defaultdict(list)
+                for i, z in enumerate(zeilen):
+                    exakt[(z.material.lower(), z.ort.lower(), z.mitarbeiter.lower(), z.menge)].append(i)
+                for indizes in exakt.values():
+                    for i, j in combinations(indizes, 2):
+                        if daten[i] - daten[j] >= FENSTER_WOCHE:
+                            kandidaten[i].add(j)
+            
+            elif art == 'kanten':
+                ort_mitarbeiter = defaultdict(list)
+                for i, z in enumerate(zeilen):
+                    ort_mitarbeiter[(z.ort.lower(), z.mitarbeiter.lower())].append(i)
+                for indizes in ort_mitarbeiter.values():
+                    DuplikatsPruefer._fenster_paare(
+                        indizes, daten, FENSTER_GLEICHER_TAG, kandidaten,
+                        lambda i, j: zusatz[i] != zusatz[j]
+                    )
+            
+            idx_a, idx_b = DuplikatsPruefer._kandidaten_arrays(kandidaten)
+            paare.extend(DuplikatsPruefer._bewerte_kandidaten(zeilen, idx_a, idx_b, ausnahmen))
+        
+        return paare
+    
+    @staticmethod
+    def _bewerte_kandidaten(aufmaesse, idx_a, idx_b, ausnahmen=None):
+        """Bewertet die Kandidatenpaare (idx_a[k], idx_b[k]) und filtert nach Schwellenwert
+        
+        ausnahmen ist ein sortiertes Array gepackter Paare (siehe _lade_ausnahmen),
+        die ohne Bewertung verworfen werden.
+        """
+        spalten = AufmassSpalten.aus_zeilen(aufmaesse)
+        
+        if ausnahmen is not None and len(ausnahmen) and len(idx_a):
+            behalten = ~np.isin(packe_paare(spalten.ids[idx_a], spalten.ids[idx_b]), ausnahmen)
+            idx_a, idx_b = idx_a[behalten], idx_b[behalten]
+        
+        if len(idx_a) == 0:
+            return []
+        
+        scores = spalten.berechne_scores(idx_a, idx_b)
+        treffer = scores >= 0.7
+        
+        return [
+            DuplikatsPruefer._bewerte_paar(aufmaesse[i], aufmaesse[j], float(score))
+            for i, j, score in zip(idx_a[treffer], idx_b[treffer], scores[treffer])
+        ]
+    
+    @staticmethod
+    def lade_duplikate():
+        """Baut die Duplikat-Gruppen aus der Tabelle duplicate_candidates auf
+        
+        Liest nur. Ungeprüfte Einträge zieht der Hintergrund-Lauf des
+        Berichts (DuplikatBericht.erstelle) oder `flask duplikate
+        offene-pruefen` nach.
+        """
+        return DuplikatsPruefer.materialisiere_gruppen(DuplikatsPruefer.lade_gruppen())
+    
+    @staticmethod
+    def lade_gruppen():
+        """Bildet die Duplikat-Gruppen (mit Aufmaß-IDs) aus duplicate_candidates"""
+        paare = [
+            {
+                'a': kandidat.entry_a_id,
+                'b': kandidat.entry_b_id,
+                'aehnlichkeit': kandidat.score,
+                'risiko': kandidat.risiko,
+                'kriterien': kandidat.get_kriterien()
+            }
+            for kandidat in DuplikatKandidat.query.all()
+        ]
+        if not paare:
+            return []
+        
+        # Sortierschlüssel der beteiligten Einträge ohne ORM-Objekte laden
+        beteiligte = union(
+            select(DuplikatKandidat.entry_a_id),
+            select(DuplikatKandidat.entry_b_id)
+        )
+        schluessel = {
+            aufmass_id: (datum, aufmass_id)
+            for aufmass_id, datum in db.session.query(AufmassEntry.id, AufmassEntry.datum).filter(
+                AufmassEntry.id.in_(beteiligte)
+            )
+        }
+        
+        return DuplikatsPruefer._bilde_gruppen(paare, schluessel)
+    
+    @staticmethod
+    def _bilde_gruppen(paare, schluessel):
+        """Fasst Paare per Union-Find zu einer Gruppe je Zusammenhangskomponente zusammen
+        
+        Repräsentant (haupteintrag) ist der neueste Eintrag der Gruppe. Für die
+        übrigen Einträge wird der Wert zum Repräsentanten angezeigt, fehlt
+        dieses Paar, der höchste Wert zu einem anderen Gruppenmitglied. Das
+        Risiko ist das höchste, die Kriterien die Vereinigung aller Paare.
+        """
+        mengen = DisjunkteMengen()
+        for paar in paare:
+            mengen.vereinige(paar['a'], paar['b'])
+        
+        komponenten = defaultdict(list)
+        for paar in paare:
+            komponenten[mengen.finde(paar['a'])].append(paar)
+        
+        duplikate = []
+        for gruppen_paare in komponenten.values():
+            mitglieder = {p['a'] for p in gruppen_paare} | {p['b'] for p in gruppen_paare}
+            repraesentant = max(mitglieder, key=schluessel.__getitem__)
+            
+            direkt = {}
+            bester = defaultdict(float)
+            kriterien = {}
+            for paar in gruppen_paare:
+                if paar['a'] == repraesentant:
+                    direkt[paar['b']] = paar['aehnlichkeit']
+                for mitglied in (paar['a'], paar['b']):
+                    bester[mitglied] = max(bester[mitglied], paar['aehnlichkeit'])
+                for name, wert in paar['kriterien'].items():
+                    kriterien[name] = kriterien.get(name, False) or wert
+            
+            aehnliche = [
+                {'aufmass': mitglied, 'aehnlichkeit': direkt.get(mitglied, bester[mitglied])}
+                for mitglied in sorted(mitglieder - {repraesentant}, key=schluessel.__getitem__, reverse=True)
+            ]
+            
+            duplikate.append({
+                'haupteintrag': repraesentant,
+                'aehnliche': aehnliche,
+                'paare': sorted(gruppen_paare, key=lambda p: (schluessel[p['a']], schluessel[p['b']]), reverse=True),
+                'kriterien': kriterien,
+                'risiko': max(paar['risiko'] for paar in gruppen_paare)
+            })
         
+        duplikate.sort(key=lambda d: schluessel[d['haupteintrag']], reverse=True)
         return duplikate
     
+    @staticmethod
+    def entferne_ausnahmen(duplikate):
+        """Entfernt als "kein Duplikat" bestätigte Paare aus den Gruppen.
+        
+        Für Berichte, die vor der Bestätigung berechnet wurden. Betroffene
+        Gruppen werden aus den verbleibenden Paaren neu gebildet und können
+        dabei zerfallen; Gruppen ohne verbleibende Paare entfallen.
+        """
+        ids = {p['a'] for g in duplikate for p in g['paare']} | {p['b'] for g in duplikate for p in g['paare']}
+        if not ids:
+            return duplikate
+        
+        if len(ids) > AUSNAHMEN_IN_LISTE_MAX:
+            # Ganzer Bericht: alle Ausnahmen statt einer sehr langen IN-Liste
+            ausnahmen = DuplikatAusnahme.lade_gepackt()
+        else:
+            ausnahmen = {
+                DuplikatAusnahme.packe(a, b)
+                for a, b in db.session.query(DuplikatAusnahme.entry_a_id, DuplikatAusnahme.entry_b_id).filter(
+                    DuplikatAusnahme.entry_a_id.in_(ids),
+                    DuplikatAusnahme.entry_b_id.in_(ids)
+                )
+            }
+        if not ausnahmen:
+            return duplikate
+        
+        ergebnis = []
+        for gruppe in duplikate:
+            paare = [p for p in gruppe['paare'] if DuplikatAusnahme.packe(p['a'], p['b']) not in ausnahmen]
+            if len(paare) == len(gruppe['paare']):
+                ergebnis.append(gruppe)
+            elif paare:
+                mitglieder = {p['a'] for p in paare} | {p['b'] for p in paare}
+                schluessel = {
+                    aufmass_id: (datum, aufmass_id)
+                    for aufmass_id, datum in db.session.query(AufmassEntry.id, AufmassEntry.datum).filter(
+                        AufmassEntry.id.in_(mitglieder)
+                    )
+                }
+                ergebnis.extend(DuplikatsPruefer._bilde_gruppen(
+                    [p for p in paare if p['a'] in schluessel and p['b'] in schluessel], schluessel
+                ))
+        
+        return ergebnis
+    
+    @staticmethod
+    def materialisiere_gruppen(duplikate):
+        """Ersetzt die Aufmaß-IDs in den Gruppen durch AufmassEntry-Objekte.
+        
+        Lädt nur die Einträge der übergebenen Gruppen, inklusive Material
+        und Mitarbeiter, mit einer Abfrage. Inzwischen gelöschte Einträge
+        (z.B. aus einem älteren Bericht) werden ausgelassen.
+        """
+        ids = set()
+        for gruppe in duplikate:
+            ids.add(gruppe['haupteintrag'])
+            ids.update(a['aufmass'] for a in gruppe['aehnliche'])
+        
+        if not ids:
+            return duplikate
+        
+        eintraege = {
+            aufmass.id: aufmass
+            for aufmass in AufmassEntry.query.options(
+                joinedload(AufmassEntry.material),
+                joinedload(AufmassEntry.mitarbeiter)
+            ).filter(AufmassEntry.id.in_(ids))
+        }
+        
+        materialisiert = []
+        for gruppe in duplikate:
+            aehnliche = [
+                dict(aehnlich, aufmass=eintraege[aehnlich['aufmass']])
+                for aehnlich in gruppe['aehnliche']
+                if aehnlich['aufmass'] in eintraege
+            ]
+            if gruppe['haupteintrag'] not in eintraege or not aehnliche:
+                continue
+            materialisiert.append(dict(gruppe, haupteintrag=eintraege[gruppe['haupteintrag']], aehnliche=aehnliche))
+        
+        return materialisiert
+    
+    @staticmethod
+    def pruefe_eintrag(aufmass):
+        """Vergleicht ein neues oder geändertes Aufmaß mit seinen Nachbarn.
+        
+        Aktualisiert die Paare in duplicate_candidates und setzt
+        is_duplicate_checked. Der Commit erfolgt durch den Aufrufer.
+        """
+        db.session.flush()
+        db.session.expire(aufmass, ['material', 'mitarbeiter'])
+        zeile = AufmassZeile.aus_eintrag(aufmass)
+        
+        DuplikatKandidat.entferne_fuer_eintrag(aufmass.id)
+        ausnahmen = DuplikatAusnahme.partner_von(aufmass.id)
+        
+        gefunden = []
+        for nachbar in DuplikatsPruefer._finde_nachbarn(aufmass, zeile):
+            if nachbar.id in ausnahmen:
+                continue
+            
+            # Reihenfolge wie in finde_duplikate: neuerer Eintrag ist Haupteintrag
+            if DuplikatsPruefer._sortierschluessel(nachbar) > DuplikatsPruefer._sortierschluessel(zeile):
+                haupt, aehnlich = nachbar, zeile
+            else:
+                haupt, aehnlich = zeile, nachbar
+            
+            score = DuplikatsPruefer._berechne_aehnlichkeit(haupt, aehnlich)
+            if score < 0.7:
+                continue
+            
+            kandidat = DuplikatsPruefer._kandidat_aus_paar(
+                DuplikatsPruefer._bewerte_paar(haupt, aehnlich, score)
+            )
+            db.session.add(kandidat)
+            gefunden.append(kandidat)
+        
+        aufmass.is_duplicate_checked = True
+        return gefunden
+    
+    @staticmethod
+    def pruefe_offene_eintraege():
+        """Prüft alle Aufmaße, die noch nicht mit ihren Nachbarn verglichen wurden
+        
+        Schreibt und baut bei großem Rückstand die Tabelle komplett neu auf,
+        daher nur im Hintergrund-Lauf des Berichts oder über die CLI aufrufen.
+        """
+        offene = AufmassEntry.query.filter(or_(
+            AufmassEntry.is_duplicate_checked == False,
+            AufmassEntry.is_duplicate_checked.is_(None)
+        )).all()
+        
+        if not offene:
+            return 0
+        
+        # Bei großem Rückstand (z.B. Altbestand) ist ein Komplett-Scan günstiger
+        if len(offene) > VOLLSCAN_SCHWELLE:
+            DuplikatsPruefer.baue_kandidaten_neu()
+            return len(offene)
+        
+        for aufmass in offene:
+            DuplikatsPruefer.pruefe_eintrag(aufmass)
+        db.session.commit()
+        
+        return len(offene)
+    
+    @staticmethod
+    def baue_kandidaten_neu():
+        """Füllt duplicate_candidates vollständig neu aus einem kompletten Scan"""
+        DuplikatKandidat.query.delete(synchronize_session=False)
+        
+        paare = DuplikatsPruefer.finde_paare(lade_aufmass_zeilen())
+        db.session.add_all([DuplikatsPruefer._kandidat_aus_paar(paar) for paar in paare])
+        
+        AufmassEntry.query.update({AufmassEntry.is_duplicate_checked: True}, synchronize_session=False)
+        db.session.commit()
+        
+        return len(paare)
+    
+    @staticmethod
+    def _lade_ausnahmen():
+        """Als "kein Duplikat" bestätigte Paare als sortiertes Array gepackter Paare"""
+        return np.sort(np.fromiter(DuplikatAusnahme.lade_gepackt(), dtype=np.int64))
+    
+    @staticmethod
+    def _bewerte_paar(haupt, aehnlich, score):
+        """Bewertet Risiko und Kriterien eines einzelnen Paares"""
+        vergleich = [{'aufmass': aehnlich, 'aehnlichkeit': score}]
+        return {
+            'a': haupt.id,
+            'b': aehnlich.id,
+            'aehnlichkeit': score,
+            'risiko': DuplikatsPruefer._bewerte_risiko(haupt, vergleich),
+            'kriterien': DuplikatsPruefer._bewerte_aehnlichkeit(haupt, vergleich)
+        }
+    
+    @staticmethod
+    def _kandidat_aus_paar(paar):
+        kandidat = DuplikatKandidat(
+            entry_a_id=paar['a'],
+            entry_b_id=paar['b'],
+            score=paar['aehnlichkeit'],
+            risiko=paar['risiko']
+        )
+        kandidat.set_kriterien(paar['kriterien'])
+        return kandidat
+    
+    @staticmethod
+    def _finde_nachbarn(aufmass, zeile):
+        """Lädt alle Aufmaße, mit denen das Aufmaß den Schwellenwert erreichen kann.
+        
+        Entspricht den Blocking-Schlüsseln aus _erzeuge_kandidaten, jedoch
+        als Datenbankabfrage für einen einzelnen Eintrag.
+        """
+        material_name = zeile.material.lower()
+        username = zeile.mitarbeiter.lower()
+        
+        # Namensvergleich als Unterabfragen, ohne alle Materialien und Benutzer zu laden.
+        # Platzhalter (%, _) in Materialnamen erweitern die Auswahl höchstens, die
+        # Bewertung der Paare bleibt dieselbe.
+        name = func.lower(Material.name)
+        gleiche_materialien = select(Material.id).where(name == material_name)
+        verwandte_materialien = select(Material.id).where(or_(
+            name == material_name,
+            name.contains(material_name, autoescape=True),
+            literal(material_name).contains(name)
+        ))
+        gleiche_mitarbeiter = select(User.id).where(func.lower(User.username) == username)
+        
+        return lade_aufmass_zeilen(
+            AufmassEntry.id != aufmass.id,
+            or_(
+                # Verwandtes Material innerhalb einer Woche
+                and_(
+                    AufmassEntry.datum > aufmass.datum - FENSTER_WOCHE,
+                    AufmassEntry.datum < aufmass.datum + FENSTER_WOCHE,
+                    AufmassEntry.material_id.in_(verwandte_materialien)
+                ),
+                # Gleicher Mitarbeiter am selben Tag
+                and_(
+                    AufmassEntry.datum > aufmass.datum - FENSTER_GLEICHER_TAG,
+                    AufmassEntry.datum < aufmass.datum + FENSTER_GLEICHER_TAG,
+                    AufmassEntry.mitarbeiter_id.in_(gleiche_mitarbeiter)
+                ),
+                # Identischer Eintrag unabhängig vom Datum
+                and_(
+                    AufmassEntry.material_id.in_(gleiche_materialien),
+                    AufmassEntry.mitarbeiter_id.in_(gleiche_mitarbeiter),
+                    AufmassEntry.menge == aufmass.menge
+                )
+            )
+        )
+    
+    @staticmethod
+    def _sortierschluessel(aufmass):
+        """Sortierung der Scans: Datum, bei Gleichstand ID"""
+        return (aufmass.datum, aufmass.id)
+    
+    @staticmethod
+    def _erzeuge_kandidaten(aufmaesse):
+        """Erzeugt Kandidatenpaare für die Ähnlichkeitsbewertung.
+        
+        Erwartet die Aufmaße absteigend nach Datum sortiert und liefert ein
+        Dict {i: {j, ...}} mit i < j. Die Schlüssel decken alle Kombinationen
+        ab, mit denen _berechne_aehnlichkeit den Schwellenwert 0.7 erreichen
+        kann, das Ergebnis entspricht daher dem vollständigen Paarvergleich:
+        
+        - Datum mehr als 7 Tage auseinander: nur bei identischem Ort,
+          Material, Mitarbeiter und identischer Menge
+        - gleicher Ort und gleiches Material: ±7 Tage
+        - Material ohne Bezug: nur am selben Tag, gleicher Ort und Mitarbeiter
+        - verwandtes Material (gleich oder enthalten): ±1 Tag
+        - verwandtes Material, ±7 Tage: nur gleicher Mitarbeiter und gleiche Menge
+        """
+        daten = [a.datum for a in aufmaesse]
+        materialien = [a.material.lower() for a in aufmaesse]
+        orte = [a.ort.lower() for a in aufmaesse]
+        mitarbeiter = [a.mitarbeiter.lower() for a in aufmaesse]
+        
+        exakt = defaultdict(list)
+        material_ort = defaultdict(list)
+        ort_mitarbeiter = defaultdict(list)
+        nach_material = defaultdict(list)
+        mitarbeiter_menge = defaultdict(list)
+        
+        # Indizes sind aufsteigend, damit auch nach Datum absteigend sortiert
+        for i, aufmass in enumerate(aufmaesse):
+            exakt[(materialien[i], orte[i], mitarbeiter[i], aufmass.menge)].append(i)
+            material_ort[(materialien[i], orte[i])].append(i)
+            ort_mitarbeiter[(orte[i], mitarbeiter[i])].append(i)
+            nach_material[materialien[i]].append(i)
+            mitarbeiter_menge[(mitarbeiter[i], aufmass.menge)].append(i)
+        
+        # Verwandte Materialnamen (gleich oder enthalten), nur wenige hundert
+        namen = sorted(nach_material)
+        verwandt = set()
+        for a, b in combinations(namen, 2):
+            if a in b or b in a:
+                verwandt.add((a, b))
+                verwandt.add((b, a))
+        
+        kandidaten = defaultdict(set)
+        
+        for indizes in exakt.values():
+            for i, j in combinations(indizes, 2):
+                kandidaten[i].add(j)
+        
+        for indizes in material_ort.values():
+            DuplikatsPruefer._fenster_paare(indizes, daten, FENSTER_WOCHE, kandidaten)
+        
+        for indizes in ort_mitarbeiter.values():
+            DuplikatsPruefer._fenster_paare(indizes, daten, FENSTER_GLEICHER_TAG, kandidaten)
+        
+        for indizes in nach_material.values():
+            DuplikatsPruefer._fenster_paare(indizes, daten, FENSTER_NACHBARTAG, kandidaten)
+        
+        for a, b in verwandt:
+            if a < b:
+                DuplikatsPruefer._fenster_paare(
+                    sorted(nach_material[a] + nach_material[b]), daten, FENSTER_NACHBARTAG, kandidaten,
+                    lambda i, j: materialien[i] != materialien[j]
+                )
+        
+        for indizes in mitarbeiter_menge.values():
+            DuplikatsPruefer._fenster_paare(
+                indizes, daten, FENSTER_WOCHE, kandidaten,
+                lambda i, j: materialien[i] == materialien[j] or (materialien[i], materialien[j]) in verwandt
+            )
+        
+        return kandidaten
+    
+    @staticmethod
+    def _kandidaten_arrays(kandidaten):
+        """Wandelt {i: {j, ...}} in zwei nach (i, j) sortierte Index-Arrays um"""
+        anzahl = sum(len(partner) for partner in kandidaten.values())
+        idx_a = np.empty(anzahl, dtype=np.int64)
+        idx_b = np.empty(anzahl, dtype=np.int64)
+        
+        position = 0
+        for i in sorted(kandidaten):
+            partner = sorted(kandidaten[i])
+            idx_a[position:position + len(partner)] = i
+            idx_b[position:position + len(partner)] = partner
+            position += len(partner)
+        
+        return idx_a, idx_b
+    
+    @staticmethod
+    def _fenster_paare(indizes, daten, fenster, kandidaten, bedingung=None):
+        """Fügt alle Paare eines Buckets hinzu, deren Datum weniger als `fenster` auseinanderliegt"""
+        start = 0
+        for position, j in enumerate(indizes):
+            while daten[indizes[start]] - daten[j] >= fenster:
+                start += 1
+            for i in indizes[start:position]:
+                if bedingung is None or bedingung(i, j):
+                    kandidaten[i].add(j)
+    
     @staticmethod
     def _finde_aehnliche_eintraege(aufmass, vergleichsliste):
         """Findet ähnliche Einträge basierend auf Kriterien"""
@@ -57,7 +712,7 @@ class DuplikatsPruefer:
     
     @staticmethod
     def _berechne_aehnlichkeit(aufmass1, aufmass2):
-        """Berechnet Ähnlichkeitswert zwischen zwei Aufmaßen"""
+        """Berechnet Ähnlichkeitswert zwischen zwei Aufmaßen (AufmassZeile)"""
         score = 0.0
         max_score = 0.0
         
@@ -80,14 +735,14 @@ class DuplikatsPruefer:
         
         # Material (Gewichtung: 0.25)
         max_score += 0.25
-        if aufmass1.material.name.lower() == aufmass2.material.name.lower():
+        if aufmass1.material.lower() == aufmass2.material.lower():
             score += 0.25
-        elif aufmass1.material.name.lower() in aufmass2.material.name.lower() or aufmass2.material.name.lower() in aufmass1.material.name.lower():
+        elif aufmass1.material.lower() in aufmass2.material.lower() or aufmass2.material.lower() in aufmass1.material.lower():
             score += 0.15
         
         # Mitarbeiter (Gewichtung: 0.15)
         max_score += 0.15
-        if aufmass1.mitarbeiter.username.lower() == aufmass2.mitarbeiter.username.lower():
+        if aufmass1.mitarbeiter.lower() == aufmass2.mitarbeiter.lower():
             score += 0.15
         
         # Menge (Gewichtung: 0.05)
@@ -119,10 +774,10 @@ class DuplikatsPruefer:
             if haupteintrag.ort.lower() == aufmass.ort.lower():
                 kriterien['gleicher_ort'] = True
             
-            if haupteintrag.material.name.lower() == aufmass.material.name.lower():
+            if haupteintrag.material.lower() == aufmass.material.lower():
                 kriterien['gleiches_material'] = True
             
-            if haupteintrag.mitarbeiter.username.lower() == aufmass.mitarbeiter.username.lower():
+            if haupteintrag.mitarbeiter.lower() == aufmass.mitarbeiter.lower():
                 kriterien['gleicher_mitarbeiter'] = True
             
             if abs(haupteintrag.menge - aufmass.menge) / max(haupteintrag.menge, aufmass.menge) <= 0.1:
@@ -141,15 +796,15 @@ class DuplikatsPruefer:
             # Hohes Risiko: Gleicher Tag, Ort, Material und Mitarbeiter
             if (haupteintrag.datum == aufmass.datum and
                 haupteintrag.ort.lower() == aufmass.ort.lower() and
-                haupteintrag.material.name.lower() == aufmass.material.name.lower() and
-                haupteintrag.mitarbeiter.username.lower() == aufmass.mitarbeiter.username.lower()):
+                haupteintrag.material.lower() == aufmass.material.lower() and
+                haupteintrag.mitarbeiter.lower() == aufmass.mitarbeiter.lower()):
                 risiko_score = 3  # Hoch
                 break
             
             # Mittleres Risiko: Gleicher Tag, Ort und Material
             elif (haupteintrag.datum == aufmass.datum and
                   haupteintrag.ort.lower() == aufmass.ort.lower() and
-                  haupteintrag.material.name.lower() == aufmass.material.name.lower()):
+                  haupteintrag.material.lower() == aufmass.material.lower()):
                 risiko_score = max(risiko_score, 2)  # Mittel
             
             # Niedriges Risiko: Ähnliche Kriterien
@@ -158,6 +813,111 @@ class DuplikatsPruefer:
         
         return risiko_score
 
+class DuplikatBericht:
+    """Vorberechneter Duplikat-Bericht im Cache
+    
+    Der Bericht enthält die Gruppen mit Aufmaß-IDs, die Statistik und den
+    Datenstand, auf dem er beruht. Die Übersicht liefert ihn sofort aus
+    und stößt bei verändertem Datenstand eine Neuberechnung im Hintergrund an.
+    """
+    
+    @staticmethod
+    def datenstand():
+        """Datenstand: letzte Änderung und Anzahl der Aufmaße sowie Anzahl der Ausnahmen"""
+        letzte_aenderung, anzahl, ausnahmen = db.session.query(
+            func.max(AufmassEntry.updated_at),
+            func.count(AufmassEntry.id),
+            select(func.count(DuplikatAusnahme.id)).scalar_subquery()
+        ).one()
+        return f"{letzte_aenderung.isoformat() if letzte_aenderung else '-'}|{anzahl}|{ausnahmen}"
+    
+    @staticmethod
+    def erstelle(speichern=True):
+        """Berechnet den Bericht und legt ihn im Cache ab
+        
+        Mit speichern=False (Request ohne geteilten Cache) wird weder nachgezogen
+        noch gespeichert, der Bericht beruht dann nur auf den geprüften Einträgen.
+        """
+        start = time.perf_counter()
+        
+        # Offene Einträge zuerst nachziehen, das aktualisiert auch updated_at
+        if speichern:
+            DuplikatsPruefer.pruefe_offene_eintraege()
+        version = DuplikatBericht.datenstand()
+        
+        # Nach Risiko sortieren, innerhalb gleichen Risikos neueste Gruppe zuerst
+        duplikate = DuplikatsPruefer.lade_gruppen()
+        duplikate.sort(key=lambda x: x['risiko'], reverse=True)
+        
+        bericht = {
+            'version': version,
+            'erstellt_am': datetime.now(timezone.utc),
+            'dauer': time.perf_counter() - start,
+            'duplikate': duplikate,
+            'stats': DuplikatBericht.statistik(duplikate)
+        }
+        if speichern:
+            cache.set(BERICHT_CACHE_KEY, bericht, timeout=0)
+        return bericht
+    
+    @staticmethod
+    def statistik(duplikate):
+        """Anzahl der Gruppen gesamt und je Risiko"""
+        return {
+            'gesamt_duplikate': len(duplikate),
+            'hohes_risiko': len([d for d in duplikate if d['risiko'] == 3]),
+            'mittleres_risiko': len([d for d in duplikate if d['risiko'] == 2]),
+            'niedriges_risiko': len([d for d in duplikate if d['risiko'] == 1])
+        }
+    
+    @staticmethod
+    def lade():
+        """Liefert den zuletzt berechneten Bericht oder None"""
+        return cache.get(BERICHT_CACHE_KEY)
+    
+    @staticmethod
+    def laeuft_seit():
+        """Startzeit einer laufenden Neuberechnung oder None"""
+        return cache.get(BERICHT_LAUF_KEY)
+    
+    @staticmethod
+    def starte_neuberechnung():
+        """Startet die Neuberechnung in einem Hintergrund-Thread.
+        
+        Über die Sperre im Cache läuft auch bei mehreren Workern höchstens
+        eine Berechnung gleichzeitig. Gibt False zurück, wenn bereits eine läuft
+        oder der Cache nicht zwischen den Workern geteilt ist (dann hätte jeder
+        Worker eigene Sperre und eigenen Bericht).
+        """
+        if not geteilter_cache.ist_geteilt():
+            return False
+        if not cache.add(BERICHT_LAUF_KEY, datetime.now(timezone.utc), timeout=BERICHT_SPERRE_TIMEOUT):
+            return False
+        
+        app = current_app._get_current_object()
+        threading.Thread(
+            target=DuplikatBericht._hintergrund_lauf,
+            args=(app,),
+            name='duplikat-bericht',
+            daemon=True
+        ).start()
+        return True
+    
+    @staticmethod
+    def _hintergrund_lauf(app):
+        with app.app_context():
+            try:
+                bericht = DuplikatBericht.erstelle()
+                logger.info(
+                    f"Duplikat-Bericht erstellt: {bericht['stats']['gesamt_duplikate']} Gruppen "
+                    f"in {bericht['dauer']:.1f}s"
+                )
+            except Exception:
+                db.session.rollback()
+                logger.exception("Fehler bei der Berechnung des Duplikat-Berichts")
+            finally:
+                cache.delete(BERICHT_LAUF_KEY)
+
 @duplikate_bp.route('/duplikate')
 @login_required
 def duplikate_uebersicht():
@@ -167,23 +927,65 @@ def duplikate_uebersicht():
         flash('Keine Berechtigung für Duplikatsprüfung', 'error')
         return redirect(url_for('dashboard.index'))
     
-    # Duplikate finden
-    duplikate = DuplikatsPruefer.finde_duplikate()
+    # Vorberechneten Bericht ausliefern, bei verändertem Datenstand neu berechnen
+    if geteilter_cache.ist_geteilt():
+        bericht = DuplikatBericht.lade()
+        aktuell = bericht is not None and bericht['version'] == DuplikatBericht.datenstand()
+        if not aktuell:
+            DuplikatBericht.starte_neuberechnung()
+        laeuft_seit = DuplikatBericht.laeuft_seit()
+    else:
+        # Prozesslokaler Cache: jeder Worker hätte seinen eigenen Bericht und Lauf
+        bericht = DuplikatBericht.erstelle(speichern=False)
+        aktuell, laeuft_seit = True, None
+    
+    # Nach dem Bericht bestätigte Paare vor Zählung und Seitenaufteilung ausblenden
+    duplikate = bericht['duplikate'] if bericht else []
+    gefiltert = DuplikatsPruefer.entferne_ausnahmen(duplikate)
+    if gefiltert is not duplikate:
+        # Zerfallene Gruppen können ein anderes Risiko haben
+        duplikate = sorted(gefiltert, key=lambda x: x['risiko'], reverse=True)
+    stats = DuplikatBericht.statistik(duplikate)
     
-    # Nach Risiko sortieren
-    duplikate.sort(key=lambda x: x['risiko'], reverse=True)
+    # Nur die Gruppen der aktuellen Seite als ORM-Objekte laden
+    pro_seite = current_app.config.get('ITEMS_PER_PAGE', 20)
+    seiten = max(1, -(-len(duplikate) // pro_seite))
+    seite = min(max(request.args.get('page', 1, type=int), 1), seiten)
+    duplikate_seite = DuplikatsPruefer.materialisiere_gruppen(
+        duplikate[(seite - 1) * pro_seite:seite * pro_seite]
+    )
     
-    # Statistiken
-    stats = {
-        'gesamt_duplikate': len(duplikate),
-        'hohes_risiko': len([d for d in duplikate if d['risiko'] == 3]),
-        'mittleres_risiko': len([d for d in duplikate if d['risiko'] == 2]),
-        'niedriges_risiko': len([d for d in duplikate if d['risiko'] == 1])
+    status = {
+        'erstellt_am': bericht['erstellt_am'] if bericht else None,
+        'alter_minuten': int((datetime.now(timezone.utc) - bericht['erstellt_am']).total_seconds() // 60) if bericht else None,
+        'dauer': bericht['dauer'] if bericht else None,
+        'aktuell': aktuell,
+        'laeuft': laeuft_seit is not None,
+        'seite': seite,
+        'seiten': seiten,
+        'pro_seite': pro_seite
     }
     
     return render_template('duplikate/uebersicht.html', 
-                         duplikate=duplikate, 
-                         stats=stats)
+                         duplikate=duplikate_seite, 
+                         stats=stats,
+                         status=status)
+
+@duplikate_bp.route('/duplikate/neu-berechnen', methods=['POST'])
+@login_required
+def bericht_neu_berechnen():
+    """Stößt die Neuberechnung des Duplikat-Berichts im Hintergrund an"""
+    
+    if current_user.role not in ['admin', 'bauleiter']:
+        flash('Keine Berechtigung', 'error')
+        return redirect(url_for('dashboard.index'))
+    
+    if DuplikatBericht.starte_neuberechnung():
+        flash('Duplikat-Bericht wird im Hintergrund neu berechnet', 'success')
+    else:
+        flash('Der Duplikat-Bericht wird bereits neu berechnet', 'info')
+    
+    return redirect(url_for('duplikate.duplikate_uebersicht'))
 
 @duplikate_bp.route('/duplikate/loeschen/<int:aufmass_id>', methods=['POST'])
 @login_required
@@ -202,6 +1004,9 @@ def duplikat_loeschen(aufmass_id):
         if bautagebuch_eintrag:
             db.session.delete(bautagebuch_eintrag)
         
+        # Gespeicherte Duplikat-Paare entfernen
+        DuplikatKandidat.entferne_fuer_eintrag(aufmass_id)
+        
         # Aufmaß löschen
         db.session.delete(aufmass)
         db.session.commit()
@@ -217,16 +1022,46 @@ def duplikat_loeschen(aufmass_id):
 @duplikate_bp.route('/duplikate/markieren-ok/<int:aufmass_id>', methods=['POST'])
 @login_required
 def duplikat_markieren_ok(aufmass_id):
-    """Markiert ein Duplikat als OK (kein Duplikat)"""
+    """Markiert ein Duplikat als OK (kein Duplikat)
+    
+    Bestätigt werden die Paare mit den übergebenen partner_id-Werten, ohne
+    Angabe alle gespeicherten Duplikat-Paare des Eintrags. Die Paare werden
+    bei künftigen Scans übersprungen.
+    """
     
     if current_user.role not in ['admin', 'bauleiter']:
         flash('Keine Berechtigung', 'error')
         return redirect(url_for('duplikate.duplikate_uebersicht'))
     
-    # Hier könnte man eine separate Tabelle für "OK-markierte" Einträge anlegen
-    # Für Einfachheit fügen wir ein Feld in die Aufmass-Tabelle hinzu
+    aufmass = AufmassEntry.query.get_or_404(aufmass_id)
+    
+    partner_ids = set(request.form.getlist('partner_id', type=int))
+    if not partner_ids:
+        for kandidat in DuplikatKandidat.query.filter(or_(
+            DuplikatKandidat.entry_a_id == aufmass.id,
+            DuplikatKandidat.entry_b_id == aufmass.id
+        )):
+            partner_ids.add(kandidat.entry_b_id if kandidat.entry_a_id == aufmass.id else kandidat.entry_a_id)
+    partner_ids.discard(aufmass.id)
+    partner_ids = {
+        partner_id for (partner_id,) in db.session.query(AufmassEntry.id).filter(AufmassEntry.id.in_(partner_ids))
+    }
+    
+    if not partner_ids:
+        flash('Keine Duplikat-Paare für diesen Eintrag gefunden', 'warning')
+        return redirect(url_for('duplikate.duplikate_uebersicht'))
+    
+    try:
+        for partner_id in partner_ids:
+            DuplikatAusnahme.markiere(aufmass.id, partner_id, current_user.id)
+        db.session.commit()
+        
+        flash(f'Eintrag als OK markiert ({len(partner_ids)} Paar{"e" if len(partner_ids) > 1 else ""})', 'success')
+        
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Fehler beim Markieren: {str(e)}', 'error')
     
-    flash('Eintrag als OK markiert', 'success')
     return redirect(url_for('duplikate.duplikate_uebersicht'))
 
 @duplikate_bp.route('/api/duplikate/check', methods=['POST'])
@@ -248,26 +1083,84 @@ def check_duplikat_api():
     except:
         return jsonify({'duplikate': []})
     
-    # Suche nach ähnlichen Einträgen
-    aehnliche = AufmassEntry.query.join(Material).filter(
-        and_(
-            Material.name.ilike(f'%{material}%'),
-            AufmassEntry.ort.ilike(f'%{ort}%'),
-            AufmassEntry.datum >= datum - timedelta(days=1),
-            AufmassEntry.datum <= datum + timedelta(days=1)
-        )
-    ).limit(5).all()
+    # Suche nach ähnlichen Einträgen (±1 Tag) im Live-Index
+    index = get_live_index()
+    aehnliche = index.suche_aehnliche(material, ort, datum, tage=1, limit=5)
     
     duplikate = []
     for aufmass in aehnliche:
         duplikate.append({
             'id': aufmass.id,
-            'material': aufmass.material.name,
+            'material': index.material_name(aufmass.material_id),
             'ort': aufmass.ort,
             'menge': aufmass.menge,
             'einheit': aufmass.einheit,
             'datum': aufmass.datum.strftime('%d.%m.%Y'),
-            'mitarbeiter': aufmass.mitarbeiter.username
+            'mitarbeiter': index.benutzername(aufmass.mitarbeiter_id)
         })
     
     return jsonify({'duplikate': duplikate})
+
+
+@duplikate_bp.cli.command('kandidaten-aufbauen')
+def kandidaten_aufbauen():
+    """Baut die Tabelle duplicate_candidates aus einem vollständigen Scan neu auf"""
+    anzahl = DuplikatsPruefer.baue_kandidaten_neu()
+    click.echo(f"{anzahl} Duplikat-Paare gespeichert")
+
+
+@duplikate_bp.cli.command('offene-pruefen')
+def offene_pruefen():
+    """Vergleicht alle noch ungeprüften Aufmaße mit ihren Nachbarn"""
+    anzahl = DuplikatsPruefer.pruefe_offene_eintraege()
+    click.echo(f"{anzahl} Aufmaße geprüft")
+
+
+@duplikate_bp.cli.command('bericht-erstellen')
+def bericht_erstellen():
+    """Berechnet den Duplikat-Bericht und legt ihn im Cache ab"""
+    bericht = DuplikatBericht.erstelle()
+    click.echo(
+        f"{bericht['stats']['gesamt_duplikate']} Duplikat-Gruppen in {bericht['dauer']:.1f}s berechnet "
+        f"(Datenstand {bericht['version']})"
+    )
+
+
+@duplikate_bp.cli.command('scan-parallel')
+@click.option('--workers', type=int, default=None, help='Anzahl Prozesse (Standard: alle Kerne)')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Aufmaße ab diesem Datum')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Aufmaße bis einschließlich diesem Datum')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Paare als CSV-Datei schreiben statt in duplicate_candidates')
+def scan_parallel(workers, since, until, output):
+    """Duplikat-Scan über große Zeiträume, verteilt auf mehrere Prozesse"""
+    kriterien = zeitraum_bedingungen(AufmassEntry.tag, since, until)
+    
+    start = time.perf_counter()
+    aufmaesse = lade_aufmass_zeilen(*kriterien)
+    paare = DuplikatsPruefer.finde_paare_parallel(aufmaesse, workers=workers)
+    click.echo(f"{len(aufmaesse)} Aufmaße geprüft, {len(paare)} Duplikat-Paare in {time.perf_counter() - start:.1f}s")
+    
+    if output:
+        with open(output, 'w', newline='', encoding='utf-8') as datei:
+            writer = csv.writer(datei, delimiter=';')
+            writer.writerow(['entry_a_id', 'entry_b_id', 'score', 'risiko', 'kriterien'])
+            for paar in paare:
+                writer.writerow([paar['a'], paar['b'], paar['aehnlichkeit'], paar['risiko'], json.dumps(paar['kriterien'])])
+        click.echo(f"Paare gespeichert in {output}")
+        return
+    
+    # Paare innerhalb des Zeitraums ersetzen, Paare mit Einträgen außerhalb bleiben bestehen
+    if kriterien:
+        im_zeitraum = select(AufmassEntry.id).where(*kriterien)
+        DuplikatKandidat.query.filter(
+            DuplikatKandidat.entry_a_id.in_(im_zeitraum),
+            DuplikatKandidat.entry_b_id.in_(im_zeitraum)
+        ).delete(synchronize_session=False)
+    else:
+        DuplikatKandidat.query.delete(synchronize_session=False)
+        AufmassEntry.query.update({AufmassEntry.is_duplicate_checked: True}, synchronize_session=False)
+    
+    db.session.add_all([DuplikatsPruefer._kandidat_aus_paar(paar) for paar in paare])
+    db.session.commit()
+    click.echo(f"{len(paare)} Duplikat-Paare in duplicate_candidates gespeichert")
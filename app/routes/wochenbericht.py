@@ -1,18 +1,11 @@
 # routes/wochenbericht.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify, abort, make_response, current_app
 from flask_login import login_required, current_user
 from app import db
-from app.models.bautagebuch import BautagebuchEntry, WochenExport
-from app.models.aufmass import AufmassEntry
-from datetime import datetime, date, timedelta, timezone
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from docx import Document
-from docx.shared import Inches
-import io
+from app.models.bautagebuch import BautagebuchEntry, WochenExport, ExportAuftrag
+from app.utils import wochen_export
+from app.utils.zeitraum import heute, kalenderwoche, wochen_grenzen
+from datetime import timedelta
 import os
 
 wochenbericht_bp = Blueprint('wochenbericht', __name__)
@@ -20,7 +13,12 @@ wochenbericht_bp = Blueprint('wochenbericht', __name__)
 @wochenbericht_bp.route('/wochenbericht')
 @login_required
 def wochenbericht_uebersicht():
-    """Übersicht aller Wochen mit Exportstatus"""
+    """Übersicht der Wochen eines Jahres mit Exportstatus
+
+    Seitenweise nach Jahr (?jahr=, Standard: das jüngste Jahr mit Einträgen).
+    Je Seite zwei Abfragen: die Jahre und die Wochen des Jahres samt
+    Exportstatus per LEFT JOIN, beide über die Indizes auf (jahr, kalenderwoche).
+    """
     
     # Nur Bauleiter und Admin haben Zugriff
     if current_user.role == 'mitarbeiter':
@@ -28,48 +26,70 @@ def wochenbericht_uebersicht():
         return redirect(url_for('dashboard.index'))
     
     # Aktuelle Woche
-    heute = datetime.now(timezone.utc).date()
-    aktuelle_kw = heute.isocalendar()[1]
-    aktuelles_jahr = heute.year
+    aktuelles_jahr, aktuelle_kw = kalenderwoche(heute())
     
-    # Alle Wochen mit Einträgen finden
-    wochen_query = db.session.query(
+    jahre = [jahr for (jahr,) in db.session.query(BautagebuchEntry.jahr).distinct().order_by(
+        BautagebuchEntry.jahr.desc()
+    )]
+    jahr = request.args.get('jahr', type=int)
+    if jahr not in jahre:
+        jahr = jahre[0] if jahre else aktuelles_jahr
+    
+    # Wochen des Jahres mit Anzahl der Einträge
+    wochen = db.session.query(
         BautagebuchEntry.kalenderwoche,
-        BautagebuchEntry.jahr,
         db.func.count(BautagebuchEntry.id).label('anzahl_eintraege')
+    ).filter(
+        BautagebuchEntry.jahr == jahr
     ).group_by(
-        BautagebuchEntry.kalenderwoche,
-        BautagebuchEntry.jahr
+        BautagebuchEntry.kalenderwoche
+    ).subquery()
+    
+    # Ältester Export je Woche, falls es (durch parallele Exporte) mehrere gibt
+    erste_exporte = db.session.query(
+        WochenExport.kalenderwoche,
+        db.func.min(WochenExport.id).label('export_id')
+    ).filter(
+        WochenExport.jahr == jahr
+    ).group_by(
+        WochenExport.kalenderwoche
+    ).subquery()
+    
+    wochen_query = db.session.query(
+        wochen.c.kalenderwoche,
+        wochen.c.anzahl_eintraege,
+        WochenExport.id,
+        WochenExport.exportiert_am,
+        WochenExport.exportiert_von
+    ).outerjoin(
+        erste_exporte, erste_exporte.c.kalenderwoche == wochen.c.kalenderwoche
+    ).outerjoin(
+        WochenExport, WochenExport.id == erste_exporte.c.export_id
     ).order_by(
-        BautagebuchEntry.jahr.desc(),
-        BautagebuchEntry.kalenderwoche.desc()
+        wochen.c.kalenderwoche.desc()
     ).all()
     
-    # Export-Status ermitteln
     wochen_mit_status = []
-    for kw, jahr, anzahl in wochen_query:
-        export = WochenExport.query.filter_by(
-            kalenderwoche=kw,
-            jahr=jahr
-        ).first()
-        
+    for kw, anzahl, export_id, export_datum, exportiert_von in wochen_query:
         # Wochendaten berechnen
-        montag = datetime.strptime(f'{jahr}-W{kw:02d}-1', "%Y-W%W-%w").date()
+        montag, _ = wochen_grenzen(jahr, kw)
         freitag = montag + timedelta(days=4)
         
         wochen_mit_status.append({
             'kalenderwoche': kw,
             'jahr': jahr,
             'anzahl_eintraege': anzahl,
-            'exportiert': export is not None,
-            'export_datum': export.exportiert_am if export else None,
-            'exportiert_von': export.exportiert_von if export else None,
+            'exportiert': export_id is not None,
+            'export_datum': export_datum,
+            'exportiert_von': exportiert_von,
             'montag': montag,
             'freitag': freitag
         })
     
     return render_template('wochenbericht/uebersicht.html', 
                          wochen=wochen_mit_status,
+                         jahr=jahr,
+                         jahre=jahre,
                          aktuelle_kw=aktuelle_kw,
                          aktuelles_jahr=aktuelles_jahr)
 
@@ -93,7 +113,7 @@ def wochenbericht_anzeigen(jahr, kw):
         return redirect(url_for('wochenbericht.wochenbericht_uebersicht'))
     
     # Wochendaten
-    montag = datetime.strptime(f'{jahr}-W{kw:02d}-1', "%Y-W%W-%w").date()
+    montag, _ = wochen_grenzen(jahr, kw)
     freitag = montag + timedelta(days=4)
     
     # Export-Status
@@ -119,150 +139,141 @@ def wochenbericht_anzeigen(jahr, kw):
 @wochenbericht_bp.route('/wochenbericht/<int:jahr>/<int:kw>/export/<format>')
 @login_required
 def wochenbericht_export(jahr, kw, format):
-    """Wochenbericht als PDF oder Word exportieren"""
+    """Wochenbericht als PDF oder Word exportieren
+
+    Legt einen Export-Auftrag an, die Datei entsteht im Hintergrund (siehe
+    app/utils/wochen_export.py). JSON-Clients erhalten die Auftrags-ID mit
+    Status 202, Browser werden auf die Statusseite weitergeleitet.
+    """
     
     if current_user.role == 'mitarbeiter':
         flash('Keine Berechtigung für Export', 'error')
         return redirect(url_for('dashboard.index'))
     
-    if format not in ['pdf', 'word']:
+    if format not in wochen_export.FORMATE:
         flash('Ungültiges Export-Format', 'error')
         return redirect(url_for('wochenbericht.wochenbericht_anzeigen', jahr=jahr, kw=kw))
     
-    # Einträge laden
-    eintraege = BautagebuchEntry.query.filter_by(
-        kalenderwoche=kw,
-        jahr=jahr
-    ).order_by(BautagebuchEntry.datum).all()
-    
-    if not eintraege:
+    # Nur prüfen, ob es Einträge gibt; geladen werden sie im Auftrag
+    vorhanden = db.session.query(
+        BautagebuchEntry.query.filter_by(kalenderwoche=kw, jahr=jahr).exists()
+    ).scalar()
+    if not vorhanden:
         flash('Keine Einträge zum Exportieren', 'error')
         return redirect(url_for('wochenbericht.wochenbericht_uebersicht'))
     
-    # Wochendaten
-    montag = datetime.strptime(f'{jahr}-W{kw:02d}-1', "%Y-W%W-%w").date()
-    freitag = montag + timedelta(days=4)
-    
-    if format == 'pdf':
-        return export_pdf(eintraege, kw, jahr, montag, freitag)
-    else:
-        return export_word(eintraege, kw, jahr, montag, freitag)
+    auftrag = wochen_export.starte_export(jahr, kw, format, current_user)
+    return _auftrag_antwort(auftrag)
 
-def export_pdf(eintraege, kw, jahr, montag, freitag):
-    """PDF Export erstellen"""
-    buffer = io.BytesIO()
-    
-    # PDF erstellen
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Titel
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        alignment=1,  # Zentriert
-        spaceAfter=20
-    )
-    
-    story.append(Paragraph(f"Bautagebuch - Kalenderwoche {kw}/{jahr}", title_style))
-    story.append(Paragraph(f"Zeitraum: {montag.strftime('%d.%m.%Y')} bis {freitag.strftime('%d.%m.%Y')}", styles['Normal']))
-    story.append(Spacer(1, 20))
-    
-    # Einträge nach Datum gruppieren
-    eintraege_by_datum = {}
-    for eintrag in eintraege:
-        datum_str = eintrag.datum.strftime('%d.%m.%Y')
-        if datum_str not in eintraege_by_datum:
-            eintraege_by_datum[datum_str] = []
-        eintraege_by_datum[datum_str].append(eintrag)
+def _auftrag_antwort(auftrag):
+    """JSON mit Auftrags-ID, fertige Datei direkt oder Weiterleitung auf die Statusseite"""
+    if _will_json():
+        return jsonify({
+            'success': True,
+            'job_id': auftrag.id,
+            'status': auftrag.status,
+            'status_url': url_for('wochenbericht.export_status', auftrag_id=auftrag.id),
+            'download_url': url_for('wochenbericht.export_download', auftrag_id=auftrag.id)
+            if auftrag.status == 'fertig' else None
+        }), 200 if auftrag.abgeschlossen else 202
+    if auftrag.status == 'fertig':
+        # Datei lag bereits vor (oder EXPORT_WORKER = 0): direkt ausliefern
+        return _sende_datei(auftrag)
+    return redirect(url_for('wochenbericht.export_status', auftrag_id=auftrag.id))
+
+@wochenbericht_bp.route('/wochenbericht/<int:jahr>/export/<format>')
+@login_required
+def bereich_export(jahr, format):
+    """Mehrere Wochen (Standard: das ganze Jahr) als ein PDF oder ZIP exportieren
+
+    Query-Parameter von und bis begrenzen die Kalenderwochen. format: 'pdf'
+    (ein zusammengefügtes PDF), 'zip' (PDF je Woche) oder 'word' (DOCX je
+    Woche im ZIP). Antworten wie beim Export einer Woche.
+    """
     
-    # Einträge hinzufügen
-    for datum_str, tages_eintraege in eintraege_by_datum.items():
-        story.append(Paragraph(f"<b>{datum_str}</b>", styles['Heading2']))
-        
-        for eintrag in tages_eintraege:
-            story.append(Paragraph(f"• {eintrag.text}", styles['Normal']))
-        
-        story.append(Spacer(1, 10))
+    if current_user.role == 'mitarbeiter':
+        flash('Keine Berechtigung für Export', 'error')
+        return redirect(url_for('dashboard.index'))
     
-    # PDF generieren
-    doc.build(story)
-    buffer.seek(0)
+    letzte = wochen_export.letzte_kalenderwoche(jahr)
+    von = request.args.get('von', 1, type=int)
+    bis = request.args.get('bis', letzte, type=int)
+    if format not in wochen_export.BEREICH_FORMATE or not 1 <= von <= bis <= letzte:
+        if _will_json():
+            return jsonify({'success': False, 'error': 'Ungültiges Format oder ungültiger Zeitraum'}), 400
+        flash('Ungültiges Export-Format oder ungültiger Zeitraum', 'error')
+        return redirect(url_for('wochenbericht.wochenbericht_uebersicht'))
     
-    # Export in DB speichern
-    speichere_export(kw, jahr, f"bautagebuch_kw{kw}_{jahr}.pdf")
+    vorhanden = db.session.query(
+        BautagebuchEntry.query.filter(
+            BautagebuchEntry.jahr == jahr,
+            BautagebuchEntry.kalenderwoche.between(von, bis)
+        ).exists()
+    ).scalar()
+    if not vorhanden:
+        if _will_json():
+            return jsonify({'success': False, 'error': 'Keine Einträge zum Exportieren'}), 404
+        flash('Keine Einträge zum Exportieren', 'error')
+        return redirect(url_for('wochenbericht.wochenbericht_uebersicht'))
     
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f"bautagebuch_kw{kw}_{jahr}.pdf",
-        mimetype='application/pdf'
-    )
+    auftrag = wochen_export.starte_export(jahr, von, format, current_user, bis=bis)
+    return _auftrag_antwort(auftrag)
 
-def export_word(eintraege, kw, jahr, montag, freitag):
-    """Word Export erstellen"""
-    
-    # Word Dokument erstellen
-    doc = Document()
-    
-    # Titel
-    title = doc.add_heading(f'Bautagebuch - KW {kw}/{jahr}', 0)
-    doc.add_paragraph(f'Zeitraum: {montag.strftime("%d.%m.%Y")} bis {freitag.strftime("%d.%m.%Y")}')
-    doc.add_paragraph('')
-    
-    # Einträge nach Datum gruppieren
-    eintraege_by_datum = {}
-    for eintrag in eintraege:
-        datum_str = eintrag.datum.strftime('%d.%m.%Y')
-        if datum_str not in eintraege_by_datum:
-            eintraege_by_datum[datum_str] = []
-        eintraege_by_datum[datum_str].append(eintrag)
+@wochenbericht_bp.route('/wochenbericht/export/<auftrag_id>')
+@login_required
+def export_status(auftrag_id):
+    """Status eines Export-Auftrags (JSON oder Statusseite mit automatischer Aktualisierung)"""
     
-    # Einträge hinzufügen
-    for datum_str, tages_eintraege in eintraege_by_datum.items():
-        doc.add_heading(datum_str, level=1)
-        
-        for eintrag in tages_eintraege:
-            p = doc.add_paragraph()
-            p.add_run('• ').bold = True
-            p.add_run(eintrag.text)
-        
-        doc.add_paragraph('')
+    auftrag = _hole_auftrag(auftrag_id)
+    auftrag = wochen_export.pruefe_zeitueberschreitung(auftrag)
+    download_url = url_for('wochenbericht.export_download', auftrag_id=auftrag.id) \
+        if auftrag.status == 'fertig' else None
     
-    # In Buffer speichern
-    buffer = io.BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
+    if _will_json():
+        return jsonify({'success': True, 'job': auftrag.to_dict(), 'download_url': download_url})
+    return render_template('wochenbericht/export_status.html', auftrag=auftrag, download_url=download_url)
+
+@wochenbericht_bp.route('/wochenbericht/export/<auftrag_id>/download')
+@login_required
+def export_download(auftrag_id):
+    """Fertige Exportdatei herunterladen"""
     
-    # Export in DB speichern
-    speichere_export(kw, jahr, f"bautagebuch_kw{kw}_{jahr}.docx")
+    auftrag = _hole_auftrag(auftrag_id)
+    if auftrag.status != 'fertig' or not auftrag.datei:
+        abort(404)
+    return _sende_datei(auftrag)
+
+def _sende_datei(auftrag):
+    """Datei des Auftrags senden, mit EXPORT_X_ACCEL_PREFIX über nginx (X-Accel-Redirect)"""
+    if not wochen_export.benutze(auftrag.datei):
+        # Inzwischen aus dem Cache verdrängt
+        abort(404)
+    
+    mimetype = wochen_export.mimetype(auftrag)
+    prefix = current_app.config.get('EXPORT_X_ACCEL_PREFIX')
+    if prefix:
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + os.path.basename(auftrag.datei)
+        response.headers['Content-Type'] = mimetype
+        response.headers.set('Content-Disposition', 'attachment', filename=auftrag.dateiname)
+        response.headers['Cache-Control'] = 'private'
+        return response
     
     return send_file(
-        buffer,
+        auftrag.datei,
         as_attachment=True,
-        download_name=f"bautagebuch_kw{kw}_{jahr}.docx",
-        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        download_name=auftrag.dateiname,
+        mimetype=mimetype
     )
 
-def speichere_export(kw, jahr, dateiname):
-    """Export-Status in Datenbank speichern"""
-    
-    # Prüfen ob bereits exportiert
-    existing = WochenExport.query.filter_by(
-        kalenderwoche=kw,
-        jahr=jahr
-    ).first()
-    
-    if not existing:
-        export = WochenExport(
-            kalenderwoche=kw,
-            jahr=jahr,
-            exportiert_von=current_user.username,
-            dateiname=dateiname
-        )
-        db.session.add(export)
-        db.session.commit()
-        
-        flash(f'Wochenbericht KW {kw}/{jahr} erfolgreich exportiert!', 'success')
+def _hole_auftrag(auftrag_id):
+    """Auftrag des Benutzers (Admins sehen alle), sonst 404"""
+    if current_user.role == 'mitarbeiter':
+        abort(403)
+    auftrag = db.session.get(ExportAuftrag, auftrag_id)
+    if auftrag is None or (auftrag.user_id != current_user.id and not current_user.is_admin()):
+        abort(404)
+    return auftrag
+
+def _will_json():
+    return request.accept_mimetypes.best == 'application/json'
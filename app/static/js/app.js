@@ -779,7 +779,10 @@ function initializeCharts() {
 }
 
 function setupRealTimeUpdates() {
-    // Setup WebSocket or polling for real-time updates
+    // Live-Updates über Server-Sent Events übernimmt dashboard_live.js
+    if (window.DashboardLive) {
+        return;
+    }
     setInterval(updateDashboardStats, 30000); // Update every 30 seconds
 }
 
@@ -0,0 +1,88 @@
+/**
+ * Live-Updates der Dashboard-Kennzahlen
+ * Bautagebuch App - Borrmann Professionals
+ *
+ * Abonniert /api/dashboard/stream (Server-Sent Events) und aktualisiert alle
+ * Elemente mit data-stat="<kennzahl>". Ohne EventSource, bei abgeschaltetem
+ * Stream (204) oder nach endgültigem Verbindungsabbruch wird stattdessen
+ * /api/dashboard/stats alle 30 Sekunden abgefragt.
+ */
+
+class DashboardLive {
+    constructor() {
+        this.streamUrl = '/api/dashboard/stream';
+        this.statsUrl = '/api/dashboard/stats';
+        this.pollInterval = 30000;
+        this.stats = {};
+        this.source = null;
+        this.pollTimer = null;
+
+        if (document.readyState === 'loading') {
+            document.addEventListener('DOMContentLoaded', () => this.start());
+        } else {
+            this.start();
+        }
+    }
+
+    start() {
+        if (!document.querySelector('[data-stat]')) {
+            return;
+        }
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+
+        this.source = new EventSource(this.streamUrl);
+        this.source.addEventListener('stats', (event) => {
+            this.stats = JSON.parse(event.data);
+            this.render();
+        });
+        this.source.addEventListener('delta', (event) => {
+            const delta = JSON.parse(event.data);
+            Object.keys(delta).forEach(key => {
+                this.stats[key] = (this.stats[key] || 0) + delta[key];
+            });
+            this.render();
+        });
+        this.source.addEventListener('neu_laden', () => this.reload());
+        this.source.onerror = () => {
+            // Bei Abbrüchen verbindet sich EventSource selbst neu; CLOSED heißt
+            // endgültig (z.B. 204 bei abgeschaltetem Stream)
+            if (this.source.readyState === EventSource.CLOSED) {
+                this.source = null;
+                this.startPolling();
+            }
+        };
+    }
+
+    startPolling() {
+        if (this.pollTimer) {
+            return;
+        }
+        this.reload();
+        this.pollTimer = setInterval(() => this.reload(), this.pollInterval);
+    }
+
+    reload() {
+        fetch(this.statsUrl)
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    this.stats = data.stats;
+                    this.render();
+                }
+            })
+            .catch(error => console.error('Dashboard stats error:', error));
+    }
+
+    render() {
+        Object.keys(this.stats).forEach(key => {
+            document.querySelectorAll(`[data-stat="${key}"]`).forEach(element => {
+                element.textContent = this.stats[key];
+            });
+        });
+    }
+}
+
+window.DashboardLive = new DashboardLive();
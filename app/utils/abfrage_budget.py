@@ -0,0 +1,174 @@
+"""
+SQL-Anweisungen und Datenbankzeit je Request
+
+Über before_cursor_execute/after_cursor_execute werden je Request die Zahl
+der Anweisungen, die Datenbankzeit und wiederholte Anweisungen gleicher Form
+gezählt (Anzeichen für N+1-Abfragen). Die Form einer Anweisung ist ihr SQL
+ohne Literale, Parameterlisten und Leerraum-Unterschiede.
+
+Mit ENABLE_METRICS landen die Werte als Histogramme je Endpunkt in der
+Registry von PrometheusMetrics. Überschreitet ein Request sein Budget
+(ABFRAGE_BUDGET, je Endpunkt überschreibbar in ABFRAGE_BUDGET_ENDPUNKTE),
+wird eine Warnung mit der häufigsten Anweisungsform geloggt.
+"""
+import re
+import time
+import logging
+from collections import Counter
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Grenzen der Histogramme
+ANWEISUNGEN_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SEKUNDEN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Länge der Anweisungsform in der Warnung
+FORM_LAENGE = 2000
+
+_LITERALE = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%\(\w+\)s|:\w+|\$\d+|%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+# Histogramme je Registry, damit mehrere Apps (Tests) dieselbe Registry nutzen können
+_histogramme = {}
+
+
+def form(statement):
+    """SQL ohne Literale und Parameter: gleiche Form = gleiche Abfrage mit anderen Werten"""
+    for muster, ersatz in _LITERALE:
+        statement = muster.sub(ersatz, statement)
+    return statement.strip()
+
+
+def budget(endpunkt):
+    """{'anweisungen', 'db_zeit', 'wiederholungen'} für den Endpunkt (None = unbegrenzt)"""
+    grenzen = dict(current_app.config.get('ABFRAGE_BUDGET', {}))
+    grenzen.update(current_app.config.get('ABFRAGE_BUDGET_ENDPUNKTE', {}).get(endpunkt, {}))
+    return grenzen
+
+
+class Messung:
+    """Anweisungen eines Requests"""
+
+    def __init__(self):
+        self.anweisungen = 0
+        self.db_zeit = 0.0
+        self.formen = Counter()
+
+    @property
+    def wiederholungen(self):
+        """Anweisungen, deren Form im Request schon einmal vorkam"""
+        return sum(anzahl - 1 for anzahl in self.formen.values())
+
+    def haeufigste_form(self):
+        return self.formen.most_common(1)[0] if self.formen else (None, 0)
+
+
+def aktuelle_messung():
+    """Messung des laufenden Requests, None außerhalb eines Requests"""
+    if not has_request_context():
+        return None
+    return g.get('abfrage_messung')
+
+
+def _histogramme_fuer(registry):
+    if registry not in _histogramme:
+        from prometheus_client import Histogram
+        _histogramme[registry] = {
+            'anweisungen': Histogram(
+                'bautagebuch_request_db_statements', 'SQL-Anweisungen je Request',
+                ['endpoint'], buckets=ANWEISUNGEN_BUCKETS, registry=registry
+            ),
+            'db_zeit': Histogram(
+                'bautagebuch_request_db_seconds', 'Datenbankzeit je Request in Sekunden',
+                ['endpoint'], buckets=SEKUNDEN_BUCKETS, registry=registry
+            ),
+            'wiederholungen': Histogram(
+                'bautagebuch_request_db_repeated_statements', 'Wiederholte Anweisungsformen je Request',
+                ['endpoint'], buckets=ANWEISUNGEN_BUCKETS, registry=registry
+            ),
+        }
+    return _histogramme[registry]
+
+
+def init_app(app, metrics=None):
+    """Misst die Anweisungen jedes Requests
+
+    Args:
+        app: Flask-App
+        metrics: PrometheusMetrics der App; ohne werden nur Budgets geprüft
+    """
+    histogramme = _histogramme_fuer(metrics.registry) if metrics is not None else None
+
+    @app.before_request
+    def _starte_messung():
+        g.abfrage_messung = Messung()
+
+    @app.teardown_request
+    def _beende_messung(exc=None):
+        messung = g.pop('abfrage_messung', None)
+        if messung is None or not request.endpoint or request.endpoint == 'static':
+            return
+
+        if histogramme is not None:
+            histogramme['anweisungen'].labels(request.endpoint).observe(messung.anweisungen)
+            histogramme['db_zeit'].labels(request.endpoint).observe(messung.db_zeit)
+            histogramme['wiederholungen'].labels(request.endpoint).observe(messung.wiederholungen)
+
+        _pruefe_budget(request.endpoint, messung)
+
+
+def _pruefe_budget(endpunkt, messung):
+    grenzen = budget(endpunkt)
+    ueberschritten = [
+        f'{name} {wert:g} > {grenzen[name]:g}'
+        for name, wert in (
+            ('anweisungen', messung.anweisungen),
+            ('db_zeit', messung.db_zeit),
+            ('wiederholungen', messung.wiederholungen),
+        )
+        if grenzen.get(name) is not None and wert > grenzen[name]
+    ]
+    if ueberschritten:
+        haeufigste, anzahl = messung.haeufigste_form()
+        logger.warning(
+            "Abfrage-Budget von %s überschritten (%s); häufigste Anweisung (%dx): %s",
+            endpunkt, ', '.join(ueberschritten), anzahl, (haeufigste or '')[:FORM_LAENGE]
+        )
+
+
+# ----------------------------------------------------------------------
+# Anweisungen zählen
+# ----------------------------------------------------------------------
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _vor_anweisung(conn, cursor, statement, parameters, context, executemany):
+    if aktuelle_messung() is not None:
+        conn.info.setdefault('abfrage_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _nach_anweisung(conn, cursor, statement, parameters, context, executemany):
+    messung = aktuelle_messung()
+    starts = conn.info.get('abfrage_start')
+    if messung is None or not starts:
+        return
+    messung.db_zeit += time.perf_counter() - starts.pop()
+    messung.anweisungen += 1
+    messung.formen[form(statement)] += 1
+
+
+@event.listens_for(Engine, 'handle_error')
+def _anweisung_fehlgeschlagen(kontext):
+    # after_cursor_execute entfällt, Startzeit verwerfen
+    if kontext.connection is not None:
+        starts = kontext.connection.info.get('abfrage_start')
+        if starts:
+            starts.pop()
@@ -0,0 +1,236 @@
+"""
+Vektorisierte Ähnlichkeitsbewertung für die Duplikatserkennung
+
+Berechnet denselben gewichteten Score wie DuplikatsPruefer._berechne_aehnlichkeit
+(Datum 0.3, Ort 0.25, Material 0.25, Mitarbeiter 0.15, Menge 0.05), jedoch für
+einen ganzen Block von Kandidatenpaaren in einem Durchlauf mit NumPy.
+"""
+from collections import namedtuple
+import numpy as np
+from app import db
+from app.models.aufmass import AufmassEntry
+from app.models.material import Material
+from app.models.user import User
+
+# Gewichtungen in derselben Reihenfolge wie in der skalaren Berechnung,
+# damit die Gleitkomma-Summen bitgenau übereinstimmen
+MAX_SCORE = sum((0.3, 0.25, 0.25, 0.15, 0.05))
+
+EIN_TAG = np.timedelta64(1, 'D')
+
+
+class AufmassZeile(namedtuple('AufmassZeile', ['id', 'datum', 'ort', 'material', 'mitarbeiter', 'menge'])):
+    """Schlanke Projektion eines Aufmaßes für die Duplikatserkennung.
+
+    material und mitarbeiter enthalten bereits den Material- bzw.
+    Benutzernamen, es werden keine Beziehungen nachgeladen.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def aus_eintrag(cls, aufmass):
+        """Erstellt die Projektion aus einem AufmassEntry-Objekt"""
+        return cls(aufmass.id, aufmass.datum, aufmass.ort,
+                   aufmass.material.name, aufmass.mitarbeiter.username, aufmass.menge)
+
+
+def lade_aufmass_zeilen(*kriterien):
+    """Lädt Aufmaße als AufmassZeile mit einer einzigen Abfrage.
+
+    Sortierung wie in der Duplikatserkennung: Datum absteigend, bei
+    gleichem Datum die höhere ID zuerst.
+    """
+    query = db.session.query(
+        AufmassEntry.id,
+        AufmassEntry.datum,
+        AufmassEntry.ort,
+        Material.name,
+        User.username,
+        AufmassEntry.menge
+    ).join(
+        Material, AufmassEntry.material_id == Material.id
+    ).join(
+        User, AufmassEntry.mitarbeiter_id == User.id
+    ).filter(
+        *kriterien
+    ).order_by(
+        AufmassEntry.datum.desc(),
+        AufmassEntry.id.desc()
+    )
+    return [AufmassZeile._make(row) for row in query]
+
+
+class Kodierung:
+    """Interniert Texte (kleingeschrieben) als fortlaufende Integer-Codes"""
+
+    def __init__(self):
+        self.codes = {}
+        self.texte = []
+
+    def code(self, text):
+        text = text.lower()
+        code = self.codes.get(text)
+        if code is None:
+            code = len(self.texte)
+            self.codes[text] = code
+            self.texte.append(text)
+        return code
+
+    def __len__(self):
+        return len(self.texte)
+
+    def enthaltensmatrix(self, codes_a, codes_b):
+        """Prüft für jedes Paar, ob ein Text im anderen enthalten ist.
+
+        Die Prüfung erfolgt nur einmal je eindeutigem Code-Paar des Blocks,
+        nicht für alle Kombinationen der Kodierung.
+        """
+        if len(codes_a) == 0:
+            return np.zeros(0, dtype=bool)
+
+        schluessel = codes_a.astype(np.int64) * len(self) + codes_b
+        eindeutig, rueckverweis = np.unique(schluessel, return_inverse=True)
+
+        texte = self.texte
+        enthalten = np.fromiter(
+            (
+                texte[a] in texte[b] or texte[b] in texte[a]
+                for a, b in zip(*np.divmod(eindeutig, len(self)))
+            ),
+            dtype=bool,
+            count=len(eindeutig)
+        )
+        return enthalten[rueckverweis]
+
+
+class AufmassSpalten:
+    """Spaltenweise Darstellung von Aufmaßen für die Bewertung"""
+
+    def __init__(self, ids, daten, orte, materialien, mitarbeiter, mengen,
+                 ort_kodierung, material_kodierung):
+        self.ids = ids
+        self.daten = daten
+        self.orte = orte
+        self.materialien = materialien
+        self.mitarbeiter = mitarbeiter
+        self.mengen = mengen
+        self.ort_kodierung = ort_kodierung
+        self.material_kodierung = material_kodierung
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def aus_zeilen(cls, zeilen):
+        """Erstellt die Spalten aus einer Liste von AufmassZeile-Projektionen"""
+        ort_kodierung = Kodierung()
+        material_kodierung = Kodierung()
+        mitarbeiter_kodierung = Kodierung()
+
+        anzahl = len(zeilen)
+        return cls(
+            ids=np.fromiter((z.id for z in zeilen), dtype=np.int64, count=anzahl),
+            daten=np.array([_ohne_zeitzone(z.datum) for z in zeilen], dtype='datetime64[us]'),
+            orte=np.fromiter((ort_kodierung.code(z.ort) for z in zeilen), dtype=np.int32, count=anzahl),
+            materialien=np.fromiter((material_kodierung.code(z.material) for z in zeilen), dtype=np.int32, count=anzahl),
+            mitarbeiter=np.fromiter((mitarbeiter_kodierung.code(z.mitarbeiter) for z in zeilen), dtype=np.int32, count=anzahl),
+            mengen=np.fromiter((z.menge for z in zeilen), dtype=np.float64, count=anzahl),
+            ort_kodierung=ort_kodierung,
+            material_kodierung=material_kodierung
+        )
+
+    def berechne_scores(self, idx_a, idx_b):
+        """Berechnet den Ähnlichkeitswert für alle Paare (idx_a[k], idx_b[k])"""
+        idx_a = np.asarray(idx_a, dtype=np.int64)
+        idx_b = np.asarray(idx_b, dtype=np.int64)
+
+        # Datum (Gewichtung: 0.3)
+        datum_diff = np.abs((self.daten[idx_a] - self.daten[idx_b]) // EIN_TAG)
+        datum = np.select(
+            [datum_diff == 0, datum_diff <= 1, datum_diff <= 7],
+            [0.3, 0.2, 0.1],
+            default=0.0
+        )
+
+        # Ort (Gewichtung: 0.25)
+        ort_a, ort_b = self.orte[idx_a], self.orte[idx_b]
+        ort_gleich = ort_a == ort_b
+        ort = np.where(ort_gleich, 0.25, 0.0)
+        offen = ~ort_gleich
+        ort[offen] = np.where(
+            self.ort_kodierung.enthaltensmatrix(ort_a[offen], ort_b[offen]), 0.15, 0.0
+        )
+
+        # Material (Gewichtung: 0.25)
+        material_a, material_b = self.materialien[idx_a], self.materialien[idx_b]
+        material_gleich = material_a == material_b
+        material = np.where(material_gleich, 0.25, 0.0)
+        offen = ~material_gleich
+        material[offen] = np.where(
+            self.material_kodierung.enthaltensmatrix(material_a[offen], material_b[offen]), 0.15, 0.0
+        )
+
+        # Mitarbeiter (Gewichtung: 0.15)
+        mitarbeiter = np.where(self.mitarbeiter[idx_a] == self.mitarbeiter[idx_b], 0.15, 0.0)
+
+        # Menge (Gewichtung: 0.05)
+        menge_a, menge_b = self.mengen[idx_a], self.mengen[idx_b]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relativ = np.abs(menge_a - menge_b) / np.maximum(menge_a, menge_b)
+        menge = np.select([menge_a == menge_b, relativ <= 0.1], [0.05, 0.025], default=0.0)
+
+        score = 0.0 + datum
+        score = score + ort
+        score = score + material
+        score = score + mitarbeiter
+        score = score + menge
+        return score / MAX_SCORE
+
+
+def packe_paare(ids_a, ids_b):
+    """Packt Paare wie DuplikatAusnahme.packe, vektorisiert über ID-Arrays"""
+    ids_a = np.asarray(ids_a, dtype=np.int64)
+    ids_b = np.asarray(ids_b, dtype=np.int64)
+    return (np.minimum(ids_a, ids_b) << 32) | np.maximum(ids_a, ids_b)
+
+
+def _ohne_zeitzone(datum):
+    """NumPy kennt keine Zeitzonen; UTC-Werte werden naiv übernommen"""
+    return datum.replace(tzinfo=None) if datum.tzinfo else datum
+
+
+class DisjunkteMengen:
+    """Union-Find über beliebige hashbare Elemente (z.B. Aufmaß-IDs)"""
+
+    def __init__(self):
+        self.eltern = {}
+        self.groesse = {}
+
+    def finde(self, element):
+        """Liefert den Repräsentanten der Menge, mit Pfadkompression"""
+        eltern = self.eltern
+        if element not in eltern:
+            eltern[element] = element
+            self.groesse[element] = 1
+            return element
+
+        wurzel = element
+        while eltern[wurzel] != wurzel:
+            wurzel = eltern[wurzel]
+        while eltern[element] != wurzel:
+            eltern[element], element = wurzel, eltern[element]
+        return wurzel
+
+    def vereinige(self, a, b):
+        """Vereinigt die Mengen von a und b (kleinere unter größere)"""
+        wurzel_a, wurzel_b = self.finde(a), self.finde(b)
+        if wurzel_a == wurzel_b:
+            return wurzel_a
+        if self.groesse[wurzel_a] < self.groesse[wurzel_b]:
+            wurzel_a, wurzel_b = wurzel_b, wurzel_a
+        self.eltern[wurzel_b] = wurzel_a
+        self.groesse[wurzel_a] += self.groesse.pop(wurzel_b)
+        return wurzel_a
+
+    def anzahl_mengen(self):
+        return len(self.groesse)
@@ -0,0 +1,202 @@
+"""
+Cache für Dashboard-Kennzahlen je Benutzer
+
+Einträge werden unter (Endpunkt, Rolle, Benutzer) und der aktuellen
+Daten-Generation abgelegt. Schreibvorgänge auf Aufmaße, Materialien und
+Benutzer markieren die Session (after_insert/after_update/after_delete);
+nach dem Commit wird die Generation erhöht, so dass alle älteren Einträge
+ungültig sind. Anmeldungen (last_login) haben eine eigene Generation
+"anmeldungen", damit Logins die Kennzahlen nicht verwerfen. Die Gültigkeit hängt damit nicht an einer Ablaufzeit, der
+Timeout begrenzt nur den Speicher für verwaiste Einträge.
+
+Die Generation erreicht die anderen Worker nur über einen geteilten Cache
+(Redis). Mit einem prozesslokalen Cache (siehe geteilter_cache) rechnen
+hole() und hole_mit_hintergrund() daher bei jedem Aufruf neu.
+
+Für teure, benutzerunabhängige Kennzahlen (Admin-Dashboards) gibt es
+zusätzlich hole_mit_hintergrund: Der letzte berechnete Wert wird sofort
+geliefert und, wenn er älter als DASHBOARD_SWR_FRISCH Sekunden ist oder
+aus einer älteren Generation stammt, in einem Hintergrund-Thread neu
+berechnet (stale-while-revalidate). Eine Sperre im geteilten Cache sorgt
+dafür, dass über alle Worker nur einer gleichzeitig rechnet.
+"""
+import time
+import logging
+import threading
+from flask import current_app, has_app_context
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from app import cache
+from app.models.aufmass import AufmassEntry
+from app.models.material import Material
+from app.models.user import User
+from app.utils import geteilter_cache
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'dashboard:generation'
+BEREICH_GENERATION_KEY = 'dashboard:generation:{bereich}'
+EINTRAG_KEY = 'dashboard:{endpunkt}:{generation}:{rolle}:{user_id}'
+
+HINTERGRUND_KEY = 'dashboard:hintergrund:{name}'
+
+# Nur Speicherbegrenzung; veraltete Einträge erkennt die Generation
+EINTRAG_TIMEOUT = 24 * 3600
+
+# Gibt die Sperre frei, falls ein Worker während der Berechnung abbricht
+SPERRE_TIMEOUT = 300
+
+
+def _generation_key(bereich):
+    return GENERATION_KEY if bereich == 'daten' else BEREICH_GENERATION_KEY.format(bereich=bereich)
+
+
+def generation(bereich='daten'):
+    """Aktuelle Generation des Bereichs (ändert sich nach jedem relevanten Commit)
+
+    Args:
+        bereich: 'daten' (Aufmaße, Materialien, Benutzer) oder 'anmeldungen'
+    """
+    schluessel = _generation_key(bereich)
+    wert = cache.get(schluessel)
+    if wert is None:
+        # Fehlt der Zähler (neu, verdrängt oder abgelaufen), beginnt er bei der
+        # aktuellen Zeit in µs, damit sich Generationen nie wiederholen
+        cache.add(schluessel, time.time_ns() // 1000, timeout=0)
+        wert = cache.get(schluessel)
+    return wert
+
+
+def erhoehe_generation(bereich='daten'):
+    """Macht alle gecachten Werte des Bereichs ungültig"""
+    schluessel = _generation_key(bereich)
+    try:
+        cache.add(schluessel, time.time_ns() // 1000, timeout=0)
+        cache.cache.inc(schluessel)
+    except Exception:
+        logger.exception("Generation %s des Dashboard-Cache nicht erreichbar", bereich)
+
+
+def hole(endpunkt, berechne, user=None):
+    """Liefert den gecachten Wert für den Benutzer oder berechnet ihn neu
+
+    Args:
+        endpunkt: Name des Endpunkts (Teil des Schlüssels)
+        berechne: Funktion ohne Argumente, liefert einen picklebaren Wert
+        user: Benutzer für den Schlüssel (Standard: current_user)
+    """
+    if not geteilter_cache.ist_geteilt():
+        # Andere Worker sähen die neue Generation nach einem Commit nicht
+        return berechne()
+
+    user = user or current_user
+    aktuelle_generation = generation()
+    if aktuelle_generation is None:
+        # Kein Cache verfügbar (z.B. NullCache)
+        return berechne()
+
+    schluessel = EINTRAG_KEY.format(
+        endpunkt=endpunkt, generation=aktuelle_generation, rolle=user.role, user_id=user.id
+    )
+    wert = cache.get(schluessel)
+    if wert is None:
+        wert = berechne()
+        cache.set(schluessel, wert, timeout=EINTRAG_TIMEOUT)
+    return wert
+
+
+def hole_mit_hintergrund(name, berechne):
+    """Liefert den letzten Wert sofort und aktualisiert ihn bei Bedarf im Hintergrund
+
+    Nur beim ersten Aufruf (kein Wert im Cache) wird synchron gerechnet.
+    Ist der Cache prozesslokal, wird immer synchron gerechnet: Sperre und
+    Generation gälten nur für den eigenen Worker.
+
+    Args:
+        name: Name der Kennzahlen (Teil des Schlüssels)
+        berechne: Funktion ohne Argumente, braucht nur einen App-Kontext
+            (kein current_user, kein Request) und liefert einen picklebaren Wert
+    """
+    if not geteilter_cache.ist_geteilt():
+        return berechne()
+
+    schluessel = HINTERGRUND_KEY.format(name=name)
+    aktuelle_generation = generation()
+    eintrag = cache.get(schluessel)
+
+    if eintrag is None:
+        wert = berechne()
+        cache.set(schluessel, {'wert': wert, 'zeit': time.time(), 'generation': aktuelle_generation},
+                  timeout=EINTRAG_TIMEOUT)
+        return wert
+
+    frisch = current_app.config.get('DASHBOARD_SWR_FRISCH', 60)
+    veraltet = time.time() - eintrag['zeit'] > frisch or eintrag['generation'] != aktuelle_generation
+    if veraltet and cache.add(f'{schluessel}:sperre', 1, timeout=SPERRE_TIMEOUT):
+        app = current_app._get_current_object()
+        threading.Thread(
+            target=_berechne_im_hintergrund, args=(app, schluessel, berechne),
+            name=f'dashboard-swr:{name}', daemon=True
+        ).start()
+    return eintrag['wert']
+
+
+def _berechne_im_hintergrund(app, schluessel, berechne):
+    with app.app_context():
+        try:
+            # Generation vor dem Rechnen merken: Schreibvorgänge währenddessen
+            # lösen beim nächsten Aufruf eine weitere Aktualisierung aus
+            aktuelle_generation = generation()
+            wert = berechne()
+            cache.set(schluessel, {'wert': wert, 'zeit': time.time(), 'generation': aktuelle_generation},
+                      timeout=EINTRAG_TIMEOUT)
+        except Exception:
+            logger.exception("Hintergrund-Aktualisierung von %s fehlgeschlagen", schluessel)
+        finally:
+            cache.delete(f'{schluessel}:sperre')
+
+
+# ----------------------------------------------------------------------
+# Schreibvorgänge markieren, Generation nach dem Commit erhöhen
+# ----------------------------------------------------------------------
+
+def _markiere(target, bereich):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('dashboard_cache_ungueltig', set()).add(bereich)
+
+
+def _markiere_session(mapper, connection, target):
+    _markiere(target, 'daten')
+
+
+def _markiere_benutzer(mapper, connection, target):
+    # Logins aktualisieren nur last_login, das betrifft allein die Anmeldungen
+    attrs = inspect(target).attrs
+    if any(getattr(attrs, feld).history.has_changes() for feld in ('username', 'role', 'is_active')):
+        _markiere(target, 'daten')
+    if attrs.last_login.history.has_changes():
+        _markiere(target, 'anmeldungen')
+
+
+for _modell in (AufmassEntry, Material):
+    for _ereignis in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_modell, _ereignis, _markiere_session)
+
+event.listen(User, 'after_insert', _markiere_session)
+event.listen(User, 'after_update', _markiere_benutzer)
+event.listen(User, 'after_delete', _markiere_session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidiere_nach_commit(session):
+    bereiche = session.info.pop('dashboard_cache_ungueltig', ())
+    if has_app_context():
+        for bereich in bereiche:
+            erhoehe_generation(bereich)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _verwerfe_markierung(session):
+    session.info.pop('dashboard_cache_ungueltig', None)
@@ -0,0 +1,200 @@
+"""
+Live-Updates der Dashboard-Zähler über Server-Sent Events
+
+Nach jedem Commit werden die Änderungen der Tagesstatistik (Tag,
+Mitarbeiter, Anzahl) veröffentlicht. Änderungen an Materialien lösen ein
+"neu_laden" aus. Jede offene Verbindung von /api/dashboard/stream hat ein
+Abo mit eigener Warteschlange und rechnet die Änderungen in Zähler-Deltas
+für ihren Benutzer um (siehe zaehler_delta).
+
+Verteilt wird mit Redis Pub/Sub über alle Worker-Prozesse, wenn
+DASHBOARD_EVENTS_REDIS_URL gesetzt ist, sonst nur innerhalb des Prozesses
+(Entwicklung, Tests).
+"""
+import json
+import time
+import queue
+import logging
+import threading
+from collections import defaultdict
+from datetime import date
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app.models.material import Material
+from app.utils.dashboard_statistik import DashboardStatistik
+
+logger = logging.getLogger(__name__)
+
+REDIS_KANAL = 'dashboard:ereignisse'
+
+# Nachrichten je Abo, bevor der Client stattdessen ein "neu_laden" erhält
+ABO_GROESSE = 100
+
+
+class Abo:
+    """Warteschlange einer Stream-Verbindung"""
+
+    def __init__(self):
+        self.nachrichten = queue.Queue(maxsize=ABO_GROESSE)
+        self.ueberlauf = False
+
+    def hole(self, timeout):
+        """Nächste Nachricht oder None nach timeout Sekunden"""
+        try:
+            return self.nachrichten.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def leere(self):
+        """Verwirft alle wartenden Nachrichten (nach einem Überlauf)"""
+        self.ueberlauf = False
+        while True:
+            try:
+                self.nachrichten.get_nowait()
+            except queue.Empty:
+                return
+
+
+class DashboardBroadcaster:
+    """Verteilt Nachrichten an alle Abos dieses Prozesses"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.abos = set()
+
+    def abonniere(self, max_abos=None):
+        """Neues Abo oder None, wenn bereits max_abos Abos bestehen"""
+        abo = Abo()
+        with self.lock:
+            if max_abos is not None and len(self.abos) >= max_abos:
+                return None
+            self.abos.add(abo)
+        return abo
+
+    def kuendige(self, abo):
+        with self.lock:
+            self.abos.discard(abo)
+
+    def verteile(self, nachricht):
+        with self.lock:
+            abos = list(self.abos)
+        for abo in abos:
+            try:
+                abo.nachrichten.put_nowait(nachricht)
+            except queue.Full:
+                abo.ueberlauf = True
+
+    def veroeffentliche(self, nachricht):
+        self.verteile(nachricht)
+
+
+class RedisDashboardBroadcaster(DashboardBroadcaster):
+    """Veröffentlicht über Redis Pub/Sub; ein Lausch-Thread je Prozess verteilt lokal"""
+
+    def __init__(self, url):
+        super().__init__()
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.thread = None
+
+    def abonniere(self, max_abos=None):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._lausche, name='dashboard-events', daemon=True)
+                self.thread.start()
+        return super().abonniere(max_abos)
+
+    def veroeffentliche(self, nachricht):
+        try:
+            self.redis.publish(REDIS_KANAL, json.dumps(nachricht))
+        except Exception:
+            logger.exception("Dashboard-Ereignis konnte nicht über Redis veröffentlicht werden")
+            self.verteile(nachricht)
+
+    def _lausche(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(REDIS_KANAL)
+                for meldung in pubsub.listen():
+                    self.verteile(json.loads(meldung['data']))
+            except Exception:
+                logger.exception("Verbindung zum Redis-Kanal %s unterbrochen", REDIS_KANAL)
+                time.sleep(5)
+
+
+def get_broadcaster():
+    """Liefert den Broadcaster der aktuellen App (einer je Prozess)"""
+    broadcaster = current_app.extensions.get('dashboard_events')
+    if broadcaster is None:
+        url = current_app.config.get('DASHBOARD_EVENTS_REDIS_URL')
+        broadcaster = RedisDashboardBroadcaster(url) if url else DashboardBroadcaster()
+        broadcaster = current_app.extensions.setdefault('dashboard_events', broadcaster)
+    return broadcaster
+
+
+def zaehler_delta(deltas, mitarbeiter_id=None, heute=None):
+    """Rechnet [(tag, mitarbeiter_id, anzahl)] in Deltas der /api/dashboard/stats-Zähler um
+
+    Args:
+        mitarbeiter_id: Nur Änderungen dieses Mitarbeiters (None = alle)
+    """
+    tage = DashboardStatistik.zeitraeume(heute)
+    ergebnis = defaultdict(int)
+    for tag, aufmass_mitarbeiter_id, anzahl in deltas:
+        if mitarbeiter_id is not None and aufmass_mitarbeiter_id != mitarbeiter_id:
+            continue
+        if isinstance(tag, str):
+            tag = date.fromisoformat(tag)
+        ergebnis['total_entries'] += anzahl
+        if tag == tage['heute']:
+            ergebnis['entries_today'] += anzahl
+        if tag >= tage['woche']:
+            ergebnis['entries_this_week'] += anzahl
+        if tag >= tage['monat']:
+            ergebnis['entries_this_month'] += anzahl
+        if tag >= tage['sieben_tage']:
+            ergebnis['recent_entries'] += anzahl
+    return {name: wert for name, wert in ergebnis.items() if wert}
+
+
+def sse(ereignis, daten):
+    """Formatiert ein Server-Sent Event"""
+    return f"event: {ereignis}\ndata: {json.dumps(daten)}\n\n"
+
+
+# ----------------------------------------------------------------------
+# Änderungen nach dem Commit veröffentlichen
+# ----------------------------------------------------------------------
+
+def _markiere_material(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['dashboard_materialien_geaendert'] = True
+
+
+for _ereignis in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Material, _ereignis, _markiere_material)
+
+
+@event.listens_for(Session, 'after_commit')
+def _veroeffentliche_aenderungen(session):
+    deltas = session.info.pop('tagesstatistik_deltas', None)
+    materialien = session.info.pop('dashboard_materialien_geaendert', False)
+    if not has_app_context() or not current_app.config.get('DASHBOARD_SSE_ENABLED', True):
+        return
+
+    if deltas:
+        get_broadcaster().veroeffentliche({
+            'art': 'aufmass',
+            'deltas': [(tag.isoformat(), mitarbeiter_id, anzahl) for tag, mitarbeiter_id, anzahl in deltas]
+        })
+    if materialien:
+        get_broadcaster().veroeffentliche({'art': 'neu_laden'})
+
+
+@event.listens_for(Session, 'after_rollback')
+def _verwerfe_aenderungen(session):
+    session.info.pop('tagesstatistik_deltas', None)
+    session.info.pop('dashboard_materialien_geaendert', None)
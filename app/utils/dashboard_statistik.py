@@ -0,0 +1,146 @@
+"""
+Kennzahlen für die Dashboards und /api/dashboard/stats
+
+Alle Zähler einer Seite entstehen in einer einzigen SELECT-Anweisung:
+Zeiträume über SUM(CASE WHEN ...) auf der Tagesstatistik, Benutzer- und
+Materialzahlen als skalare Unterabfragen. Die Top-Listen (Mitarbeiter und
+Materialien) kommen gemeinsam aus einer zweiten Abfrage per UNION ALL.
+
+Die Gesamtzahl aller Aufmaße kommt aus der Zählerzeile (AufmassGesamtzahl);
+die Zeitraum-Summen lesen dann nur die Tageszeilen ab dem frühesten
+Zeitraum über den Primärschlüssel.
+"""
+from datetime import timedelta
+from sqlalchemy import select, func, case, literal, cast, Float, union_all
+from app import db
+from app.models.duplikat import DuplikatKandidat
+from app.models.material import Material
+from app.models.statistik import AufmassTagesstatistik, AufmassGesamtzahl
+from app.models.user import User
+from app.utils import zeitraum
+from app.utils.zeitraum import zeitraum_bedingungen
+
+# Rollen, die im Admin-Dashboard gezählt werden (siehe User.has_role)
+ROLLEN = ('admin', 'bauleiter', 'mitarbeiter')
+
+
+class DashboardStatistik:
+    """Zähler und Top-Listen aus der Tagesstatistik"""
+
+    @staticmethod
+    def zeitraeume(heute=None):
+        """Erster Tag der Zeiträume heute, Woche (ab Montag), Monat und letzte 7 Tage"""
+        heute = heute or zeitraum.heute()
+        return {
+            'heute': heute,
+            'woche': zeitraum.wochenanfang(heute),
+            'monat': heute.replace(day=1),
+            'sieben_tage': heute - timedelta(days=7),
+        }
+
+    @classmethod
+    def zaehler(cls, mitarbeiter_id=None, heute=None, system=False):
+        """Alle skalaren Kennzahlen mit einer Abfrage
+
+        Args:
+            mitarbeiter_id: Nur Aufmaße dieses Mitarbeiters zählen
+            heute: Bezugstag (Standard: heute in UTC)
+            system: Zusätzlich Benutzer- und Rollenzahlen für das Admin-Dashboard
+
+        Returns:
+            dict: gesamt_aufmasse, aufmasse_heute, aufmasse_woche, aufmasse_monat,
+            aufmasse_7_tage, gesamt_materialien, aktive_materialien und mit
+            system=True gesamt_benutzer, aktive_benutzer und rollen
+        """
+        r = AufmassTagesstatistik
+        tage = cls.zeitraeume(heute)
+
+        if mitarbeiter_id is None:
+            # Gesamtzahl aus der Zählerzeile, ohne Zeile über alle Tageszeilen
+            gesamt = func.coalesce(
+                AufmassGesamtzahl.anzahl_abfrage(),
+                select(func.coalesce(func.sum(r.anzahl), 0)).scalar_subquery()
+            )
+        else:
+            gesamt = func.coalesce(func.sum(r.anzahl), 0)
+
+        def im_zeitraum(bedingung):
+            return func.coalesce(func.sum(case((bedingung, r.anzahl), else_=0)), 0)
+
+        spalten = [
+            gesamt.label('gesamt_aufmasse'),
+            im_zeitraum(r.tag == tage['heute']).label('aufmasse_heute'),
+            im_zeitraum(r.tag >= tage['woche']).label('aufmasse_woche'),
+            im_zeitraum(r.tag >= tage['monat']).label('aufmasse_monat'),
+            im_zeitraum(r.tag >= tage['sieben_tage']).label('aufmasse_7_tage'),
+            select(func.count(Material.id)).scalar_subquery().label('gesamt_materialien'),
+            select(func.count(Material.id)).where(Material.is_active == True).scalar_subquery().label('aktive_materialien'),
+        ]
+        if system:
+            spalten += [
+                select(func.count(User.id)).scalar_subquery().label('gesamt_benutzer'),
+                select(func.count(User.id)).where(User.is_active == True).scalar_subquery().label('aktive_benutzer'),
+            ] + [
+                select(func.count(User.id)).where(User.role == rolle).scalar_subquery().label(f'rolle_{rolle}')
+                for rolle in ROLLEN
+            ]
+
+        abfrage = select(*spalten).select_from(r)
+        if mitarbeiter_id is not None:
+            abfrage = abfrage.where(r.mitarbeiter_id == mitarbeiter_id)
+        else:
+            abfrage = abfrage.where(r.tag >= min(tage.values()))
+
+        zeile = db.session.execute(abfrage).mappings().one()
+        ergebnis = {name: int(wert or 0) for name, wert in zeile.items() if not name.startswith('rolle_')}
+        if system:
+            ergebnis['rollen'] = [(rolle, zeile[f'rolle_{rolle}']) for rolle in ROLLEN if zeile[f'rolle_{rolle}']]
+        return ergebnis
+
+    @classmethod
+    def system_kennzahlen(cls):
+        """Zähler mit system=True und die Anzahl verdächtiger Duplikat-Gruppen
+
+        Unabhängig vom Benutzer, daher für beide Admin-Dashboards gemeinsam
+        im Hintergrund gecacht (siehe dashboard_cache.hole_mit_hintergrund).
+        """
+        kennzahlen = cls.zaehler(system=True)
+        kennzahlen['verdaechtige_duplikate'] = DuplikatKandidat.anzahl_gruppen()
+        return kennzahlen
+
+    @staticmethod
+    def top_listen(von=None, bis=None, limit=5):
+        """Top-Mitarbeiter (Anzahl) und Top-Materialien (Menge) mit einer Abfrage
+
+        Returns:
+            dict: aktive_mitarbeiter [(username, anzahl)] und
+            top_materialien [(material_name, gesamt_menge)]
+        """
+        r = AufmassTagesstatistik
+        bedingungen = zeitraum_bedingungen(r.tag, von, bis)
+
+        anzahl = cast(func.sum(r.anzahl), Float)
+        mitarbeiter = select(
+            literal('mitarbeiter').label('liste'), User.username.label('name'), anzahl.label('wert')
+        ).join(User, User.id == r.mitarbeiter_id).where(*bedingungen).group_by(
+            User.id, User.username
+        ).order_by(anzahl.desc()).limit(limit).subquery()
+
+        menge = func.sum(r.menge_summe)
+        materialien = select(
+            literal('material').label('liste'), Material.name.label('name'), menge.label('wert')
+        ).join(Material, Material.id == r.material_id).where(*bedingungen).group_by(
+            Material.id, Material.name
+        ).order_by(menge.desc()).limit(limit).subquery()
+
+        ergebnis = {'aktive_mitarbeiter': [], 'top_materialien': []}
+        for liste, name, wert in db.session.execute(union_all(select(mitarbeiter), select(materialien))):
+            if liste == 'mitarbeiter':
+                ergebnis['aktive_mitarbeiter'].append((name, int(wert)))
+            else:
+                ergebnis['top_materialien'].append((name, wert))
+
+        # UNION ALL garantiert keine Reihenfolge
+        ergebnis['aktive_mitarbeiter'].sort(key=lambda e: e[1], reverse=True)
+        ergebnis['top_materialien'].sort(key=lambda e: e[1], reverse=True)
+        return ergebnis
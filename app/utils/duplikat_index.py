@@ -0,0 +1,316 @@
+"""
+Live-Duplikatsindex für die Prüfung während der Eingabe
+
+Hält alle aktiven Aufmaße je (material_id, Tag) mit normalisiertem Ort im
+Speicher, damit /aufmass/api/check_duplicate und /duplikate/api/duplikate/check
+ohne Datenbankabfrage antworten. Änderungen an Aufmaßen, Materialien und
+Benutzern werden beim Flush gesammelt und nach dem Commit über ein Journal
+im App-Cache veröffentlicht. Jeder Prozess spielt das Journal vor einer
+Abfrage nach; fehlen Journal-Einträge, wird der Index neu aufgebaut.
+
+Das Journal hält die Worker nur mit einem geteilten Cache (Redis) synchron.
+Mit einem prozesslokalen Cache liefert get_live_index() stattdessen eine
+DatenbankSuche mit derselben Schnittstelle.
+"""
+import re
+import time
+import logging
+import threading
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session
+from app import db, cache
+from app.models.aufmass import AufmassEntry
+from app.models.material import Material
+from app.models.user import User
+from app.utils import geteilter_cache
+
+logger = logging.getLogger(__name__)
+
+# Cache-Schlüssel des Änderungsjournals
+JOURNAL_SEQ_KEY = 'duplikat_index:seq'
+JOURNAL_KEY = 'duplikat_index:aenderung:{}'
+
+# Aufbewahrung der Journal-Einträge (Sekunden); ältere Lücken erzwingen einen Neuaufbau
+JOURNAL_TIMEOUT = 24 * 3600
+
+# Ab so vielen ausstehenden Journal-Einträgen ist ein Neuaufbau günstiger
+JOURNAL_MAX_LUECKE = 1000
+
+IndexEintrag = namedtuple('IndexEintrag', ['id', 'material_id', 'mitarbeiter_id', 'datum', 'ort', 'ort_norm', 'menge', 'einheit'])
+
+
+def normalisiere_ort(ort):
+    """Kleingeschriebene Wort-Tokens des Orts, durch Leerzeichen getrennt"""
+    return ' '.join(re.findall(r'\w+', (ort or '').lower()))
+
+
+class LiveDuplikatIndex:
+    """Aufmaße je (material_id, Tag) mit normalisiertem Ort"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.geladen = False
+        self.seq = 0
+        self.buckets = defaultdict(dict)
+        self.position = {}
+        self.materialien = {}
+        self.benutzer = {}
+
+    # ------------------------------------------------------------------
+    # Abfragen
+    # ------------------------------------------------------------------
+
+    def suche(self, material_id, tag, ort):
+        """Einträge am Tag mit dem Material, deren Ort den gesuchten Ort enthält"""
+        ort_norm = normalisiere_ort(ort)
+        if not ort_norm:
+            return []
+
+        with self.lock:
+            self._synchronisiere()
+            return [
+                eintrag for eintrag in self.buckets.get((material_id, tag), {}).values()
+                if ort_norm in eintrag.ort_norm
+            ]
+
+    def suche_aehnliche(self, material, ort, tag, tage=1, limit=5):
+        """Einträge ±tage um den Tag, deren Material und Ort die Suchbegriffe enthalten
+
+        Liefert höchstens limit Einträge, neueste zuerst.
+        """
+        material = (material or '').lower()
+        ort_norm = normalisiere_ort(ort)
+        if not material or not ort_norm:
+            return []
+
+        with self.lock:
+            self._synchronisiere()
+            material_ids = [
+                material_id for material_id, name in self.materialien.items()
+                if material in name.lower()
+            ]
+            treffer = [
+                eintrag
+                for material_id in material_ids
+                for abstand in range(-tage, tage + 1)
+                for eintrag in self.buckets.get((material_id, tag + timedelta(days=abstand)), {}).values()
+                if ort_norm in eintrag.ort_norm
+            ]
+
+        treffer.sort(key=lambda e: (e.datum, e.id), reverse=True)
+        return treffer[:limit]
+
+    def material_name(self, material_id):
+        return self.materialien.get(material_id)
+
+    def benutzername(self, user_id):
+        return self.benutzer.get(user_id)
+
+    # ------------------------------------------------------------------
+    # Aufbau und Aktualisierung
+    # ------------------------------------------------------------------
+
+    def _synchronisiere(self):
+        """Spielt neue Journal-Einträge ein oder baut den Index neu auf"""
+        seq = cache.get(JOURNAL_SEQ_KEY) or 0
+
+        # Verlorener Zähler beginnt neu auf Zeitstempel-Basis (siehe veroeffentliche)
+        if not self.geladen or seq < self.seq or seq - self.seq > JOURNAL_MAX_LUECKE:
+            self._baue_auf(seq)
+            return
+
+        if seq == self.seq:
+            return
+
+        schluessel = [JOURNAL_KEY.format(nr) for nr in range(self.seq + 1, seq + 1)]
+        journal = cache.get_many(*schluessel)
+        if any(aenderungen is None for aenderungen in journal):
+            logger.info("Journal des Duplikatsindex unvollständig, Index wird neu aufgebaut")
+            self._baue_auf(seq)
+            return
+
+        for aenderungen in journal:
+            self._wende_an(aenderungen)
+        self.seq = seq
+
+    def _baue_auf(self, seq):
+        """Lädt alle aktiven Aufmaße mit einer Abfrage (nur benötigte Spalten)"""
+        self.buckets = defaultdict(dict)
+        self.position = {}
+        self.materialien = dict(db.session.query(Material.id, Material.name))
+        self.benutzer = dict(db.session.query(User.id, User.username))
+
+        for row in db.session.query(
+            AufmassEntry.id,
+            AufmassEntry.material_id,
+            AufmassEntry.mitarbeiter_id,
+            AufmassEntry.datum,
+            AufmassEntry.ort,
+            AufmassEntry.menge,
+            AufmassEntry.einheit
+        ).filter(or_(AufmassEntry.is_deleted == False, AufmassEntry.is_deleted.is_(None))):
+            self._setze(row.id, row.material_id, row.mitarbeiter_id, row.datum, row.ort, row.menge, row.einheit)
+
+        self.seq = seq
+        self.geladen = True
+
+    def _setze(self, aufmass_id, material_id, mitarbeiter_id, datum, ort, menge, einheit):
+        self._entferne(aufmass_id)
+        if datum.tzinfo:
+            datum = datum.replace(tzinfo=None)
+        schluessel = (material_id, datum.date())
+        self.buckets[schluessel][aufmass_id] = IndexEintrag(
+            aufmass_id, material_id, mitarbeiter_id, datum, ort, normalisiere_ort(ort), menge, einheit
+        )
+        self.position[aufmass_id] = schluessel
+
+    def _entferne(self, aufmass_id):
+        schluessel = self.position.pop(aufmass_id, None)
+        if schluessel is not None:
+            bucket = self.buckets[schluessel]
+            bucket.pop(aufmass_id, None)
+            if not bucket:
+                del self.buckets[schluessel]
+
+    def _wende_an(self, aenderungen):
+        for art, *werte in aenderungen:
+            if art == 'eintrag':
+                self._setze(*werte)
+            elif art == 'geloescht':
+                self._entferne(*werte)
+            elif art == 'material':
+                self.materialien[werte[0]] = werte[1]
+            elif art == 'benutzer':
+                self.benutzer[werte[0]] = werte[1]
+
+    def veroeffentliche(self, aenderungen):
+        """Schreibt die Änderungen eines Commits ins Journal
+
+        Ohne Zähler im Cache (z.B. NullCache) werden die Änderungen nur
+        lokal übernommen.
+        """
+        with self.lock:
+            try:
+                # Fehlt der Zähler (neu, verdrängt oder abgelaufen), beginnt er bei
+                # der aktuellen Zeit in µs, damit sich Nummern nie wiederholen
+                cache.add(JOURNAL_SEQ_KEY, time.time_ns() // 1000, timeout=0)
+                seq = cache.cache.inc(JOURNAL_SEQ_KEY)
+            except Exception:
+                logger.exception("Journal des Duplikatsindex nicht erreichbar")
+                seq = None
+
+            if not seq:
+                if self.geladen:
+                    self._wende_an(aenderungen)
+                return
+
+            cache.set(JOURNAL_KEY.format(seq), aenderungen, timeout=JOURNAL_TIMEOUT)
+
+
+class DatenbankSuche:
+    """Abfragen wie LiveDuplikatIndex, aber direkt auf der Datenbank
+
+    Ersatz, wenn der Cache nicht zwischen den Workern geteilt ist und ein
+    Index das Journal der anderen Worker nie sehen würde.
+    """
+
+    def suche(self, material_id, tag, ort):
+        """Einträge am Tag mit dem Material, deren Ort den gesuchten Ort enthält"""
+        ort_norm = normalisiere_ort(ort)
+        if not ort_norm:
+            return []
+
+        beginn = datetime.combine(tag, datetime.min.time())
+        eintraege = AufmassEntry.query.filter(
+            AufmassEntry.material_id == material_id,
+            AufmassEntry.datum >= beginn,
+            AufmassEntry.datum < beginn + timedelta(days=1),
+            or_(AufmassEntry.is_deleted == False, AufmassEntry.is_deleted.is_(None))
+        ).all()
+        return [e for e in eintraege if ort_norm in normalisiere_ort(e.ort)]
+
+    def suche_aehnliche(self, material, ort, tag, tage=1, limit=5):
+        """Einträge ±tage um den Tag, deren Material und Ort die Suchbegriffe enthalten"""
+        ort_norm = normalisiere_ort(ort)
+        if not material or not ort_norm:
+            return []
+
+        beginn = datetime.combine(tag, datetime.min.time())
+        eintraege = AufmassEntry.query.join(Material).filter(
+            func.lower(Material.name).contains(material.lower(), autoescape=True),
+            AufmassEntry.datum >= beginn - timedelta(days=tage),
+            AufmassEntry.datum < beginn + timedelta(days=tage + 1),
+            or_(AufmassEntry.is_deleted == False, AufmassEntry.is_deleted.is_(None))
+        ).order_by(AufmassEntry.datum.desc(), AufmassEntry.id.desc()).all()
+        return [e for e in eintraege if ort_norm in normalisiere_ort(e.ort)][:limit]
+
+    def material_name(self, material_id):
+        material = db.session.get(Material, material_id)
+        return material.name if material else None
+
+    def benutzername(self, user_id):
+        user = db.session.get(User, user_id)
+        return user.username if user else None
+
+    def veroeffentliche(self, aenderungen):
+        """Nichts zu tun, die Datenbank ist bereits aktuell"""
+
+
+def get_live_index():
+    """Liefert den Index der aktuellen App (einer je Prozess)
+
+    Ohne geteilten Cache eine DatenbankSuche, da das Journal dann nur den
+    eigenen Worker erreicht.
+    """
+    if not geteilter_cache.ist_geteilt():
+        return DatenbankSuche()
+
+    index = current_app.extensions.get('duplikat_index')
+    if index is None:
+        index = current_app.extensions.setdefault('duplikat_index', LiveDuplikatIndex())
+    return index
+
+
+# ----------------------------------------------------------------------
+# Änderungen aus der Session sammeln und nach dem Commit veröffentlichen
+# ----------------------------------------------------------------------
+
+@event.listens_for(Session, 'after_flush')
+def _sammle_aenderungen(session, flush_context):
+    aenderungen = session.info.setdefault('duplikat_index', [])
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, AufmassEntry):
+            if obj.is_deleted:
+                aenderungen.append(('geloescht', obj.id))
+            else:
+                aenderungen.append((
+                    'eintrag', obj.id, obj.material_id, obj.mitarbeiter_id,
+                    obj.datum, obj.ort, obj.menge, obj.einheit
+                ))
+        elif isinstance(obj, Material):
+            aenderungen.append(('material', obj.id, obj.name))
+        elif isinstance(obj, User):
+            aenderungen.append(('benutzer', obj.id, obj.username))
+
+    for obj in session.deleted:
+        if isinstance(obj, AufmassEntry):
+            aenderungen.append(('geloescht', obj.id))
+
+    if not aenderungen:
+        del session.info['duplikat_index']
+
+
+@event.listens_for(Session, 'after_commit')
+def _veroeffentliche_aenderungen(session):
+    aenderungen = session.info.pop('duplikat_index', None)
+    if aenderungen and has_app_context():
+        get_live_index().veroeffentliche(aenderungen)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _verwerfe_aenderungen(session):
+    session.info.pop('duplikat_index', None)
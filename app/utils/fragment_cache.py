@@ -0,0 +1,103 @@
+"""
+Cache für gerenderte Template-Fragmente
+
+    {% fragment 'bauleiter_letzte_aufmasse' %} ... {% endfragment %}
+    {% fragment 'mitarbeiter_letzte_aufmasse', zusatz=current_user.id %} ... {% endfragment %}
+    {% fragment 'admin_letzte_logins', bereich='anmeldungen' %} ... {% endfragment %}
+
+Der Schlüssel besteht aus Name, Generation des Bereichs (siehe
+dashboard_cache.generation), Rolle des Benutzers, aktuellem Tag (für
+"heute"/"diese Woche") und optionalem Zusatz. Nach einem relevanten Commit
+ändert sich die Generation, ältere Fragmente werden nicht mehr gelesen.
+Wie dashboard_cache.hole() nur mit geteiltem Cache, sonst wird jedes Mal
+gerendert.
+
+Damit bei einem Treffer auch die Abfragen entfallen, übergeben die Routen
+die Daten der Fragmente als Verzoegert: Die Abfrage läuft erst, wenn das
+Template den Wert tatsächlich benutzt.
+"""
+from flask import current_app
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from app import cache
+from app.utils import dashboard_cache, geteilter_cache, zeitraum
+
+FRAGMENT_KEY = 'fragment:{name}:{generation}:{rolle}:{tag}:{zusatz}'
+
+
+class Verzoegert:
+    """Wert, der erst beim ersten Zugriff berechnet wird (einmal je Anfrage)"""
+
+    _leer = object()
+
+    def __init__(self, berechne):
+        self._berechne = berechne
+        self._wert = self._leer
+
+    @property
+    def wert(self):
+        if self._wert is self._leer:
+            self._wert = self._berechne()
+        return self._wert
+
+    def __iter__(self):
+        return iter(self.wert)
+
+    def __len__(self):
+        return len(self.wert)
+
+    def __bool__(self):
+        return bool(self.wert)
+
+    def __getitem__(self, schluessel):
+        return self.wert[schluessel]
+
+
+class FragmentCache(Extension):
+    """Jinja-Tag {% fragment name[, bereich=...][, zusatz=...] %}"""
+
+    tags = {'fragment'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        optionen = {'bereich': nodes.Const('daten'), 'zusatz': nodes.Const(None)}
+
+        while parser.stream.skip_if('comma'):
+            option = parser.stream.expect('name')
+            if option.value not in optionen:
+                parser.fail(f"Unbekannte Option '{option.value}' für fragment", option.lineno)
+            parser.stream.expect('assign')
+            optionen[option.value] = parser.parse_expression()
+
+        body = parser.parse_statements(('name:endfragment',), drop_needle=True)
+        aufruf = self.call_method('_rendere', [name, optionen['bereich'], optionen['zusatz']])
+        return nodes.CallBlock(aufruf, [], [], body).set_lineno(lineno)
+
+    def _rendere(self, name, bereich, zusatz, caller):
+        if not current_app.config.get('FRAGMENT_CACHE_ENABLED', True):
+            return caller()
+
+        if not geteilter_cache.ist_geteilt():
+            # Andere Worker sähen die neue Generation nach einem Commit nicht
+            return caller()
+
+        generation = dashboard_cache.generation(bereich)
+        if generation is None:
+            # Kein Cache verfügbar (z.B. NullCache)
+            return caller()
+
+        schluessel = FRAGMENT_KEY.format(
+            name=name,
+            generation=generation,
+            rolle=current_user.role if current_user.is_authenticated else 'anonym',
+            tag=zeitraum.heute().isoformat(),
+            zusatz=zusatz
+        )
+        html = cache.get(schluessel)
+        if html is None:
+            html = caller()
+            cache.set(schluessel, str(html), timeout=dashboard_cache.EINTRAG_TIMEOUT)
+        return Markup(html)
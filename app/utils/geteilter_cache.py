@@ -0,0 +1,37 @@
+"""
+Prüfung, ob app.cache zwischen allen Worker-Prozessen geteilt ist
+
+Sperren, Generationszähler und Journale im Cache wirken nur, wenn alle
+Worker denselben Cache sehen. Mit einem prozesslokalen Backend (simple,
+null) hat jeder gunicorn-Worker seinen eigenen Stand; die betroffenen
+Stellen arbeiten dann ohne Cache direkt auf der Datenbank.
+
+CACHE_GETEILT überschreibt die Erkennung, z.B. für den Entwicklungsserver
+oder die Tests, die nur einen Prozess haben.
+"""
+import logging
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Backends, deren Inhalt nur im eigenen Prozess sichtbar ist
+PROZESSLOKAL = ('simple', 'simplecache', 'null', 'nullcache')
+
+
+def ist_geteilt(app=None):
+    """True, wenn alle Worker denselben Cache sehen"""
+    app = app or current_app
+    geteilt = app.config.get('CACHE_GETEILT')
+    if geteilt is not None:
+        return geteilt
+    typ = str(app.config.get('CACHE_TYPE') or 'null').rsplit('.', 1)[-1].lower()
+    return typ not in PROZESSLOKAL
+
+
+def init_app(app):
+    if not ist_geteilt(app):
+        logger.warning(
+            "CACHE_TYPE=%s ist prozesslokal: Dashboard-Cache, Duplikat-Index und "
+            "Duplikat-Bericht arbeiten ohne Cache (CACHE_TYPE=redis setzen)",
+            app.config.get('CACHE_TYPE')
+        )
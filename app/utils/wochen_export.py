@@ -0,0 +1,723 @@
+"""
+Export der Wochenberichte als PDF oder Word im Hintergrund
+
+Der Request legt nur einen ExportAuftrag an und kehrt sofort zurück. Ein
+Thread-Pool (EXPORT_WORKER Threads je Prozess) erzeugt die Datei unter
+EXPORT_ORDNER; Status und Download laufen über die Auftrags-ID. Da der
+Status in der Datenbank steht, kann jeder Worker ihn ausliefern.
+WochenExport wird erst vermerkt, wenn die Datei fertig ist.
+
+Die Dateien sind nach Inhalt adressiert: Der Name enthält einen Hash über
+ID, Datum und Text aller Einträge der Woche (siehe datenstand). Existiert
+die Datei schon, ist der Auftrag sofort fertig. EXPORT_ORDNER wird nach
+dem Prinzip "am längsten nicht benutzt" auf EXPORT_CACHE_MAX_MB begrenzt;
+jeder Treffer und Download frischt die Änderungszeit der Datei auf.
+
+Exporte mehrerer Wochen (bis zu einem ganzen Jahr) setzen sich aus den
+Dateien der einzelnen Wochen zusammen: Fehlende Wochen werden parallel in
+einem Prozess-Pool erzeugt (ReportLab ist CPU-gebunden), danach zu einem
+PDF mit Lesezeichen je Woche oder zu einem ZIP-Archiv zusammengefügt.
+fortschritt im Auftrag zählt die fertigen Wochen. Alle Aufträge eines
+gunicorn-Workers teilen sich einen Pool mit EXPORT_PROZESSE Prozessen, je
+Host rechnen also höchstens Worker x EXPORT_PROZESSE Prozesse. Die Prozesse
+entstehen über forkserver (sonst spawn) statt fork: Der Worker hat Threads,
+deren Sperren (z.B. Logging) ein geforktes Kind gesperrt erben könnte.
+
+Große PDF-Berichte (mehr als EXPORT_STREAMING_AB Einträge) entstehen
+stattdessen in einem Durchgang: Die Einträge werden wochenweise in Blöcken
+gelesen (yield_per) und die Story blockweise gesetzt, so dass nie alle
+Paragraphen gleichzeitig im Speicher liegen. ReportLab hält bis zum
+Speichern nur die fertigen Seiteninhalte.
+
+Mit EXPORT_WORKER = 0 wird der Auftrag direkt im Request ausgeführt.
+"""
+import os
+import uuid
+import hashlib
+import logging
+import zipfile
+import threading
+import multiprocessing
+from itertools import groupby, islice
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta, timezone
+from flask import current_app
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Flowable
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from docx import Document
+from pypdf import PdfWriter
+from app import db
+from app.models.bautagebuch import BautagebuchEntry, WochenExport, ExportAuftrag
+from app.utils.zeitraum import wochen_grenzen
+
+logger = logging.getLogger(__name__)
+
+# Format -> (Dateiendung, MIME-Typ)
+FORMATE = {
+    'pdf': ('pdf', 'application/pdf'),
+    'word': ('docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+}
+
+# Export mehrerer Wochen: Format -> (Dateiendung, MIME-Typ, Format der einzelnen Wochen)
+# Word-Dokumente lassen sich nicht zusammenfügen und werden immer als ZIP geliefert
+BEREICH_FORMATE = {
+    'pdf': ('pdf', 'application/pdf', 'pdf'),
+    'zip': ('zip', 'application/zip', 'pdf'),
+    'word': ('zip', 'application/zip', 'word'),
+}
+
+# Flowables, die beim Setzen eines PDFs höchstens gleichzeitig erzeugt werden
+STORY_BLOCK = 500
+
+# Einträge je Datenbank-Block beim gestreamten Lesen
+LESE_BLOCK = 1000
+
+# Erhöhen, wenn sich der Aufbau der Dokumente ändert (macht alle Dateien ungültig)
+LAYOUT_VERSION = 1
+
+_executor = None
+_executor_sperre = threading.Lock()
+
+_prozess_pool = None
+_prozess_pool_sperre = threading.Lock()
+
+
+def dateiname(kw, jahr, format):
+    """Name der Datei beim Download"""
+    return f"bautagebuch_kw{kw}_{jahr}.{FORMATE[format][0]}"
+
+
+def bereich_dateiname(von, bis, jahr, format):
+    """Name der Datei beim Download eines Exports mehrerer Wochen"""
+    return f"bautagebuch_kw{von}-{bis}_{jahr}.{BEREICH_FORMATE[format][0]}"
+
+
+def mimetype(auftrag):
+    if auftrag.ist_bereich:
+        return BEREICH_FORMATE[auftrag.format][1]
+    return FORMATE[auftrag.format][1]
+
+
+def letzte_kalenderwoche(jahr):
+    """52 oder 53 (der 28. Dezember liegt immer in der letzten ISO-Woche)"""
+    return date(jahr, 12, 28).isocalendar()[1]
+
+
+def lade_eintraege(jahr, kw):
+    """[(id, datum, text)] der Woche nach Datum sortiert"""
+    return db.session.query(BautagebuchEntry.id, BautagebuchEntry.datum, BautagebuchEntry.text).filter_by(
+        kalenderwoche=kw,
+        jahr=jahr
+    ).order_by(BautagebuchEntry.datum, BautagebuchEntry.id).all()
+
+
+def iter_eintraege(jahr, kw):
+    """Wie lade_eintraege, aber in Blöcken von LESE_BLOCK Zeilen gelesen
+
+    Die Session darf bis zum Ende der Iteration nicht committet werden.
+    """
+    return db.session.query(BautagebuchEntry.id, BautagebuchEntry.datum, BautagebuchEntry.text).filter_by(
+        kalenderwoche=kw,
+        jahr=jahr
+    ).order_by(BautagebuchEntry.datum, BautagebuchEntry.id).yield_per(LESE_BLOCK)
+
+
+def _bereich_abfrage(jahr, von, bis):
+    return db.session.query(
+        BautagebuchEntry.kalenderwoche, BautagebuchEntry.id, BautagebuchEntry.datum, BautagebuchEntry.text
+    ).filter(
+        BautagebuchEntry.jahr == jahr,
+        BautagebuchEntry.kalenderwoche.between(von, bis)
+    )
+
+
+def anzahl_eintraege(jahr, von, bis):
+    return _bereich_abfrage(jahr, von, bis).with_entities(db.func.count(BautagebuchEntry.id)).scalar()
+
+
+def lade_bereich(jahr, von, bis):
+    """{kw: [(id, datum, text)]} aller Wochen von bis bis (einschließlich) mit Einträgen"""
+    zeilen = _bereich_abfrage(jahr, von, bis).order_by(
+        BautagebuchEntry.kalenderwoche, BautagebuchEntry.datum, BautagebuchEntry.id
+    )
+
+    wochen = {}
+    for kw, eintrag_id, datum, text in zeilen:
+        wochen.setdefault(kw, []).append((eintrag_id, datum, text))
+    return wochen
+
+
+def staende_im_bereich(jahr, von, bis):
+    """{kw: datenstand} der Wochen mit Einträgen, in Blöcken gelesen"""
+    zeilen = _bereich_abfrage(jahr, von, bis).order_by(
+        BautagebuchEntry.kalenderwoche, BautagebuchEntry.datum, BautagebuchEntry.id
+    ).yield_per(LESE_BLOCK)
+    return {
+        kw: datenstand(zeile[1:] for zeile in woche)
+        for kw, woche in groupby(zeilen, key=itemgetter(0))
+    }
+
+
+def _neuer_stand():
+    return hashlib.sha256(f'layout {LAYOUT_VERSION}'.encode())
+
+
+def _fortschreiben(hash_, eintrag_id, datum, text):
+    hash_.update(f'\x1e{eintrag_id}\x1f{datum.isoformat()}\x1f{text}'.encode('utf-8'))
+
+
+def datenstand(zeilen):
+    """SHA-256 über Layout-Version, ID, Datum und Text der Einträge aus lade_eintraege"""
+    hash_ = _neuer_stand()
+    for eintrag_id, datum, text in zeilen:
+        _fortschreiben(hash_, eintrag_id, datum, text)
+    return hash_.hexdigest()
+
+
+def artefakt_pfad(jahr, kw, format, stand):
+    """Absoluter Pfad der Datei zu Woche, Format und Datenstand"""
+    ordner = current_app.config.get('EXPORT_ORDNER', 'instance/exports')
+    return os.path.abspath(os.path.join(ordner, f'kw{kw}_{jahr}_{stand[:32]}.{FORMATE[format][0]}'))
+
+
+def bereich_pfad(jahr, von, bis, format, staende):
+    """Absoluter Pfad der zusammengefügten Datei, staende = {kw: datenstand}"""
+    hash_ = hashlib.sha256(f'{format} {von}-{bis}/{jahr}'.encode())
+    for kw in sorted(staende):
+        hash_.update(f'\x1e{kw}\x1f{staende[kw]}'.encode())
+    ordner = current_app.config.get('EXPORT_ORDNER', 'instance/exports')
+    name = f'kw{von}-{bis}_{jahr}_{format}_{hash_.hexdigest()[:32]}.{BEREICH_FORMATE[format][0]}'
+    return os.path.abspath(os.path.join(ordner, name))
+
+
+def benutze(pfad):
+    """Vermerkt die Nutzung der Datei für die Verdrängung; False, wenn sie nicht (mehr) existiert"""
+    try:
+        os.utime(pfad)
+        return True
+    except OSError:
+        return False
+
+
+def begrenze_cache():
+    """Löscht die am längsten nicht benutzten Dateien, bis EXPORT_CACHE_MAX_MB eingehalten ist
+
+    Returns:
+        int: Anzahl gelöschter Dateien
+    """
+    ordner = current_app.config.get('EXPORT_ORDNER', 'instance/exports')
+    maximal = current_app.config.get('EXPORT_CACHE_MAX_MB', 1024) * 1024 * 1024
+    try:
+        dateien = [
+            (eintrag.stat().st_mtime, eintrag.stat().st_size, eintrag.path)
+            for eintrag in os.scandir(ordner)
+            if eintrag.is_file() and not eintrag.name.endswith('.tmp')
+        ]
+    except FileNotFoundError:
+        return 0
+
+    gesamt = sum(groesse for _, groesse, _ in dateien)
+    geloescht = 0
+    for _, groesse, pfad in sorted(dateien):
+        if gesamt <= maximal:
+            break
+        try:
+            os.remove(pfad)
+        except OSError:
+            continue
+        gesamt -= groesse
+        geloescht += 1
+    return geloescht
+
+
+def _nach_datum(eintraege):
+    """{'TT.MM.JJJJ': [text, ...]} in der Reihenfolge der Einträge"""
+    eintraege_by_datum = {}
+    for _, datum, text in eintraege:
+        eintraege_by_datum.setdefault(datum.strftime('%d.%m.%Y'), []).append(text)
+    return eintraege_by_datum
+
+
+class _StoryInBloecken(list):
+    """Story für doc.build, die sich aus einem Iterator je STORY_BLOCK Flowables nachfüllt
+
+    BaseDocTemplate.build() arbeitet die Liste in "while len(flowables)" von
+    vorne ab; erst wenn sie leer ist, wird der nächste Block erzeugt. Das ist
+    keine zugesicherte API von ReportLab (geprüft mit der Version aus
+    requirements.txt, siehe tests/test_wochenbericht.py). baue() bricht
+    deshalb ab, statt ein unvollständiges PDF zu schreiben, falls build()
+    die Liste anders abarbeitet.
+    """
+
+    def __init__(self, flowables, block=None):
+        super().__init__()
+        self._quelle = iter(flowables)
+        self._block = block or STORY_BLOCK
+
+    def __len__(self):
+        if not list.__len__(self):
+            self.extend(islice(self._quelle, self._block))
+        return list.__len__(self)
+
+    def baue(self, doc):
+        """Setzt die Story mit doc.build und prüft, dass alle Flowables gesetzt wurden"""
+        doc.build(self)
+        if list.__len__(self) or next(self._quelle, None) is not None:
+            raise RuntimeError('doc.build hat die Story nicht vollständig abgearbeitet')
+
+
+class _Lesezeichen(Flowable):
+    """Eintrag in der Gliederung des PDF-Viewers an dieser Stelle"""
+
+    def __init__(self, titel):
+        super().__init__()
+        self.titel = titel
+
+    def wrap(self, verfuegbar_breite, verfuegbar_hoehe):
+        return 0, 0
+
+    def draw(self):
+        self.canv.bookmarkPage(self.titel)
+        self.canv.addOutlineEntry(self.titel, self.titel, level=0)
+
+
+def _pdf_stile():
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        alignment=1,  # Zentriert
+        spaceAfter=20
+    )
+    return styles, title_style
+
+
+def _wochen_story(eintraege, kw, jahr, styles, title_style):
+    """Flowables einer Woche, Einträge werden erst beim Durchlaufen gelesen"""
+    montag, _ = wochen_grenzen(jahr, kw)
+    freitag = montag + timedelta(days=4)
+
+    # Titel
+    yield Paragraph(f"Bautagebuch - Kalenderwoche {kw}/{jahr}", title_style)
+    yield Paragraph(f"Zeitraum: {montag.strftime('%d.%m.%Y')} bis {freitag.strftime('%d.%m.%Y')}", styles['Normal'])
+    yield Spacer(1, 20)
+
+    for datum, gruppe in groupby(eintraege, key=itemgetter(1)):
+        yield Paragraph(f"<b>{datum.strftime('%d.%m.%Y')}</b>", styles['Heading2'])
+        for _, _, text in gruppe:
+            yield Paragraph(f"• {text}", styles['Normal'])
+        yield Spacer(1, 10)
+
+
+def export_pdf(ziel, eintraege, kw, jahr):
+    """Schreibt den Wochenbericht als PDF
+
+    Args:
+        ziel: Dateipfad oder binäres Dateiobjekt
+        eintraege: [(id, datum, text)] nach Datum sortiert (siehe lade_eintraege),
+            auch als Iterator (siehe iter_eintraege)
+    """
+    doc = SimpleDocTemplate(ziel, pagesize=A4)
+    _StoryInBloecken(_wochen_story(eintraege, kw, jahr, *_pdf_stile())).baue(doc)
+
+
+def export_pdf_bereich(ziel, wochen, jahr):
+    """Schreibt mehrere Wochen als ein PDF, jede Woche ab einer neuen Seite mit Lesezeichen
+
+    Args:
+        wochen: Iterator über (kw, eintraege) wie bei export_pdf; eine Woche
+            wird erst gelesen, wenn die vorige gesetzt ist
+    """
+    stile = _pdf_stile()
+
+    def story():
+        for i, (kw, eintraege) in enumerate(wochen):
+            if i:
+                yield PageBreak()
+            yield _Lesezeichen(f'KW {kw}/{jahr}')
+            yield from _wochen_story(eintraege, kw, jahr, *stile)
+
+    doc = SimpleDocTemplate(ziel, pagesize=A4)
+    _StoryInBloecken(story()).baue(doc)
+
+
+def export_word(ziel, eintraege, kw, jahr):
+    """Schreibt den Wochenbericht als Word-Dokument (Argumente wie export_pdf)"""
+    montag, _ = wochen_grenzen(jahr, kw)
+    freitag = montag + timedelta(days=4)
+
+    doc = Document()
+    doc.add_heading(f'Bautagebuch - KW {kw}/{jahr}', 0)
+    doc.add_paragraph(f'Zeitraum: {montag.strftime("%d.%m.%Y")} bis {freitag.strftime("%d.%m.%Y")}')
+    doc.add_paragraph('')
+
+    for datum_str, texte in _nach_datum(eintraege).items():
+        doc.add_heading(datum_str, level=1)
+        for text in texte:
+            p = doc.add_paragraph()
+            p.add_run('• ').bold = True
+            p.add_run(text)
+        doc.add_paragraph('')
+
+    doc.save(ziel)
+
+
+def rendere(format, pfad, eintraege, kw, jahr, temp):
+    """Erzeugt die Datei einer Woche unter temp und legt sie danach unter pfad ab
+
+    Läuft auch in den Prozessen des Pools, daher nur mit einfachen Daten.
+    """
+    if format == 'pdf':
+        export_pdf(temp, eintraege, kw, jahr)
+    else:
+        export_word(temp, eintraege, kw, jahr)
+    os.replace(temp, pfad)
+    return kw
+
+
+def fuege_pdf_zusammen(ziel, teile):
+    """Hängt die PDFs [(lesezeichen, pfad)] in dieser Reihenfolge aneinander"""
+    writer = PdfWriter()
+    for lesezeichen, pfad in teile:
+        writer.append(pfad, outline_item=lesezeichen)
+    writer.write(ziel)
+    writer.close()
+
+
+def packe_zip(ziel, teile):
+    """Legt die Dateien [(name im Archiv, pfad)] in ein ZIP-Archiv
+
+    PDF und DOCX sind bereits komprimiert und werden nur gespeichert.
+    """
+    with zipfile.ZipFile(ziel, 'w', compression=zipfile.ZIP_STORED) as archiv:
+        for name, pfad in teile:
+            archiv.write(pfad, arcname=name)
+
+
+def vermerke_export(kw, jahr, dateiname, exportiert_von):
+    """Legt WochenExport für die Woche an, falls noch keiner existiert (Commit durch den Aufrufer)"""
+    existing = WochenExport.query.filter_by(kalenderwoche=kw, jahr=jahr).first()
+    if existing:
+        return existing
+
+    export = WochenExport(
+        kalenderwoche=kw,
+        jahr=jahr,
+        exportiert_von=exportiert_von,
+        dateiname=dateiname
+    )
+    db.session.add(export)
+    return export
+
+
+def _hole_prozess_pool(prozesse):
+    """Prozess-Pool dieses Workers für das Rendern einzelner Wochen"""
+    global _prozess_pool
+    with _prozess_pool_sperre:
+        if _prozess_pool is None:
+            methode = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _prozess_pool = ProcessPoolExecutor(
+                max_workers=prozesse, mp_context=multiprocessing.get_context(methode)
+            )
+        return _prozess_pool
+
+
+def _verwerfe_prozess_pool(pool):
+    """Entfernt einen defekten Pool (z.B. nach Absturz eines Prozesses)"""
+    global _prozess_pool
+    with _prozess_pool_sperre:
+        if _prozess_pool is pool:
+            _prozess_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ----------------------------------------------------------------------
+# Aufträge
+# ----------------------------------------------------------------------
+
+def _hole_executor(app):
+    global _executor
+    with _executor_sperre:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('EXPORT_WORKER', 2),
+                thread_name_prefix='wochen-export'
+            )
+        return _executor
+
+
+def starte_export(jahr, kw, format, user, bis=None):
+    """Legt einen Auftrag an und übergibt ihn dem Thread-Pool
+
+    Liegt die Datei einer Woche zum aktuellen Datenstand schon vor, ist der
+    Auftrag sofort fertig. Bei mehreren Wochen prüft erst der Auftrag, welche
+    Dateien fehlen, damit der Request nicht das ganze Jahr lesen muss.
+
+    Args:
+        kw: (erste) Kalenderwoche
+        format: Schlüssel aus FORMATE bzw. mit bis aus BEREICH_FORMATE
+        bis: Letzte Kalenderwoche eines Exports mehrerer Wochen
+
+    Returns:
+        ExportAuftrag: der angelegte Auftrag (Status 'wartet', bei
+        vorhandener Datei oder EXPORT_WORKER = 0 bereits abgeschlossen)
+    """
+    if format not in (FORMATE if bis is None else BEREICH_FORMATE):
+        raise ValueError(f'Unbekanntes Export-Format: {format}')
+
+    raeume_auf()
+    auftrag = ExportAuftrag(
+        id=uuid.uuid4().hex,
+        kalenderwoche=kw,
+        kalenderwoche_bis=bis,
+        jahr=jahr,
+        format=format,
+        user_id=user.id,
+        angefordert_von=user.username,
+        status='wartet',
+        fortschritt=0
+    )
+    db.session.add(auftrag)
+
+    if bis is None:
+        pfad = artefakt_pfad(jahr, kw, format, datenstand(lade_eintraege(jahr, kw)))
+        if benutze(pfad):
+            _abschliessen(auftrag, pfad)
+            db.session.commit()
+            return auftrag
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    if not app.config.get('EXPORT_WORKER', 2):
+        fuehre_aus(auftrag.id)
+        db.session.refresh(auftrag)
+    else:
+        _hole_executor(app).submit(_im_hintergrund, app, auftrag.id)
+    return auftrag
+
+
+def _im_hintergrund(app, auftrag_id):
+    with app.app_context():
+        try:
+            fuehre_aus(auftrag_id)
+        finally:
+            db.session.remove()
+
+
+def fuehre_aus(auftrag_id):
+    """Erzeugt die Datei eines wartenden Auftrags und vermerkt den Export"""
+    auftrag = db.session.get(ExportAuftrag, auftrag_id)
+    if auftrag is None or auftrag.status != 'wartet':
+        return
+    auftrag.status = 'laeuft'
+    auftrag.fortschritt_am = datetime.now(timezone.utc)
+    db.session.commit()
+
+    try:
+        if auftrag.ist_bereich:
+            pfad, wochen = _erstelle_bereich(auftrag)
+        else:
+            pfad, wochen = _erstelle_woche(auftrag), None
+        begrenze_cache()
+
+        _abschliessen(auftrag, pfad, wochen)
+        db.session.commit()
+        logger.info(f"Export {auftrag.id} (KW {auftrag.wochen}/{auftrag.jahr}, {auftrag.format}) erstellt")
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Export {auftrag_id} fehlgeschlagen")
+        auftrag = db.session.get(ExportAuftrag, auftrag_id)
+        auftrag.status = 'fehler'
+        auftrag.fehler = str(e) if isinstance(e, LookupError) else 'Export fehlgeschlagen'
+        auftrag.fertig_am = datetime.now(timezone.utc)
+        db.session.commit()
+
+
+def _erstelle_woche(auftrag):
+    """Datei einer Woche, falls sie noch nicht vorliegt; Returns: Pfad"""
+    eintraege = lade_eintraege(auftrag.jahr, auftrag.kalenderwoche)
+    if not eintraege:
+        raise LookupError(f'Keine Einträge für KW {auftrag.kalenderwoche}/{auftrag.jahr}')
+
+    # Datenstand der tatsächlich gelesenen Einträge, falls sich die Woche inzwischen geändert hat
+    pfad = artefakt_pfad(auftrag.jahr, auftrag.kalenderwoche, auftrag.format, datenstand(eintraege))
+    if not benutze(pfad):
+        # Erst nach dem Schreiben unter dem endgültigen Namen ablegen
+        os.makedirs(os.path.dirname(pfad), exist_ok=True)
+        rendere(auftrag.format, pfad, eintraege, auftrag.kalenderwoche, auftrag.jahr, f'{pfad}.{auftrag.id}.tmp')
+    return pfad
+
+
+def _erstelle_bereich(auftrag):
+    """Zusammengefügte Datei mehrerer Wochen
+
+    Vorhandene Wochendateien werden übernommen, fehlende parallel in einem
+    Prozess-Pool erzeugt. Nach jeder fertigen Woche wird fortschritt
+    gespeichert.
+
+    Returns:
+        tuple: (Pfad, [kw, ...] der enthaltenen Wochen)
+    """
+    jahr, von, bis = auftrag.jahr, auftrag.kalenderwoche, auftrag.kalenderwoche_bis
+    endung, _, einzel = BEREICH_FORMATE[auftrag.format]
+
+    if endung == 'pdf' and anzahl_eintraege(jahr, von, bis) > current_app.config.get('EXPORT_STREAMING_AB', 20000):
+        return _erstelle_bereich_gestreamt(auftrag)
+
+    wochen = lade_bereich(jahr, von, bis)
+    if not wochen:
+        raise LookupError(f'Keine Einträge für KW {von}-{bis}/{jahr}')
+    staende = {kw: datenstand(eintraege) for kw, eintraege in wochen.items()}
+    pfade = {kw: artefakt_pfad(jahr, kw, einzel, stand) for kw, stand in staende.items()}
+    reihenfolge = sorted(wochen)
+
+    ziel = bereich_pfad(jahr, von, bis, auftrag.format, staende)
+    auftrag.gesamt = len(wochen)
+    if benutze(ziel):
+        auftrag.fortschritt = auftrag.gesamt
+        return ziel, reihenfolge
+
+    fehlend = [kw for kw in reihenfolge if not benutze(pfade[kw])]
+    auftrag.fortschritt = auftrag.gesamt - len(fehlend)
+    db.session.commit()
+
+    os.makedirs(os.path.dirname(ziel), exist_ok=True)
+    aufgaben = [
+        (einzel, pfade[kw], wochen[kw], kw, jahr, f'{pfade[kw]}.{auftrag.id}.tmp')
+        for kw in fehlend
+    ]
+    prozesse = current_app.config.get('EXPORT_PROZESSE', 2)
+    if prozesse <= 1 or len(aufgaben) <= 1:
+        for aufgabe in aufgaben:
+            rendere(*aufgabe)
+            _melde_fortschritt(auftrag)
+    else:
+        pool = _hole_prozess_pool(prozesse)
+        try:
+            for future in as_completed([pool.submit(rendere, *aufgabe) for aufgabe in aufgaben]):
+                future.result()
+                _melde_fortschritt(auftrag)
+        except BrokenProcessPool:
+            _verwerfe_prozess_pool(pool)
+            raise
+
+    temp = f'{ziel}.{auftrag.id}.tmp'
+    if endung == 'pdf':
+        fuege_pdf_zusammen(temp, [(f'KW {kw}/{jahr}', pfade[kw]) for kw in reihenfolge])
+    else:
+        packe_zip(temp, [(dateiname(kw, jahr, einzel), pfade[kw]) for kw in reihenfolge])
+    os.replace(temp, ziel)
+    return ziel, reihenfolge
+
+
+def _erstelle_bereich_gestreamt(auftrag):
+    """Zusammenhängendes PDF mehrerer Wochen in einem Durchgang mit begrenztem Speicher
+
+    Der erste Durchgang ermittelt nur den Datenstand je Woche (Cache). Beim
+    Setzen wird jede Woche einzeln in Blöcken gelesen und danach fortschritt
+    gespeichert; der Dateiname folgt dem dabei gelesenen Datenstand.
+
+    Returns:
+        tuple: (Pfad, [kw, ...] der enthaltenen Wochen)
+    """
+    jahr, von, bis = auftrag.jahr, auftrag.kalenderwoche, auftrag.kalenderwoche_bis
+
+    staende = staende_im_bereich(jahr, von, bis)
+    if not staende:
+        raise LookupError(f'Keine Einträge für KW {von}-{bis}/{jahr}')
+    reihenfolge = sorted(staende)
+
+    ziel = bereich_pfad(jahr, von, bis, auftrag.format, staende)
+    auftrag.gesamt = len(staende)
+    if benutze(ziel):
+        auftrag.fortschritt = auftrag.gesamt
+        return ziel, reihenfolge
+    auftrag.fortschritt = 0
+    db.session.commit()
+
+    gelesen = {}
+
+    def lies_woche(kw):
+        hash_ = _neuer_stand()
+        for eintrag_id, datum, text in iter_eintraege(jahr, kw):
+            _fortschreiben(hash_, eintrag_id, datum, text)
+            yield eintrag_id, datum, text
+        # Die Abfrage ist vollständig gelesen, erst jetzt committen
+        gelesen[kw] = hash_.hexdigest()
+        _melde_fortschritt(auftrag)
+
+    os.makedirs(os.path.dirname(ziel), exist_ok=True)
+    temp = f'{ziel}.{auftrag.id}.tmp'
+    export_pdf_bereich(temp, ((kw, lies_woche(kw)) for kw in reihenfolge), jahr)
+
+    ziel = bereich_pfad(jahr, von, bis, auftrag.format, gelesen)
+    os.replace(temp, ziel)
+    return ziel, reihenfolge
+
+
+def _melde_fortschritt(auftrag):
+    """Zählt eine fertige Woche; pruefe_zeitueberschreitung misst ab diesem Zeitpunkt"""
+    auftrag.fortschritt += 1
+    auftrag.fortschritt_am = datetime.now(timezone.utc)
+    db.session.commit()
+
+
+def _abschliessen(auftrag, pfad, wochen=None):
+    # Die Datei liegt vor: ein zwischenzeitlich gesetzter Fehler (Zeitüberschreitung) gilt nicht mehr
+    auftrag.datei = pfad
+    auftrag.status = 'fertig'
+    auftrag.fehler = None
+    auftrag.fertig_am = datetime.now(timezone.utc)
+    if not auftrag.ist_bereich:
+        auftrag.dateiname = dateiname(auftrag.kalenderwoche, auftrag.jahr, auftrag.format)
+        vermerke_export(auftrag.kalenderwoche, auftrag.jahr, auftrag.dateiname, auftrag.angefordert_von)
+        return
+
+    auftrag.dateiname = bereich_dateiname(auftrag.kalenderwoche, auftrag.kalenderwoche_bis, auftrag.jahr, auftrag.format)
+    einzel = BEREICH_FORMATE[auftrag.format][2]
+    vermerkt = {kw for (kw,) in db.session.query(WochenExport.kalenderwoche).filter(
+        WochenExport.jahr == auftrag.jahr,
+        WochenExport.kalenderwoche.in_(wochen)
+    )}
+    for kw in wochen:
+        if kw not in vermerkt:
+            db.session.add(WochenExport(
+                kalenderwoche=kw,
+                jahr=auftrag.jahr,
+                exportiert_von=auftrag.angefordert_von,
+                dateiname=dateiname(kw, auftrag.jahr, einzel)
+            ))
+
+
+def pruefe_zeitueberschreitung(auftrag):
+    """Markiert einen hängenden Auftrag (z.B. nach Neustart des Workers) als fehlgeschlagen
+
+    Gemessen wird ab dem letzten Fortschritt, bei wartenden Aufträgen ab
+    dem Anlegen: ein langer Export, der noch Wochen fertigstellt, läuft weiter.
+    """
+    letzter = auftrag.fortschritt_am or auftrag.erstellt_am
+    if auftrag.abgeschlossen or letzter is None:
+        return auftrag
+    grenze = datetime.now(timezone.utc) - timedelta(seconds=current_app.config.get('EXPORT_TIMEOUT', 600))
+    if letzter.replace(tzinfo=timezone.utc) < grenze:
+        auftrag.status = 'fehler'
+        auftrag.fehler = 'Zeitüberschreitung'
+        auftrag.fertig_am = datetime.now(timezone.utc)
+        db.session.commit()
+    return auftrag
+
+
+def raeume_auf():
+    """Löscht Aufträge, die älter als EXPORT_AUFBEWAHRUNG Stunden sind
+
+    Die Dateien bleiben als Cache erhalten (siehe begrenze_cache).
+    """
+    grenze = datetime.now(timezone.utc) - timedelta(hours=current_app.config.get('EXPORT_AUFBEWAHRUNG', 24))
+    anzahl = ExportAuftrag.query.filter(ExportAuftrag.erstellt_am < grenze).delete(synchronize_session=False)
+    if anzahl:
+        db.session.commit()
+    return anzahl
@@ -0,0 +1,63 @@
+"""
+Datums- und Zeitraum-Hilfen für Abfragen
+
+Filter auf Tage laufen über die gespeicherten Spalten tag, kalenderwoche
+und jahr (siehe AufmassEntry) statt über func.date(datum), damit die
+Indizes genutzt werden. Kalenderwochen sind immer ISO-Wochen (Montag bis
+Sonntag, Jahr der Woche nach ISO 8601).
+"""
+from datetime import date, datetime, timedelta, timezone
+
+
+def heute():
+    """Aktueller Tag in UTC"""
+    return datetime.now(timezone.utc).date()
+
+
+def als_tag(wert):
+    """Tag eines date- oder datetime-Werts"""
+    return wert.date() if isinstance(wert, datetime) else wert
+
+
+def kalenderwoche(wert):
+    """(jahr, kalenderwoche) nach ISO 8601"""
+    iso = als_tag(wert).isocalendar()
+    return iso[0], iso[1]
+
+
+def wochenanfang(wert):
+    """Montag der Woche"""
+    tag = als_tag(wert)
+    return tag - timedelta(days=tag.weekday())
+
+
+def wochen_grenzen(jahr, kw):
+    """(montag, sonntag) der ISO-Kalenderwoche"""
+    montag = date.fromisocalendar(jahr, kw, 1)
+    return montag, montag + timedelta(days=6)
+
+
+def parse_tag(text, format='%Y-%m-%d'):
+    """Tag aus einem Formular- oder Query-Parameter, None bei leerem oder ungültigem Wert"""
+    if not text:
+        return None
+    try:
+        return datetime.strptime(text, format).date()
+    except ValueError:
+        return None
+
+
+def zeitraum_bedingungen(spalte, von=None, bis=None):
+    """Bedingungen für von <= spalte <= bis (beide Tage einschließlich, None = offen)"""
+    bedingungen = []
+    if von is not None:
+        bedingungen.append(spalte >= als_tag(von))
+    if bis is not None:
+        bedingungen.append(spalte <= als_tag(bis))
+    return bedingungen
+
+
+def filter_zeitraum(query, spalte, von=None, bis=None):
+    """Schränkt die Abfrage auf die Tage von bis bis ein (siehe zeitraum_bedingungen)"""
+    bedingungen = zeitraum_bedingungen(spalte, von, bis)
+    return query.filter(*bedingungen) if bedingungen else query
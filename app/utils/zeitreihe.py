@@ -0,0 +1,186 @@
+"""
+Zeitreihen der Aufmaße für Diagramme (/api/stats/timeseries)
+
+Anzahl oder Menge je Tag, Woche oder Monat, optional getrennt nach Material
+oder Mitarbeiter. Die Summen entstehen per GROUP BY auf der Tagesstatistik
+(siehe AufmassTagesstatistik), auf PostgreSQL und SQLite bereits in der
+gewünschten Intervallgröße. Die Zahl der Punkte ist begrenzt: Hat der
+Zeitraum mehr Intervalle als erlaubt, wird auf Wochen bzw. Monate vergröbert
+und danach je n Monate zusammengefasst. Da alle Werte Summen sind, bleibt
+das Ergebnis exakt.
+
+Die Antwort ist spaltenweise aufgebaut: eine Liste der Intervallanfänge und
+je Reihe eine gleich lange Liste von Werten.
+"""
+from datetime import timedelta
+from sqlalchemy import select, func, cast, Date
+from app import db
+from app.models.material import Material
+from app.models.statistik import AufmassTagesstatistik
+from app.models.user import User
+from app.utils import zeitraum
+from app.utils.zeitraum import zeitraum_bedingungen
+
+# Intervallgrößen von fein nach grob
+INTERVALLE = ('tag', 'woche', 'monat')
+
+METRIKEN = ('anzahl', 'menge')
+GRUPPIERUNGEN = (None, 'material', 'mitarbeiter')
+
+# Weitere Reihen werden zu "Sonstige" zusammengefasst
+MAX_REIHEN = 10
+
+
+def intervall_anfang(tag, intervall):
+    """Erster Tag des Intervalls, in dem der Tag liegt"""
+    if intervall == 'woche':
+        return zeitraum.wochenanfang(tag)
+    if intervall == 'monat':
+        return tag.replace(day=1)
+    return tag
+
+
+def intervall_index(tag, intervall, von):
+    """Nummer des Intervalls von tag, gezählt ab dem Intervall von von (0)"""
+    if intervall == 'woche':
+        return (zeitraum.wochenanfang(tag) - zeitraum.wochenanfang(von)).days // 7
+    if intervall == 'monat':
+        return (tag.year - von.year) * 12 + tag.month - von.month
+    return (tag - von).days
+
+
+def _naechstes(anfang, intervall):
+    if intervall == 'woche':
+        return anfang + timedelta(days=7)
+    if intervall == 'monat':
+        return (anfang + timedelta(days=31)).replace(day=1)
+    return anfang + timedelta(days=1)
+
+
+def waehle_intervall(von, bis, intervall, max_punkte):
+    """(intervall, schritt) mit höchstens max_punkte Punkten
+
+    Beginnt beim gewünschten Intervall und vergröbert bei Bedarf; reichen
+    Monate nicht aus, werden je schritt Monate zu einem Punkt zusammengefasst.
+    """
+    for kandidat in INTERVALLE[INTERVALLE.index(intervall):]:
+        anzahl = intervall_index(bis, kandidat, von) + 1
+        if anzahl <= max_punkte:
+            return kandidat, 1
+    return 'monat', -(-anzahl // max_punkte)
+
+
+def _intervall_ausdruck(spalte, intervall, dialekt):
+    """SQL-Ausdruck für den Intervallanfang, None wenn nur tageweise gruppiert werden kann"""
+    if intervall == 'tag':
+        return spalte
+    if dialekt == 'postgresql':
+        return cast(func.date_trunc('week' if intervall == 'woche' else 'month', spalte), Date)
+    if dialekt == 'sqlite':
+        if intervall == 'woche':
+            # Nächster Sonntag (bzw. derselbe), sechs Tage zurück: Montag
+            return func.date(spalte, 'weekday 0', '-6 days', type_=Date)
+        return func.date(spalte, 'start of month', type_=Date)
+    return None
+
+
+def zeitreihe(metrik='anzahl', gruppierung=None, intervall='tag', von=None, bis=None,
+              mitarbeiter_id=None, max_punkte=500, max_reihen=MAX_REIHEN):
+    """Summen je Intervall als parallele Listen
+
+    Args:
+        metrik: 'anzahl' (Aufmaße) oder 'menge' (Mengensumme)
+        gruppierung: None (eine Reihe), 'material' oder 'mitarbeiter'
+        intervall: 'tag', 'woche' oder 'monat' (gewünscht, ggf. vergröbert)
+        von, bis: Zeitraum (Tage einschließlich); ohne von ab dem ersten
+            Aufmaß, ohne bis bis heute
+        mitarbeiter_id: Nur Aufmaße dieses Mitarbeiters
+        max_punkte: Höchstzahl der Intervalle
+        max_reihen: Höchstzahl der Reihen, der Rest wird zu "Sonstige"
+
+    Returns:
+        dict: intervall, schritt, von, bis, zeitpunkte [date] und
+        reihen [{'id', 'name', 'werte'}]
+    """
+    if metrik not in METRIKEN:
+        raise ValueError(f'Unbekannte Metrik: {metrik}')
+    if gruppierung not in GRUPPIERUNGEN:
+        raise ValueError(f'Unbekannte Gruppierung: {gruppierung}')
+    if intervall not in INTERVALLE:
+        raise ValueError(f'Unbekanntes Intervall: {intervall}')
+    if max_punkte < 1:
+        raise ValueError('max_punkte muss mindestens 1 sein')
+
+    r = AufmassTagesstatistik
+    bis = zeitraum.als_tag(bis) if bis is not None else zeitraum.heute()
+    if von is None:
+        # Über den Primärschlüssel (tag, ...) ohne Tabellenscan
+        erster = select(func.min(r.tag))
+        if mitarbeiter_id is not None:
+            erster = erster.where(r.mitarbeiter_id == mitarbeiter_id)
+        von = db.session.execute(erster).scalar() or bis
+    von = zeitraum.als_tag(von)
+    if von > bis:
+        raise ValueError('von liegt nach bis')
+
+    intervall, schritt = waehle_intervall(von, bis, intervall, max_punkte)
+    anzahl_punkte = -(-(intervall_index(bis, intervall, von) + 1) // schritt)
+
+    zeitpunkte = []
+    anfang = intervall_anfang(von, intervall)
+    for _ in range(anzahl_punkte):
+        zeitpunkte.append(anfang)
+        for _ in range(schritt):
+            anfang = _naechstes(anfang, intervall)
+
+    # Aggregation in SQL, je Gruppe und Intervall eine Zeile
+    wert = func.sum(r.anzahl if metrik == 'anzahl' else r.menge_summe)
+    ausdruck = _intervall_ausdruck(r.tag, intervall, db.session.get_bind().dialect.name)
+    if ausdruck is None:
+        ausdruck = r.tag
+    spalten = [ausdruck.label('anfang'), wert.label('wert')]
+    gruppen = [ausdruck]
+    abfrage = select().select_from(r)
+    if gruppierung == 'material':
+        spalten[:0] = [Material.id.label('id'), Material.name.label('name')]
+        gruppen[:0] = [Material.id, Material.name]
+        abfrage = abfrage.join(Material, Material.id == r.material_id)
+    elif gruppierung == 'mitarbeiter':
+        spalten[:0] = [User.id.label('id'), User.username.label('name')]
+        gruppen[:0] = [User.id, User.username]
+        abfrage = abfrage.join(User, User.id == r.mitarbeiter_id)
+
+    abfrage = abfrage.add_columns(*spalten).where(*zeitraum_bedingungen(r.tag, von, bis))
+    if mitarbeiter_id is not None:
+        abfrage = abfrage.where(r.mitarbeiter_id == mitarbeiter_id)
+    abfrage = abfrage.group_by(*gruppen)
+
+    reihen = {}
+    for zeile in db.session.execute(abfrage).mappings():
+        schluessel = (zeile['id'], zeile['name']) if gruppierung else (None, None)
+        werte = reihen.setdefault(schluessel, [0] * anzahl_punkte)
+        werte[intervall_index(zeile['anfang'], intervall, von) // schritt] += zeile['wert'] or 0
+    if gruppierung is None and not reihen:
+        reihen[(None, None)] = [0] * anzahl_punkte
+
+    # Größte Reihen zuerst, der Rest als eine Reihe "Sonstige"
+    sortiert = sorted(reihen.items(), key=lambda e: (-sum(e[1]), e[0][1] or ''))
+    ergebnis = [{'id': id_, 'name': name, 'werte': werte} for (id_, name), werte in sortiert[:max_reihen]]
+    if len(sortiert) > max_reihen:
+        rest = [0] * anzahl_punkte
+        for _, werte in sortiert[max_reihen:]:
+            rest = [a + b for a, b in zip(rest, werte)]
+        ergebnis.append({'id': None, 'name': 'Sonstige', 'werte': rest})
+
+    if metrik == 'menge':
+        for reihe in ergebnis:
+            reihe['werte'] = [round(w, 3) for w in reihe['werte']]
+
+    return {
+        'intervall': intervall,
+        'schritt': schritt,
+        'von': von,
+        'bis': bis,
+        'zeitpunkte': zeitpunkte,
+        'reihen': ergebnis,
+    }
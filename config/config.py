@@ -70,10 +70,54 @@ class Config:
     # Cache
     CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
     CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or os.environ.get('REDIS_URL')
+    # Sehen alle Worker denselben Cache? Ohne Angabe aus CACHE_TYPE abgeleitet (simple/null: nein)
+    CACHE_GETEILT = {'true': True, 'false': False}.get(os.environ.get('CACHE_GETEILT', '').lower())
+
+    # Live-Updates der Dashboards (Server-Sent Events); ohne Redis nur innerhalb eines Prozesses
+    DASHBOARD_SSE_ENABLED = os.environ.get('DASHBOARD_SSE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    DASHBOARD_EVENTS_REDIS_URL = os.environ.get('DASHBOARD_EVENTS_REDIS_URL') or os.environ.get('REDIS_URL')
+    DASHBOARD_SSE_MAX_DAUER = int(os.environ.get('DASHBOARD_SSE_MAX_DAUER', 300))
+    DASHBOARD_SSE_HEARTBEAT = int(os.environ.get('DASHBOARD_SSE_HEARTBEAT', 15))
+    # Offene Streams je Worker; jeder belegt einen der gunicorn-Threads (--threads 8)
+    DASHBOARD_SSE_MAX_STREAMS = int(os.environ.get('DASHBOARD_SSE_MAX_STREAMS', 2))
+
+    # Gerenderte Dashboard-Fragmente cachen ({% fragment %}, siehe app/utils/fragment_cache.py)
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+
+    # Sekunden, nach denen teure Admin-Kennzahlen im Hintergrund neu berechnet werden
+    DASHBOARD_SWR_FRISCH = int(os.environ.get('DASHBOARD_SWR_FRISCH', 60))
+
+    # Höchstzahl der Punkte je Reihe in /api/stats/timeseries (gröbere Intervalle darüber)
+    ZEITREIHE_MAX_PUNKTE = int(os.environ.get('ZEITREIHE_MAX_PUNKTE', 500))
+    
+    # Export der Wochenberichte im Hintergrund (0 Worker = direkt im Request)
+    EXPORT_ORDNER = os.environ.get('EXPORT_ORDNER') or 'instance/exports'
+    EXPORT_WORKER = int(os.environ.get('EXPORT_WORKER', 2))
+    EXPORT_TIMEOUT = int(os.environ.get('EXPORT_TIMEOUT', 600))  # Sekunden
+    EXPORT_AUFBEWAHRUNG = int(os.environ.get('EXPORT_AUFBEWAHRUNG', 24))  # Stunden
+    # Render-Prozesse je gunicorn-Worker für Exporte mehrerer Wochen, von allen
+    # Aufträgen des Workers geteilt (je Host: Worker x EXPORT_PROZESSE; 1 = ohne Pool)
+    EXPORT_PROZESSE = int(os.environ.get('EXPORT_PROZESSE', 2))
+    # Größere PDF-Berichte in einem Durchgang mit begrenztem Speicher (Anzahl Einträge)
+    EXPORT_STREAMING_AB = int(os.environ.get('EXPORT_STREAMING_AB', 20000))
+    # Fertige Dateien nach Datenstand wiederverwenden, älteste Nutzung wird zuerst verdrängt
+    EXPORT_CACHE_MAX_MB = int(os.environ.get('EXPORT_CACHE_MAX_MB', 1024))
+    # Mit nginx: interner Pfad auf EXPORT_ORDNER, die App sendet nur X-Accel-Redirect
+    EXPORT_X_ACCEL_PREFIX = os.environ.get('EXPORT_X_ACCEL_PREFIX')
     
     # Monitoring
     SENTRY_DSN = os.environ.get('SENTRY_DSN')
     ENABLE_METRICS = os.environ.get('ENABLE_METRICS', 'False').lower() == 'true'
+
+    # Budget je Request (siehe app/utils/abfrage_budget.py), Überschreitungen werden geloggt
+    ABFRAGE_BUDGET = {
+        'anweisungen': int(os.environ.get('ABFRAGE_BUDGET_ANWEISUNGEN', 50)),
+        'db_zeit': float(os.environ.get('ABFRAGE_BUDGET_DB_ZEIT', 0.5)),  # Sekunden
+        'wiederholungen': int(os.environ.get('ABFRAGE_BUDGET_WIEDERHOLUNGEN', 10)),
+    }
+    # Abweichende Budgets je Endpunkt, z.B. {'duplikate.duplikate_uebersicht': {'anweisungen': 200}}
+    ABFRAGE_BUDGET_ENDPUNKTE = {}
     
     # Application specific
     ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE', 20))
@@ -98,6 +142,9 @@ class DevelopmentConfig(Config):
     
     # Development specific logging
     LOG_LEVEL = 'DEBUG'
+
+    # Der Entwicklungsserver läuft in einem Prozess, der simple-Cache ist damit geteilt
+    CACHE_GETEILT = True
     
     @staticmethod
     def init_app(app):
@@ -117,6 +164,16 @@ class TestingConfig(Config):
     
     # Disable rate limiting for tests
     RATELIMIT_ENABLED = False
+
+    # Live-Updates nur innerhalb des Prozesses
+    DASHBOARD_EVENTS_REDIS_URL = None
+
+    # Tests laufen in einem Prozess, der simple-Cache ist damit geteilt
+    CACHE_GETEILT = True
+
+    # Exporte direkt im Request und ohne Prozess-Pool erstellen
+    EXPORT_WORKER = 0
+    EXPORT_PROZESSE = 1
     
     @staticmethod
     def init_app(app):
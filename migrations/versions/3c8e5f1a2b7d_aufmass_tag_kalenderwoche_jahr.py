@@ -0,0 +1,93 @@
+"""aufmass_entries: tag, kalenderwoche und jahr mit Indizes
+
+Revision ID: 3c8e5f1a2b7d
+Revises: 
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e5f1a2b7d'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+SPALTEN = [
+    ('tag', sa.Date()),
+    ('kalenderwoche', sa.Integer()),
+    ('jahr', sa.Integer()),
+]
+
+INDIZES = [
+    ('ix_aufmass_entries_tag', ['tag']),
+    ('idx_aufmass_mitarbeiter_tag', ['mitarbeiter_id', 'tag']),
+    ('idx_aufmass_material_tag', ['material_id', 'tag']),
+    ('idx_aufmass_woche_mitarbeiter', ['jahr', 'kalenderwoche', 'mitarbeiter_id']),
+]
+
+# Zeilen je Backfill-Durchgang
+BATCH_GROESSE = 5000
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'aufmass_entries' not in inspector.get_table_names():
+        # Neue Datenbank: Tabellen entstehen vollständig über db.create_all()
+        return
+
+    vorhanden = {spalte['name'] for spalte in inspector.get_columns('aufmass_entries')}
+    for name, typ in SPALTEN:
+        if name not in vorhanden:
+            op.add_column('aufmass_entries', sa.Column(name, typ, nullable=True))
+
+    fuelle_datumsfelder()
+
+    indizes = {index['name'] for index in inspector.get_indexes('aufmass_entries')}
+    for name, spalten in INDIZES:
+        if name not in indizes:
+            op.create_index(name, 'aufmass_entries', spalten)
+
+
+def fuelle_datumsfelder():
+    """Berechnet tag, kalenderwoche und jahr (ISO-Woche) aus datum in Blöcken"""
+    verbindung = op.get_bind()
+    tabelle = sa.table(
+        'aufmass_entries',
+        sa.column('id', sa.Integer), sa.column('datum', sa.DateTime),
+        sa.column('tag', sa.Date), sa.column('kalenderwoche', sa.Integer), sa.column('jahr', sa.Integer)
+    )
+    aktualisieren = tabelle.update().where(tabelle.c.id == sa.bindparam('b_id')).values(
+        tag=sa.bindparam('b_tag'), kalenderwoche=sa.bindparam('b_kw'), jahr=sa.bindparam('b_jahr')
+    )
+
+    letzte_id = 0
+    while True:
+        zeilen = verbindung.execute(
+            sa.select(tabelle.c.id, tabelle.c.datum)
+            .where(tabelle.c.id > letzte_id, tabelle.c.tag.is_(None), tabelle.c.datum.isnot(None))
+            .order_by(tabelle.c.id)
+            .limit(BATCH_GROESSE)
+        ).all()
+        if not zeilen:
+            break
+
+        werte = []
+        for aufmass_id, datum in zeilen:
+            if isinstance(datum, str):
+                datum = datetime.fromisoformat(datum)
+            jahr, kw, _ = datum.isocalendar()
+            werte.append({'b_id': aufmass_id, 'b_tag': datum.date(), 'b_kw': kw, 'b_jahr': jahr})
+        verbindung.execute(aktualisieren, werte)
+        letzte_id = zeilen[-1][0]
+
+
+def downgrade():
+    for name, _ in INDIZES:
+        op.drop_index(name, table_name='aufmass_entries')
+    with op.batch_alter_table('aufmass_entries') as batch_op:
+        for name, _ in reversed(SPALTEN):
+            batch_op.drop_column(name)
@@ -0,0 +1,31 @@
+"""export_jobs: fortschritt_am für die Zeitüberschreitung ab dem letzten Fortschritt
+
+Revision ID: 4a7c2e9d1b53
+Revises: 8c3f1d6e2b47
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a7c2e9d1b53'
+down_revision = '8c3f1d6e2b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'export_jobs' not in inspector.get_table_names():
+        # Neue Datenbank: Tabellen entstehen vollständig über db.create_all()
+        return
+
+    if 'fortschritt_am' not in {spalte['name'] for spalte in inspector.get_columns('export_jobs')}:
+        op.add_column('export_jobs', sa.Column('fortschritt_am', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('export_jobs') as batch_op:
+        batch_op.drop_column('fortschritt_am')
@@ -0,0 +1,74 @@
+"""aufmass_daily_rollup: Tabelle anlegen und aus aufmass_entries befüllen
+
+Revision ID: 5e4b8c2d7a91
+Revises: 9b1e6f3d8a24
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e4b8c2d7a91'
+down_revision = '9b1e6f3d8a24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tabellen = inspector.get_table_names()
+    if 'aufmass_entries' not in tabellen:
+        # Neue Datenbank: Tabellen entstehen vollständig über db.create_all()
+        return
+
+    if 'aufmass_daily_rollup' not in tabellen:
+        op.create_table(
+            'aufmass_daily_rollup',
+            sa.Column('tag', sa.Date(), primary_key=True),
+            sa.Column('mitarbeiter_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('material_id', sa.Integer(), sa.ForeignKey('materialien.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('anzahl', sa.Integer(), nullable=False),
+            sa.Column('menge_summe', sa.Float(), nullable=False),
+        )
+        op.create_index('ix_aufmass_daily_rollup_mitarbeiter_id', 'aufmass_daily_rollup', ['mitarbeiter_id'])
+        op.create_index('ix_aufmass_daily_rollup_material_id', 'aufmass_daily_rollup', ['material_id'])
+
+    befuelle_tagesstatistik()
+
+
+def befuelle_tagesstatistik():
+    """Summiert die aktiven Aufmaße je (Tag, Mitarbeiter, Material), falls die Tabelle leer ist
+
+    Seit dem Anlegen der Tabelle fortgeschriebene Zeilen bleiben erhalten.
+    """
+    verbindung = op.get_bind()
+    statistik = sa.table(
+        'aufmass_daily_rollup',
+        sa.column('tag', sa.Date), sa.column('mitarbeiter_id', sa.Integer), sa.column('material_id', sa.Integer),
+        sa.column('anzahl', sa.Integer), sa.column('menge_summe', sa.Float)
+    )
+    aufmasse = sa.table(
+        'aufmass_entries',
+        sa.column('id', sa.Integer), sa.column('tag', sa.Date), sa.column('mitarbeiter_id', sa.Integer),
+        sa.column('material_id', sa.Integer), sa.column('menge', sa.Float), sa.column('is_deleted', sa.Boolean)
+    )
+
+    if verbindung.execute(sa.select(sa.func.count()).select_from(statistik)).scalar():
+        return
+
+    quelle = sa.select(
+        aufmasse.c.tag, aufmasse.c.mitarbeiter_id, aufmasse.c.material_id,
+        sa.func.count(aufmasse.c.id), sa.func.sum(aufmasse.c.menge)
+    ).where(
+        sa.or_(aufmasse.c.is_deleted == sa.false(), aufmasse.c.is_deleted.is_(None)),
+        aufmasse.c.tag.isnot(None)
+    ).group_by(aufmasse.c.tag, aufmasse.c.mitarbeiter_id, aufmasse.c.material_id)
+    verbindung.execute(statistik.insert().from_select(
+        ['tag', 'mitarbeiter_id', 'material_id', 'anzahl', 'menge_summe'], quelle
+    ))
+
+
+def downgrade():
+    op.drop_table('aufmass_daily_rollup')
@@ -0,0 +1,42 @@
+"""export_jobs: kalenderwoche_bis, fortschritt und gesamt für Exporte mehrerer Wochen
+
+Revision ID: 7d2a4c9e1f60
+Revises: 3c8e5f1a2b7d
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2a4c9e1f60'
+down_revision = '3c8e5f1a2b7d'
+branch_labels = None
+depends_on = None
+
+SPALTEN = [
+    ('kalenderwoche_bis', sa.Integer(), None),
+    ('fortschritt', sa.Integer(), '0'),
+    ('gesamt', sa.Integer(), None),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'export_jobs' not in inspector.get_table_names():
+        # Neue Datenbank: Tabellen entstehen vollständig über db.create_all()
+        return
+
+    vorhanden = {spalte['name'] for spalte in inspector.get_columns('export_jobs')}
+    for name, typ, standard in SPALTEN:
+        if name not in vorhanden:
+            op.add_column('export_jobs', sa.Column(
+                name, typ, nullable=standard is None, server_default=standard
+            ))
+
+
+def downgrade():
+    with op.batch_alter_table('export_jobs') as batch_op:
+        for name, _, _ in reversed(SPALTEN):
+            batch_op.drop_column(name)
@@ -0,0 +1,46 @@
+"""aufmass_total: Zählerzeile mit der Anzahl aller aktiven Aufmaße
+
+Revision ID: 8c3f1d6e2b47
+Revises: 5e4b8c2d7a91
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c3f1d6e2b47'
+down_revision = '5e4b8c2d7a91'
+branch_labels = None
+depends_on = None
+
+ZEILE = 1
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tabellen = inspector.get_table_names()
+    if 'aufmass_daily_rollup' not in tabellen:
+        # Neue Datenbank: Tabellen entstehen vollständig über db.create_all()
+        return
+
+    if 'aufmass_total' not in tabellen:
+        op.create_table(
+            'aufmass_total',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('anzahl', sa.Integer(), nullable=False),
+        )
+
+    verbindung = op.get_bind()
+    zaehler = sa.table('aufmass_total', sa.column('id', sa.Integer), sa.column('anzahl', sa.Integer))
+    statistik = sa.table('aufmass_daily_rollup', sa.column('anzahl', sa.Integer))
+    if verbindung.execute(sa.select(zaehler.c.id).where(zaehler.c.id == ZEILE)).first() is None:
+        verbindung.execute(zaehler.insert().from_select(
+            ['id', 'anzahl'],
+            sa.select(sa.literal(ZEILE), sa.func.coalesce(sa.func.sum(statistik.c.anzahl), 0))
+        ))
+
+
+def downgrade():
+    op.drop_table('aufmass_total')
@@ -0,0 +1,37 @@
+"""bautagebuch_entries und wochen_exports: Indizes auf (jahr, kalenderwoche)
+
+Revision ID: 9b1e6f3d8a24
+Revises: 7d2a4c9e1f60
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1e6f3d8a24'
+down_revision = '7d2a4c9e1f60'
+branch_labels = None
+depends_on = None
+
+INDIZES = [
+    ('bautagebuch_entries', 'idx_bautagebuch_jahr_kw', ['jahr', 'kalenderwoche']),
+    ('wochen_exports', 'idx_wochen_export_jahr_kw', ['jahr', 'kalenderwoche']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tabellen = inspector.get_table_names()
+    for tabelle, name, spalten in INDIZES:
+        if tabelle not in tabellen:
+            # Neue Datenbank: Tabellen entstehen vollständig über db.create_all()
+            continue
+        if name not in {index['name'] for index in inspector.get_indexes(tabelle)}:
+            op.create_index(name, tabelle, spalten)
+
+
+def downgrade():
+    for tabelle, name, _ in INDIZES:
+        op.drop_index(name, table_name=tabelle)
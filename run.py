@@ -32,7 +32,9 @@ def deploy():
         from app.models.user import User
         from app.models.material import Material
         from app.models.aufmass import AufmassEntry, AufmassDocument
-        from app.models.bautagebuch import BautagebuchEntry, Bautagebuch, WochenExport
+        from app.models.bautagebuch import BautagebuchEntry, Bautagebuch, WochenExport, ExportAuftrag
+        from app.models.duplikat import DuplikatKandidat, DuplikatAusnahme
+        from app.models.statistik import AufmassTagesstatistik, AufmassGesamtzahl
 
         logger.info("Importing models successful")
 
@@ -54,6 +56,13 @@ def deploy():
             else:
                 raise
 
+        # Tagesstatistik und Gesamtzahl der Dashboards für bestehende Aufmaße aufbauen
+        anzahl = AufmassTagesstatistik.baue_auf_falls_leer()
+        if AufmassGesamtzahl.lege_an() or anzahl is not None:
+            db.session.commit()
+        if anzahl is not None:
+            logger.info(f"✓ Tagesstatistik aufgebaut: {anzahl} Tageszeilen")
+
         # Create admin user if it doesn't exist
         logger.info("Checking for admin user...")
         try:
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Benchmark für die Duplikatserkennung
+
+Erzeugt für jede Größe deterministische Testdaten (scripts/testdaten.py)
+in einer frischen Datenbank und misst:
+
+- DuplikatsPruefer.finde_duplikate (Komplett-Scan)
+- DuplikatsPruefer.finde_paare_parallel (Prozess-Pool)
+- baue_kandidaten_neu + lade_gruppen (Kandidaten-Tabelle)
+- Live-Prüfung über /aufmass/api/check_duplicate und /duplikate/api/duplikate/check
+
+Ausgegeben werden Laufzeit, Zeilen/s und Spitzenspeicher (tracemalloc). Die
+Ergebnisse aller Varianten werden miteinander verglichen, bis zur Größe
+--referenz-max zusätzlich mit dem vollständigen Paarvergleich. Bei Abweichungen
+endet das Skript mit Exit-Code 1.
+
+Aufruf:
+    python scripts/benchmark_duplikate.py --groessen 1000 10000 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models.aufmass import AufmassEntry
+from app.models.material import Material
+from app.models.user import User
+from app.routes.duplikate import DuplikatsPruefer
+from app.utils.aehnlichkeit import lade_aufmass_zeilen
+from app.utils.duplikat_index import normalisiere_ort
+from scripts.testdaten import erzeuge_testdaten
+
+
+def messe(funktion, speicher=True):
+    """Führt die Funktion aus; liefert Ergebnis, Sekunden und Spitzenspeicher in MB
+
+    Die Laufzeit wird ohne tracemalloc gemessen, der Speicher in einem
+    zweiten Durchlauf.
+    """
+    start = time.perf_counter()
+    ergebnis = funktion()
+    sekunden = time.perf_counter() - start
+
+    spitze = None
+    if speicher:
+        tracemalloc.start()
+        funktion()
+        spitze = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    return ergebnis, sekunden, spitze
+
+
+def signatur(duplikate):
+    """Vergleichbare Darstellung der Duplikat-Gruppen (IDs statt ORM-Objekte)"""
+    return [
+        (g['haupteintrag'], [(a['aufmass'], a['aehnlichkeit']) for a in g['aehnliche']],
+         [(p['a'], p['b'], p['aehnlichkeit']) for p in g['paare']], g['risiko'], g['kriterien'])
+        for g in duplikate
+    ]
+
+
+def paarweise_referenz():
+    """Vollständiger Paarvergleich (O(n²)), nur für kleine Größen"""
+    aufmaesse = lade_aufmass_zeilen()
+    paare = []
+    for i, aufmass in enumerate(aufmaesse):
+        for aehnlich in DuplikatsPruefer._finde_aehnliche_eintraege(aufmass, aufmaesse[i + 1:]):
+            paare.append((aufmass.id, aehnlich['aufmass'].id, aehnlich['aehnlichkeit']))
+    return paare
+
+
+def live_referenz(material_id, tag, ort):
+    """Live-Prüfung direkt gegen die Datenbank (gleiche Normalisierung wie der Index)"""
+    von = datetime.combine(tag, datetime.min.time())
+    return sorted(
+        aufmass_id
+        for aufmass_id, eintrag_ort in db.session.query(AufmassEntry.id, AufmassEntry.ort).filter(
+            AufmassEntry.material_id == material_id,
+            AufmassEntry.datum >= von,
+            AufmassEntry.datum < von + timedelta(days=1)
+        )
+        if normalisiere_ort(ort) in normalisiere_ort(eintrag_ort)
+    )
+
+
+def live_referenz_aehnliche(material, tag, ort, limit=5):
+    """Wie live_referenz, jedoch Materialname enthält den Suchbegriff, ±1 Tag, neueste zuerst"""
+    von = datetime.combine(tag - timedelta(days=1), datetime.min.time())
+    treffer = [
+        (datum, aufmass_id)
+        for aufmass_id, datum, eintrag_ort in db.session.query(
+            AufmassEntry.id, AufmassEntry.datum, AufmassEntry.ort
+        ).join(Material, AufmassEntry.material_id == Material.id).filter(
+            Material.name.ilike(f'%{material}%'),
+            AufmassEntry.datum >= von,
+            AufmassEntry.datum < von + timedelta(days=3)
+        )
+        if normalisiere_ort(ort) in normalisiere_ort(eintrag_ort)
+    ]
+    return [aufmass_id for _, aufmass_id in sorted(treffer, reverse=True)[:limit]]
+
+
+def benchmark(groesse, args):
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.datenbank
+    ergebnisse = []
+
+    with app.app_context():
+        db.create_all()
+        try:
+            statistik = erzeuge_testdaten(
+                groesse, duplikat_rate=args.duplikat_rate, tippfehler_rate=args.tippfehler_rate, seed=args.seed
+            )
+            print(f"\n{groesse} Aufmaße ({statistik['duplikate']} Duplikate, {statistik['tippfehler']} Tippfehler)")
+
+            # Komplett-Scan
+            duplikate, sekunden, spitze = messe(DuplikatsPruefer.finde_duplikate, args.speicher)
+            erwartet = signatur(duplikate)
+            ergebnisse.append(('finde_duplikate', sekunden, spitze, None))
+
+            # Paralleler Scan
+            def parallel():
+                aufmaesse = lade_aufmass_zeilen()
+                paare = DuplikatsPruefer.finde_paare_parallel(aufmaesse, workers=args.workers)
+                schluessel = {a.id: DuplikatsPruefer._sortierschluessel(a) for a in aufmaesse}
+                return DuplikatsPruefer._bilde_gruppen(paare, schluessel)
+
+            gruppen, sekunden, spitze = messe(parallel, args.speicher)
+            ergebnisse.append(('finde_paare_parallel', sekunden, spitze, signatur(gruppen) == erwartet))
+
+            # Kandidaten-Tabelle
+            def tabelle():
+                DuplikatsPruefer.baue_kandidaten_neu()
+                return DuplikatsPruefer.lade_gruppen()
+
+            gruppen, sekunden, spitze = messe(tabelle, args.speicher)
+            ergebnisse.append(('baue_kandidaten_neu', sekunden, spitze, signatur(gruppen) == erwartet))
+
+            # Vollständiger Paarvergleich als Referenz
+            if groesse <= args.referenz_max:
+                paare, sekunden, _ = messe(paarweise_referenz, speicher=False)
+                gefunden = sorted((p[0], p[1], p[2]) for g in erwartet for p in g[2])
+                ergebnisse.append(('paarweise (Referenz)', sekunden, None, gefunden == sorted(paare)))
+
+            ergebnisse.extend(benchmark_live_pruefung(app, args))
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+    print(f"{'Messung':<28}{'Sekunden':>10}{'Zeilen/s':>14}{'Peak MB':>10}  Identisch")
+    for name, sekunden, spitze, identisch in ergebnisse:
+        anzahl = min(args.live_anfragen, groesse) if name.startswith('/') else groesse
+        print(
+            f"{name:<28}{sekunden:>10.3f}{anzahl / sekunden if sekunden else 0:>14,.0f}"
+            f"{spitze if spitze is not None else float('nan'):>10.1f}  "
+            f"{'-' if identisch is None else 'ja' if identisch else 'NEIN'}"
+        )
+    print("(bei den Endpunkten: Anfragen/s)")
+
+    return all(identisch is not False for _, _, _, identisch in ergebnisse)
+
+
+def benchmark_live_pruefung(app, args):
+    """Misst beide Live-Prüfungs-Endpunkte mit Stichproben aus den Daten"""
+    rng = random.Random(args.seed)
+    alle = db.session.query(AufmassEntry.material_id, AufmassEntry.datum, AufmassEntry.ort).all()
+    stichprobe = rng.sample(alle, min(args.live_anfragen, len(alle)))
+
+    user = User(username='benchmark', email='benchmark@example.com', role='admin')
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+    # Index-Aufbau (erste Anfrage) getrennt messen
+    material_id, datum, ort = stichprobe[0]
+    start = time.perf_counter()
+    client.post('/aufmass/api/check_duplicate', json={
+        'material_id': material_id, 'ort': ort, 'datum': datum.strftime('%Y-%m-%d')
+    })
+    ergebnisse = [('Live-Index Aufbau', time.perf_counter() - start, None, None)]
+
+    identisch = True
+    start = time.perf_counter()
+    antworten = []
+    for material_id, datum, ort in stichprobe:
+        antworten.append(client.post('/aufmass/api/check_duplicate', json={
+            'material_id': material_id, 'ort': ort[:4], 'datum': datum.strftime('%Y-%m-%d')
+        }).get_json())
+    sekunden = time.perf_counter() - start
+
+    for (material_id, datum, ort), antwort in zip(stichprobe, antworten):
+        erwartet = len(live_referenz(material_id, datum.date(), ort[:4]))
+        identisch &= antwort.get('count', 0) == erwartet
+    ergebnisse.append(('/aufmass/api/check_duplicate', sekunden, None, identisch))
+
+    start = time.perf_counter()
+    antworten = []
+    for material_id, datum, ort in stichprobe:
+        antworten.append(client.post('/duplikate/api/duplikate/check', json={
+            'material': 'kabel', 'ort': ort[:4], 'datum': datum.strftime('%Y-%m-%d')
+        }).get_json())
+    sekunden = time.perf_counter() - start
+
+    identisch = True
+    for (material_id, datum, ort), antwort in zip(stichprobe, antworten):
+        erwartet = live_referenz_aehnliche('kabel', datum.date(), ort[:4])
+        identisch &= [d['id'] for d in antwort['duplikate']] == erwartet
+    ergebnisse.append(('/duplikate/api/.../check', sekunden, None, identisch))
+
+    return ergebnisse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark der Duplikatserkennung')
+    parser.add_argument('--groessen', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Anzahl Aufmaße je Durchlauf')
+    parser.add_argument('--duplikat-rate', type=float, default=0.05, help='Anteil kopierter Einträge')
+    parser.add_argument('--tippfehler-rate', type=float, default=0.02, help='Anteil Tippfehler im Ort')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None, help='Prozesse für den parallelen Scan')
+    parser.add_argument('--referenz-max', type=int, default=2000,
+                        help='Bis zu dieser Größe zusätzlich mit dem vollständigen Paarvergleich prüfen')
+    parser.add_argument('--live-anfragen', type=int, default=200, help='Anfragen je Live-Prüfungs-Endpunkt')
+    parser.add_argument('--datenbank', default='sqlite:///:memory:', help='SQLAlchemy-URL der Benchmark-Datenbank')
+    parser.add_argument('--ohne-speicher', dest='speicher', action='store_false',
+                        help='Keine Speichermessung (halbiert die Laufzeit)')
+    args = parser.parse_args()
+
+    ok = True
+    for groesse in args.groessen:
+        ok &= benchmark(groesse, args)
+
+    if not ok:
+        print("\nFEHLER: Ergebnisse der Varianten weichen voneinander ab")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
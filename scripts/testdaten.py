@@ -0,0 +1,117 @@
+"""
+Deterministische Testdaten für Duplikatserkennung und Benchmarks
+
+Erzeugt Benutzer, Materialien und Aufmaße mit einstellbarem Anteil an
+Duplikaten (Kopie eines früheren Eintrags, ggf. einen Tag versetzt oder
+mit leicht abweichender Menge) und an Tippfehlern im Ort. Gleicher Seed
+und gleiche Parameter ergeben immer dieselben Daten.
+
+Nur für scripts/benchmark_duplikate.py und die Tests, nicht Teil der App.
+"""
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import db
+from app.models.aufmass import AufmassEntry
+from app.models.material import Material
+from app.models.user import User
+from app.models.statistik import AufmassTagesstatistik
+
+MATERIAL_NAMEN = [
+    'Kabel NYM-J 3x1,5', 'Kabel NYM-J 5x1,5', 'Kabel NYM-J 3x2,5', 'Kabel NYM-J 5x2,5',
+    'Kabel NYY-J 5x10', 'Kabelkanal 40x60', 'Kabelkanal 60x110', 'Leerrohr M20',
+    'Leerrohr M25', 'Leerrohr M32', 'Schalterdose', 'Abzweigdose', 'Hohlwanddose',
+    'Steckdose', 'Schalter', 'Lichtschalter', 'Kabelrinne 200', 'Kabelrinne 300',
+    'Erdungsband', 'Potentialausgleichsschiene', 'Beton C25/30', 'Estrich', 'Dämmung',
+    'Rohr DN100', 'Rohr DN150', 'Gipskarton', 'Trockenbauprofil CW50', 'Trockenbauprofil UW50'
+]
+EINHEITEN = ['m', 'm', 'm', 'Stk', 'm²', 'm³']
+
+GESCHOSSE = ['KG', 'EG', 'OG 1', 'OG 2', 'OG 3', 'DG']
+BEREICHE = ['Flur', 'Treppenhaus', 'Technikraum', 'Küche', 'Bad', 'Büro', 'Lager', 'Raum']
+
+
+def erzeuge_testdaten(anzahl, duplikat_rate=0.05, tippfehler_rate=0.02, seed=42,
+                      anzahl_benutzer=20, anzahl_materialien=None,
+                      start=datetime(2023, 1, 1, 7, 0), tage=365):
+    """Legt Benutzer, Materialien und `anzahl` Aufmaße an
+
+    Die Aufmaße werden per Bulk-Insert geschrieben, ohne ORM-Events
+    (kein Bautagebuch-Eintrag, kein Live-Index, is_duplicate_checked=False);
+    die Tagesstatistik wird anschließend neu aufgebaut.
+
+    Returns:
+        dict: Anzahl der erzeugten Duplikate und Tippfehler
+    """
+    rng = random.Random(seed)
+
+    benutzer = []
+    for nummer in range(anzahl_benutzer):
+        user = User(username=f'mitarbeiter{nummer:03d}', email=f'mitarbeiter{nummer:03d}@example.com',
+                    role='mitarbeiter')
+        user.password_hash = 'x'
+        benutzer.append(user)
+    db.session.add_all(benutzer)
+
+    # Über die Grundliste hinaus nummerierte Varianten (Materialnamen sind eindeutig)
+    namen = [
+        MATERIAL_NAMEN[i % len(MATERIAL_NAMEN)] + (f' #{i // len(MATERIAL_NAMEN)}' if i >= len(MATERIAL_NAMEN) else '')
+        for i in range(anzahl_materialien or len(MATERIAL_NAMEN))
+    ]
+    materialien = [Material(name=name, unit=rng.choice(EINHEITEN)) for name in namen]
+    db.session.add_all(materialien)
+    db.session.commit()
+
+    benutzer_ids = [user.id for user in benutzer]
+    material_ids = [material.id for material in materialien]
+
+    zeilen = []
+    statistik = {'duplikate': 0, 'tippfehler': 0}
+    for _ in range(anzahl):
+        if zeilen and rng.random() < duplikat_rate:
+            # Kopie eines früheren Eintrags: gleicher Tag oder Folgetag, Menge ggf. leicht abweichend
+            vorlage = zeilen[rng.randrange(len(zeilen))]
+            zeile = dict(vorlage)
+            zeile['datum'] = vorlage['datum'] + timedelta(days=rng.choice([0, 0, 0, 1]), minutes=rng.randint(0, 120))
+            if rng.random() < 0.3:
+                zeile['menge'] = round(vorlage['menge'] * rng.uniform(0.95, 1.05), 2)
+            statistik['duplikate'] += 1
+        else:
+            zeile = {
+                'material_id': rng.choice(material_ids),
+                'mitarbeiter_id': rng.choice(benutzer_ids),
+                'ort': f'{rng.choice(GESCHOSSE)} {rng.choice(BEREICHE)} {rng.randint(1, 30)}',
+                'menge': round(rng.uniform(0.5, 200.0), 1),
+                'datum': start + timedelta(days=rng.randrange(tage), hours=rng.randint(0, 10),
+                                           minutes=rng.randint(0, 59)),
+            }
+
+        if rng.random() < tippfehler_rate:
+            zeile['ort'] = _tippfehler(zeile['ort'], rng)
+            statistik['tippfehler'] += 1
+
+        zeilen.append(zeile)
+
+    erstellt_am = datetime(2024, 1, 1)
+    db.session.execute(insert(AufmassEntry.__table__), [
+        dict(zeile, is_duplicate_checked=False, is_approved=True, is_deleted=False,
+             created_at=erstellt_am, updated_at=erstellt_am, **AufmassEntry.datumsfelder(zeile['datum']))
+        for zeile in zeilen
+    ])
+    AufmassTagesstatistik.baue_neu()
+    db.session.commit()
+
+    return statistik
+
+
+def _tippfehler(text, rng):
+    """Vertauscht, verdoppelt oder entfernt ein Zeichen"""
+    if len(text) < 3:
+        return text + text[-1:]
+    position = rng.randrange(len(text) - 1)
+    art = rng.randrange(3)
+    if art == 0:
+        return text[:position] + text[position + 1] + text[position] + text[position + 2:]
+    if art == 1:
+        return text[:position] + text[position] + text[position:]
+    return text[:position] + text[position + 1:]
@@ -0,0 +1,96 @@
+"""
+Tests für die Messung der SQL-Anweisungen je Request
+"""
+import logging
+import pytest
+from flask import g
+from prometheus_client import CollectorRegistry
+from prometheus_flask_exporter import PrometheusMetrics
+from app import create_app, db
+from app.models.user import User
+from app.utils import abfrage_budget
+
+
+@pytest.fixture
+def app():
+    """Create test app with one user and a route issuing N+1 queries."""
+    app = create_app('testing')
+
+    @app.route('/_test/n_plus_1')
+    def n_plus_1():
+        for user_id in range(1, 6):
+            db.session.get(User, user_id)
+        return 'ok'
+
+    with app.app_context():
+        db.create_all()
+        for name in ('a', 'b', 'c', 'd', 'e'):
+            user = User(username=name, email=f'{name}@example.com', role='mitarbeiter')
+            user.set_password('testpassword')
+            db.session.add(user)
+        db.session.commit()
+        db.session.expunge_all()
+        yield app
+        db.drop_all()
+
+
+class TestForm:
+
+    def test_literals_and_parameters_removed(self):
+        assert abfrage_budget.form("SELECT * FROM t WHERE id = 5 AND name = 'x''y'") == \
+            abfrage_budget.form("SELECT *\n  FROM t WHERE id = 17 AND name = 'z'")
+        assert abfrage_budget.form('SELECT * FROM t WHERE id IN (?, ?, ?)') == \
+            abfrage_budget.form('SELECT * FROM t WHERE id IN (%(id_1)s)')
+
+
+class TestMessung:
+
+    def test_counts_statements_and_repetitions(self, app):
+        gemessen = []
+        # Teardown-Funktionen laufen in umgekehrter Reihenfolge, diese also vor der Auswertung
+        app.teardown_request(lambda exc: gemessen.append(g.get('abfrage_messung')))
+
+        assert app.test_client().get('/_test/n_plus_1').status_code == 200
+        messung = gemessen[0]
+        assert messung.anweisungen == 5
+        assert messung.wiederholungen == 4
+        assert messung.db_zeit > 0
+
+    def test_budget_warning_with_fingerprint(self, app, caplog):
+        app.config['ABFRAGE_BUDGET_ENDPUNKTE'] = {'n_plus_1': {'wiederholungen': 2}}
+        with caplog.at_level(logging.WARNING, logger='app.utils.abfrage_budget'):
+            app.test_client().get('/_test/n_plus_1')
+
+        meldung = caplog.records[-1].getMessage()
+        assert 'n_plus_1' in meldung
+        assert 'wiederholungen 4 > 2' in meldung
+        assert '(5x): SELECT users.id' in meldung
+        assert 'users.id = ?' in meldung
+
+    def test_within_budget_no_warning(self, app, caplog):
+        with caplog.at_level(logging.WARNING, logger='app.utils.abfrage_budget'):
+            app.test_client().get('/_test/n_plus_1')
+        assert not caplog.records
+
+    def test_prometheus_histograms(self):
+        app = create_app('testing')
+        registry = CollectorRegistry()
+        metrics = PrometheusMetrics(app, registry=registry)
+        abfrage_budget.init_app(app, metrics)
+
+        @app.route('/_test/eins')
+        def eins():
+            db.session.execute(db.select(User.id)).all()
+            return 'ok'
+
+        with app.app_context():
+            db.create_all()
+            app.test_client().get('/_test/eins')
+            db.drop_all()
+
+        assert registry.get_sample_value(
+            'bautagebuch_request_db_statements_count', {'endpoint': 'eins'}) == 1
+        assert registry.get_sample_value(
+            'bautagebuch_request_db_statements_sum', {'endpoint': 'eins'}) == 1
+        assert registry.get_sample_value(
+            'bautagebuch_request_db_repeated_statements_sum', {'endpoint': 'eins'}) == 0
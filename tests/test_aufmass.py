@@ -0,0 +1,138 @@
+"""
+Tests für Aufmaß-Datumsfelder und Zeitraum-Filter
+"""
+import pytest
+from datetime import date, datetime
+from app import create_app, db
+from app.models.user import User
+from app.models.material import Material
+from app.models.aufmass import AufmassEntry
+from app.models.bautagebuch import BautagebuchEntry
+from app.utils.zeitraum import filter_zeitraum, kalenderwoche, parse_tag, wochen_grenzen
+
+
+@pytest.fixture
+def app():
+    """Create test app."""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def sample_data(app):
+    """Create a user, a material and entries around the turn of the year."""
+    user = User(username='bauleiter', email='bauleiter@example.com', role='bauleiter')
+    user.set_password('testpassword')
+    material = Material(name='Kabel', unit='m')
+    db.session.add_all([user, material])
+    db.session.commit()
+
+    eintraege = [
+        AufmassEntry(material_id=material.id, mitarbeiter_id=user.id, ort='EG', menge=1.0, datum=datum)
+        for datum in [datetime(2024, 12, 29, 23, 30), datetime(2024, 12, 30, 7, 0), datetime(2025, 1, 5, 12, 0)]
+    ]
+    db.session.add_all(eintraege)
+    db.session.commit()
+    return {'user': user, 'material': material, 'eintraege': eintraege}
+
+
+class TestDatumsfelder:
+    """tag, kalenderwoche und jahr werden beim Schreiben gesetzt"""
+
+    def test_fields_follow_iso_week(self, sample_data):
+        felder = [(e.tag, e.kalenderwoche, e.jahr) for e in sample_data['eintraege']]
+        assert felder == [
+            (date(2024, 12, 29), 52, 2024),
+            (date(2024, 12, 30), 1, 2025),
+            (date(2025, 1, 5), 1, 2025),
+        ]
+
+    def test_fields_updated_on_edit(self, sample_data):
+        eintrag = sample_data['eintraege'][0]
+        db.session.commit()
+        eintrag.datum = datetime(2025, 3, 10, 9, 0)
+        db.session.commit()
+
+        gespeichert = db.session.query(
+            AufmassEntry.tag, AufmassEntry.kalenderwoche, AufmassEntry.jahr
+        ).filter_by(id=eintrag.id).one()
+        assert tuple(gespeichert) == (date(2025, 3, 10), 11, 2025)
+
+    def test_default_datum_sets_fields(self, sample_data):
+        eintrag = AufmassEntry(material_id=sample_data['material'].id, mitarbeiter_id=sample_data['user'].id,
+                               ort='OG', menge=2.0)
+        db.session.add(eintrag)
+        db.session.commit()
+        assert eintrag.tag == eintrag.datum.date()
+        assert (eintrag.jahr, eintrag.kalenderwoche) == kalenderwoche(eintrag.datum)
+
+    def test_bautagebuch_uses_iso_week(self, sample_data):
+        eintrag = BautagebuchEntry.query.filter_by(aufmass_entry_id=sample_data['eintraege'][1].id).one()
+        assert (eintrag.jahr, eintrag.kalenderwoche) == (2025, 1)
+
+
+class TestZeitraum:
+    """Gemeinsame Zeitraum-Hilfen"""
+
+    def test_week_bounds(self):
+        assert wochen_grenzen(2025, 1) == (date(2024, 12, 30), date(2025, 1, 5))
+        assert kalenderwoche(date(2021, 1, 3)) == (2020, 53)
+
+    def test_parse_tag(self):
+        assert parse_tag('2025-01-05') == date(2025, 1, 5)
+        assert parse_tag('') is None
+        assert parse_tag('05.01.2025') is None
+
+    def test_filter_is_inclusive(self, sample_data):
+        query = filter_zeitraum(AufmassEntry.query, AufmassEntry.tag, date(2024, 12, 30), date(2025, 1, 5))
+        assert query.count() == 2
+        assert filter_zeitraum(AufmassEntry.query, AufmassEntry.tag).count() == 3
+
+    def test_filter_does_not_wrap_column(self, sample_data):
+        """Der Filter vergleicht die Spalte direkt, damit der Index greift"""
+        query = filter_zeitraum(AufmassEntry.query, AufmassEntry.tag, date(2025, 1, 1))
+        sql = str(query.statement.compile())
+        assert 'aufmass_entries.tag >=' in sql
+        assert 'date(' not in sql.lower()
+
+    def test_list_filter(self, app, sample_data):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(sample_data['user'].id)
+            session['_fresh'] = True
+
+        response = client.get('/aufmass/liste?datum_von=2024-12-30&datum_bis=2024-12-30')
+        assert response.status_code == 200
+        assert b'30.12.2024' in response.data
+        assert b'29.12.2024' not in response.data
+
+
+class TestEingabe:
+    """Aufmaß über das Formular erfassen"""
+
+    def test_form_creates_one_diary_entry(self, app, sample_data):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(sample_data['user'].id)
+            session['_fresh'] = True
+
+        response = client.post('/aufmass/eingabe', data={
+            'material_id': sample_data['material'].id,
+            'ort': 'Dachgeschoss',
+            'menge': '2.5',
+            'datum': '2025-03-10',
+            'bemerkungen': 'Nachtrag'
+        })
+        assert response.status_code == 302
+
+        aufmass = AufmassEntry.query.filter_by(ort='Dachgeschoss').one()
+        eintraege = BautagebuchEntry.query.filter_by(aufmass_entry_id=aufmass.id).all()
+        assert len(eintraege) == 1
+        assert 'Kabel, Menge: 2.5 m' in eintraege[0].text
+        assert (eintraege[0].jahr, eintraege[0].kalenderwoche) == (2025, 11)
+
+    def test_diary_text_uses_material_unit(self, sample_data):
+        assert 'Menge: 1.0 m.' in sample_data['eintraege'][0].to_bautagebuch_text()
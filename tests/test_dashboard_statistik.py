@@ -0,0 +1,719 @@
+"""
+Tests für die Tagesstatistik der Dashboards
+"""
+import random
+import threading
+import pytest
+from jinja2 import TemplateSyntaxError
+from contextlib import contextmanager
+from flask import g
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import event, func, or_
+from app import create_app, db, cache
+from app.models.user import User
+from app.models.material import Material
+from app.models.aufmass import AufmassEntry
+from app.models.statistik import AufmassTagesstatistik, AufmassGesamtzahl
+from app.utils import dashboard_cache, dashboard_events
+from app.utils.dashboard_statistik import DashboardStatistik
+from app.utils.zeitreihe import zeitreihe, intervall_anfang
+
+
+@pytest.fixture
+def app():
+    """Create test app."""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def sample_data(app):
+    """Create users, materials and entries around today."""
+    rng = random.Random(7)
+
+    users = []
+    for name, role in [('admin', 'admin'), ('bauleiter', 'bauleiter'), ('max', 'mitarbeiter'), ('erika', 'mitarbeiter')]:
+        user = User(username=name, email=f'{name}@example.com', role=role)
+        user.set_password('testpassword')
+        users.append(user)
+    db.session.add_all(users)
+
+    materials = [Material(name=name, unit='m') for name in ['Kabel', 'Rohr', 'Dose']]
+    db.session.add_all(materials)
+    db.session.commit()
+
+    heute = datetime.now(timezone.utc).replace(hour=9, minute=0, second=0, microsecond=0, tzinfo=None)
+    for _ in range(60):
+        db.session.add(AufmassEntry(
+            material_id=rng.choice(materials).id,
+            mitarbeiter_id=rng.choice(users).id,
+            ort='EG',
+            menge=rng.choice([1.0, 2.5, 10.0]),
+            datum=heute - timedelta(days=rng.randint(0, 40))
+        ))
+    db.session.commit()
+
+    return {'users': users, 'materials': materials}
+
+
+def tagesstatistik():
+    """Inhalt der Tabelle als {(tag, mitarbeiter_id, material_id): (anzahl, menge_summe)}"""
+    return {
+        (zeile.tag, zeile.mitarbeiter_id, zeile.material_id): (zeile.anzahl, round(zeile.menge_summe, 6))
+        for zeile in AufmassTagesstatistik.query
+    }
+
+
+def aus_aufmassen():
+    """Erwartete Tagesstatistik direkt aus aufmass_entries"""
+    erwartet = {}
+    for eintrag in AufmassEntry.query.filter(or_(AufmassEntry.is_deleted == False, AufmassEntry.is_deleted.is_(None))):
+        schluessel = (eintrag.datum.date(), eintrag.mitarbeiter_id, eintrag.material_id)
+        anzahl, menge = erwartet.get(schluessel, (0, 0.0))
+        erwartet[schluessel] = (anzahl + 1, menge + eintrag.menge)
+    return {schluessel: (anzahl, round(menge, 6)) for schluessel, (anzahl, menge) in erwartet.items()}
+
+
+@contextmanager
+def zaehle_anweisungen():
+    """Zählt die an die Datenbank gesendeten SQL-Anweisungen (ohne Hintergrund-Threads)"""
+    anweisungen = []
+    thread = threading.current_thread()
+
+    def merke(conn, cursor, statement, parameters, context, executemany):
+        if threading.current_thread() is thread:
+            anweisungen.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', merke)
+    try:
+        yield anweisungen
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', merke)
+
+
+def login(app, user):
+    # Die Tests teilen sich einen App-Kontext: angemeldeten Benutzer aus g und
+    # geladene Objekte verwerfen, damit der user_loader wie im Betrieb läuft
+    user_id = user.id
+    g.pop('_login_user', None)
+    db.session.expunge_all()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+class TestAufmassTagesstatistik:
+    """Fortschreibung der Tagesstatistik"""
+
+    def test_insert_updates_rollup(self, sample_data):
+        assert tagesstatistik() == aus_aufmassen()
+        assert AufmassTagesstatistik.anzahl_aufmasse() == 60
+
+    def test_edit_soft_delete_and_delete_update_rollup(self, sample_data):
+        eintraege = AufmassEntry.query.order_by(AufmassEntry.id).all()
+
+        eintraege[0].menge = 99.0
+        eintraege[1].datum = eintraege[1].datum - timedelta(days=3)
+        eintraege[2].material_id = sample_data['materials'][2].id
+        eintraege[3].mitarbeiter_id = sample_data['users'][3].id
+        db.session.commit()
+        assert tagesstatistik() == aus_aufmassen()
+
+        eintraege[4].soft_delete()
+        assert tagesstatistik() == aus_aufmassen()
+
+        eintraege[4].restore()
+        assert tagesstatistik() == aus_aufmassen()
+
+        db.session.delete(eintraege[5])
+        db.session.commit()
+        assert tagesstatistik() == aus_aufmassen()
+        assert AufmassTagesstatistik.anzahl_aufmasse() == 59
+
+    def test_change_of_unloaded_attribute(self, sample_data):
+        """Nach dem Commit sind die Attribute abgelaufen, der alte Wert fehlt in der History"""
+        eintrag = AufmassEntry.query.first()
+        db.session.commit()
+        eintrag.menge = 42.0
+        db.session.commit()
+        assert tagesstatistik() == aus_aufmassen()
+
+    def test_rollback_discards_changes(self, sample_data):
+        vorher = tagesstatistik()
+        eintrag = AufmassEntry.query.first()
+        eintrag.menge = 1000.0
+        db.session.flush()
+        db.session.rollback()
+        assert tagesstatistik() == vorher
+
+    def test_empty_rows_are_removed(self, sample_data):
+        for eintrag in AufmassEntry.query.all():
+            eintrag.is_deleted = True
+        db.session.commit()
+        assert AufmassTagesstatistik.query.count() == 0
+
+    def test_rebuild_matches_incremental(self, sample_data):
+        erwartet = tagesstatistik()
+        db.session.query(AufmassTagesstatistik).delete()
+        db.session.commit()
+
+        assert AufmassTagesstatistik.baue_neu() == len(erwartet)
+        db.session.commit()
+        assert tagesstatistik() == erwartet
+
+    def test_rebuild_only_when_empty(self, sample_data):
+        erwartet = tagesstatistik()
+        assert AufmassTagesstatistik.baue_auf_falls_leer() is None
+
+        db.session.query(AufmassTagesstatistik).delete()
+        db.session.commit()
+        assert AufmassTagesstatistik.baue_auf_falls_leer() == len(erwartet)
+        db.session.commit()
+        assert tagesstatistik() == erwartet
+
+    def test_cli_rebuild(self, app, sample_data):
+        erwartet = tagesstatistik()
+        db.session.query(AufmassTagesstatistik).delete()
+        db.session.commit()
+
+        ergebnis = app.test_cli_runner().invoke(args=['dashboard', 'statistik-aufbauen'])
+        assert ergebnis.exit_code == 0
+        assert tagesstatistik() == erwartet
+
+
+class TestDashboardStatistik:
+    """Dashboards und API lesen aus der Tagesstatistik"""
+
+    def test_bauleiter_counts(self, app, sample_data):
+        heute = datetime.now(timezone.utc).date()
+        woche = heute - timedelta(days=heute.weekday())
+        aktiv = AufmassEntry.query.filter(AufmassEntry.is_deleted == False)
+
+        assert AufmassTagesstatistik.anzahl_aufmasse(von=heute, bis=heute) == \
+            aktiv.filter(func.date(AufmassEntry.datum) == heute).count()
+        assert AufmassTagesstatistik.anzahl_aufmasse(von=woche) == \
+            aktiv.filter(func.date(AufmassEntry.datum) >= woche).count()
+
+        response = login(app, sample_data['users'][1]).get('/bauleiter')
+        assert response.status_code == 200
+
+    def test_mitarbeiter_dashboard(self, app, sample_data):
+        response = login(app, sample_data['users'][2]).get('/mitarbeiter')
+        assert response.status_code == 200
+
+    def test_api_stats_for_mitarbeiter(self, app, sample_data):
+        max_ = sample_data['users'][2]
+        stats = login(app, max_).get('/api/dashboard/stats').get_json()['stats']
+        assert stats['total_entries'] == AufmassEntry.query.filter_by(mitarbeiter_id=max_.id).count()
+        assert stats['active_materials'] == 3
+
+    def test_api_user_activity(self, app, sample_data):
+        response = login(app, sample_data['users'][0]).get('/api/user/activity?all=true')
+        activity = {row['username']: row['entry_count'] for row in response.get_json()['activity']}
+        assert sum(activity.values()) == 60
+        assert set(activity) == {'admin', 'bauleiter', 'max', 'erika'}
+
+
+class TestDashboardStatistikService:
+    """Zähler mit einer Abfrage, Top-Listen mit einer zweiten"""
+
+    def test_counters_match_rollup(self, sample_data):
+        tage = DashboardStatistik.zeitraeume()
+        max_ = sample_data['users'][2]
+        max_id = max_.id
+
+        with zaehle_anweisungen() as anweisungen:
+            zaehler = DashboardStatistik.zaehler(mitarbeiter_id=max_id, system=True)
+        assert len(anweisungen) == 1
+
+        assert zaehler['gesamt_aufmasse'] == AufmassTagesstatistik.anzahl_aufmasse(mitarbeiter_id=max_.id)
+        assert zaehler['aufmasse_heute'] == AufmassTagesstatistik.anzahl_aufmasse(
+            von=tage['heute'], bis=tage['heute'], mitarbeiter_id=max_.id)
+        assert zaehler['aufmasse_woche'] == AufmassTagesstatistik.anzahl_aufmasse(von=tage['woche'], mitarbeiter_id=max_.id)
+        assert zaehler['aufmasse_monat'] == AufmassTagesstatistik.anzahl_aufmasse(von=tage['monat'], mitarbeiter_id=max_.id)
+        assert zaehler['aufmasse_7_tage'] == AufmassTagesstatistik.anzahl_aufmasse(
+            von=tage['sieben_tage'], mitarbeiter_id=max_.id)
+        assert zaehler['gesamt_benutzer'] == 4
+        assert zaehler['gesamt_materialien'] == 3
+        assert dict(zaehler['rollen']) == {'admin': 1, 'bauleiter': 1, 'mitarbeiter': 2}
+
+    def test_counters_without_entries(self, app):
+        zaehler = DashboardStatistik.zaehler()
+        assert zaehler['gesamt_aufmasse'] == 0
+        assert zaehler['aufmasse_heute'] == 0
+
+    def test_total_from_counter_row(self, app, sample_data):
+        exakt = DashboardStatistik.zaehler()
+        assert AufmassGesamtzahl.lege_an() is True
+        db.session.commit()
+        assert AufmassGesamtzahl.lege_an() is False
+        assert db.session.get(AufmassGesamtzahl, AufmassGesamtzahl.ZEILE).anzahl == 60
+
+        # Die Gesamtzahl kommt aus der Zählerzeile, die Zeiträume weiter aus der Tagesstatistik
+        db.session.get(AufmassGesamtzahl, AufmassGesamtzahl.ZEILE).anzahl = 12345
+        db.session.commit()
+        zaehler = DashboardStatistik.zaehler()
+        assert zaehler == {**exakt, 'gesamt_aufmasse': 12345}
+
+        max_id = sample_data['users'][2].id
+        assert DashboardStatistik.zaehler(mitarbeiter_id=max_id)['gesamt_aufmasse'] == \
+            AufmassEntry.query.filter_by(mitarbeiter_id=max_id).count()
+
+    def test_counter_row_follows_changes(self, app, sample_data):
+        AufmassGesamtzahl.lege_an()
+        db.session.commit()
+
+        def gesamt():
+            db.session.expire_all()
+            return DashboardStatistik.zaehler()['gesamt_aufmasse']
+
+        erster, zweiter = AufmassEntry.query.limit(2).all()
+        db.session.add(AufmassEntry(material_id=erster.material_id, mitarbeiter_id=erster.mitarbeiter_id,
+                                    ort='OG', menge=1.0))
+        db.session.commit()
+        assert gesamt() == 61
+
+        erster.is_deleted = True
+        db.session.commit()
+        assert gesamt() == 60
+
+        db.session.delete(zweiter)
+        db.session.commit()
+        assert gesamt() == 59
+
+        AufmassEntry.query.first().menge = 99.0
+        db.session.flush()
+        db.session.rollback()
+        assert gesamt() == 59
+
+        db.session.get(AufmassGesamtzahl, AufmassGesamtzahl.ZEILE).anzahl = 0
+        db.session.commit()
+        AufmassTagesstatistik.baue_neu()
+        db.session.commit()
+        assert gesamt() == sum(anzahl for anzahl, _ in aus_aufmassen().values()) == 59
+
+    def test_top_lists_in_one_query(self, sample_data):
+        woche = DashboardStatistik.zeitraeume()['woche'] - timedelta(days=14)
+        aktiv = AufmassEntry.query.filter(func.date(AufmassEntry.datum) >= woche)
+
+        with zaehle_anweisungen() as anweisungen:
+            listen = DashboardStatistik.top_listen(von=woche, limit=2)
+        assert len(anweisungen) == 1
+
+        anzahl = {}
+        menge = {}
+        for eintrag in aktiv:
+            anzahl[eintrag.mitarbeiter.username] = anzahl.get(eintrag.mitarbeiter.username, 0) + 1
+            menge[eintrag.material.name] = menge.get(eintrag.material.name, 0) + eintrag.menge
+
+        assert [a for _, a in listen['aktive_mitarbeiter']] == sorted(anzahl.values(), reverse=True)[:2]
+        assert all(anzahl[name] == a for name, a in listen['aktive_mitarbeiter'])
+        assert [round(m, 6) for _, m in listen['top_materialien']] == \
+            [round(m, 6) for m in sorted(menge.values(), reverse=True)[:2]]
+
+    @pytest.mark.parametrize('benutzer, url, erwartet', [
+        # Benutzer laden, Zähler, letzte Aufmaße
+        (2, '/mitarbeiter', 3),
+        # Benutzer laden, Zähler, Top-Listen, letzte Aufmaße
+        (1, '/bauleiter', 4),
+        # Benutzer laden, Zähler, Duplikat-Paare, letzte Logins
+        (0, '/admin', 4),
+    ])
+    def test_statements_per_page(self, app, sample_data, benutzer, url, erwartet):
+        client = login(app, sample_data['users'][benutzer])
+
+        with zaehle_anweisungen() as anweisungen:
+            response = client.get(url)
+        assert response.status_code == 200
+        assert len(anweisungen) == erwartet, anweisungen
+
+    def test_statements_for_api_stats(self, app, sample_data):
+        client = login(app, sample_data['users'][2])
+        with zaehle_anweisungen() as anweisungen:
+            client.get('/api/dashboard/stats')
+        # Benutzer laden, Zähler
+        assert len(anweisungen) == 2
+
+
+class TestDashboardCache:
+    """Kennzahlen je Benutzer gecacht, ungültig nach Schreibvorgängen"""
+
+    def stats(self, app, user):
+        return login(app, user).get('/api/dashboard/stats').get_json()['stats']
+
+    def test_repeat_views_skip_database(self, app, sample_data):
+        bauleiter = sample_data['users'][1]
+        erste = self.stats(app, bauleiter)
+        login(app, bauleiter).get('/api/user/activity')
+
+        with zaehle_anweisungen() as anweisungen:
+            assert self.stats(app, bauleiter) == erste
+            login(app, bauleiter).get('/api/user/activity')
+        # Nur der user_loader je Anfrage
+        assert len(anweisungen) == 2
+
+    def test_keyed_by_user_and_role(self, app, sample_data):
+        admin, _, max_, erika = sample_data['users']
+        eigene_max = AufmassEntry.query.filter_by(mitarbeiter_id=max_.id).count()
+        eigene_erika = AufmassEntry.query.filter_by(mitarbeiter_id=erika.id).count()
+
+        assert self.stats(app, admin)['total_entries'] == 60
+        assert self.stats(app, max_)['total_entries'] == eigene_max
+        assert self.stats(app, erika)['total_entries'] == eigene_erika
+
+        alle = login(app, admin).get('/api/user/activity?all=true').get_json()['activity']
+        eigene = login(app, admin).get('/api/user/activity').get_json()['activity']
+        assert len(alle) == 4
+        assert [row['username'] for row in eigene] == ['admin']
+
+    def test_insert_and_update_invalidate(self, app, sample_data):
+        admin, _, max_, _ = sample_data['users']
+        material_id, max_id = sample_data['materials'][0].id, max_.id
+        vorher = self.stats(app, admin)
+
+        db.session.add(AufmassEntry(material_id=material_id, mitarbeiter_id=max_id, ort='OG', menge=1.0))
+        db.session.commit()
+        assert self.stats(app, admin)['total_entries'] == vorher['total_entries'] + 1
+
+        db.session.get(Material, material_id).is_active = False
+        db.session.commit()
+        assert self.stats(app, admin)['active_materials'] == vorher['active_materials'] - 1
+
+    def test_process_local_cache_is_bypassed(self, app, sample_data):
+        app.config['CACHE_GETEILT'] = False
+        bauleiter = sample_data['users'][1]
+        erste = self.stats(app, bauleiter)
+
+        with zaehle_anweisungen() as anweisungen:
+            assert self.stats(app, bauleiter) == erste
+        # user_loader und Zähler
+        assert len(anweisungen) == 2
+        assert not any('dashboard_stats' in schluessel for schluessel in cache.cache._cache)
+
+    def test_rollback_and_login_keep_generation(self, app, sample_data):
+        generation = dashboard_cache.generation()
+
+        eintrag = AufmassEntry.query.first()
+        eintrag.menge = 500.0
+        db.session.flush()
+        db.session.rollback()
+        assert dashboard_cache.generation() == generation
+
+        sample_data['users'][0].last_login = datetime.now(timezone.utc)
+        db.session.commit()
+        assert dashboard_cache.generation() == generation
+
+        sample_data['users'][0].username = 'chef'
+        db.session.commit()
+        assert dashboard_cache.generation() != generation
+
+
+class TestFragmentCache:
+    """Gerenderte Dashboard-Fragmente je Daten-Generation und Rolle"""
+
+    @pytest.mark.parametrize('benutzer, url, erwartet', [
+        # Benutzer laden, Zähler
+        (2, '/mitarbeiter', 2),
+        (1, '/bauleiter', 2),
+        # Benutzer laden
+        (0, '/admin', 1),
+    ])
+    def test_repeat_view_skips_fragment_queries(self, app, sample_data, benutzer, url, erwartet):
+        user = sample_data['users'][benutzer]
+        erste = login(app, user).get(url).data
+
+        with zaehle_anweisungen() as anweisungen:
+            zweite = login(app, user).get(url).data
+        assert zweite == erste
+        assert len(anweisungen) == erwartet, anweisungen
+
+    def test_write_renders_again(self, app, sample_data):
+        bauleiter, max_ = sample_data['users'][1], sample_data['users'][2]
+        material_id, max_id = sample_data['materials'][0].id, max_.id
+        login(app, bauleiter).get('/bauleiter')
+
+        db.session.add(AufmassEntry(material_id=material_id, mitarbeiter_id=max_id, ort='OG', menge=1.0))
+        db.session.commit()
+        with zaehle_anweisungen() as anweisungen:
+            login(app, bauleiter).get('/bauleiter')
+        assert len(anweisungen) == 4
+
+    def test_keyed_per_user(self, app, sample_data):
+        max_, erika_id = sample_data['users'][2], sample_data['users'][3].id
+        login(app, max_).get('/mitarbeiter')
+        client = login(app, db.session.get(User, erika_id))
+        with zaehle_anweisungen() as anweisungen:
+            client.get('/mitarbeiter')
+        assert len(anweisungen) == 3
+
+    def test_logins_only_refresh_login_fragment(self, app, sample_data):
+        admin = sample_data['users'][0]
+        assert 'Keine Anmeldungen verfügbar' in login(app, admin).get('/admin').get_data(as_text=True)
+        generation = dashboard_cache.generation()
+
+        db.session.get(User, admin.id).update_last_login()
+        assert dashboard_cache.generation() == generation
+        assert 'Keine Anmeldungen verfügbar' not in login(app, admin).get('/admin').get_data(as_text=True)
+
+    def test_disabled(self, app, sample_data):
+        app.config['FRAGMENT_CACHE_ENABLED'] = False
+        user = sample_data['users'][1]
+        login(app, user).get('/bauleiter')
+        with zaehle_anweisungen() as anweisungen:
+            login(app, user).get('/bauleiter')
+        assert len(anweisungen) == 4
+
+    def test_process_local_cache_renders_every_time(self, app, sample_data):
+        app.config['CACHE_GETEILT'] = False
+        user = sample_data['users'][1]
+        login(app, user).get('/bauleiter')
+        with zaehle_anweisungen() as anweisungen:
+            login(app, user).get('/bauleiter')
+        assert len(anweisungen) == 4
+        assert not any('fragment:' in schluessel for schluessel in cache.cache._cache)
+
+    def test_unknown_option(self, app):
+        with pytest.raises(TemplateSyntaxError):
+            app.jinja_env.from_string("{% fragment 'x', dauer=5 %}{% endfragment %}")
+
+
+class TestHintergrundAktualisierung:
+    """Admin-Kennzahlen: alter Wert sofort, Neuberechnung im Hintergrund"""
+
+    def warte_auf_hintergrund(self):
+        for thread in threading.enumerate():
+            if thread.name.startswith('dashboard-swr:'):
+                thread.join(timeout=5)
+
+    def test_stale_value_returned_and_refreshed(self, app):
+        aufrufe = []
+
+        def berechne():
+            aufrufe.append(1)
+            return len(aufrufe)
+
+        assert dashboard_cache.hole_mit_hintergrund('test', berechne) == 1
+        assert dashboard_cache.hole_mit_hintergrund('test', berechne) == 1
+        assert len(aufrufe) == 1
+
+        dashboard_cache.erhoehe_generation()
+        assert dashboard_cache.hole_mit_hintergrund('test', berechne) == 1
+        self.warte_auf_hintergrund()
+        assert dashboard_cache.hole_mit_hintergrund('test', berechne) == 2
+
+        app.config['DASHBOARD_SWR_FRISCH'] = -1
+        assert dashboard_cache.hole_mit_hintergrund('test', berechne) == 2
+        self.warte_auf_hintergrund()
+        assert len(aufrufe) == 3
+
+    def test_lock_allows_single_refresh(self, app):
+        aufrufe = []
+
+        def berechne():
+            aufrufe.append(1)
+            return len(aufrufe)
+
+        dashboard_cache.hole_mit_hintergrund('test', berechne)
+        dashboard_cache.erhoehe_generation()
+        cache.add('dashboard:hintergrund:test:sperre', 1)
+        assert dashboard_cache.hole_mit_hintergrund('test', berechne) == 1
+        self.warte_auf_hintergrund()
+        assert len(aufrufe) == 1
+
+    def test_process_local_cache_computes_synchronously(self, app):
+        app.config['CACHE_GETEILT'] = False
+        aufrufe = []
+
+        def berechne():
+            aufrufe.append(1)
+            return len(aufrufe)
+
+        assert dashboard_cache.hole_mit_hintergrund('test', berechne) == 1
+        assert dashboard_cache.hole_mit_hintergrund('test', berechne) == 2
+        assert not any(thread.name.startswith('dashboard-swr:') for thread in threading.enumerate())
+        assert cache.get('dashboard:hintergrund:test') is None
+
+    def test_admin_dashboards_share_values(self, app, sample_data):
+        admin, _, max_, _ = sample_data['users']
+        material_id, max_id = sample_data['materials'][0].id, max_.id
+        assert login(app, admin).get('/admin/').status_code == 200
+
+        db.session.add(AufmassEntry(material_id=material_id, mitarbeiter_id=max_id, ort='OG', menge=1.0))
+        db.session.commit()
+        with zaehle_anweisungen() as anweisungen:
+            assert login(app, admin).get('/admin').status_code == 200
+        # user_loader und letzte Logins, die Kennzahlen rechnet der Hintergrund-Thread
+        assert len(anweisungen) == 2
+        self.warte_auf_hintergrund()
+
+        kennzahlen = cache.get('dashboard:hintergrund:system_kennzahlen')['wert']
+        assert kennzahlen['gesamt_aufmasse'] == 61
+        assert kennzahlen['gesamt_benutzer'] == 4
+
+
+class TestDashboardStream:
+    """Live-Updates über /api/dashboard/stream"""
+
+    def oeffne(self, app, user):
+        app.config.update(DASHBOARD_SSE_MAX_DAUER=5, DASHBOARD_SSE_HEARTBEAT=1)
+        response = login(app, user).get('/api/dashboard/stream', buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        return response, response.iter_encoded()
+
+    def test_snapshot_then_delta(self, app, sample_data):
+        admin, _, max_, _ = sample_data['users']
+        material_id, max_id = sample_data['materials'][0].id, max_.id
+        response, ereignisse = self.oeffne(app, admin)
+        try:
+            assert next(ereignisse) == b'retry: 5000\n\n'
+            assert next(ereignisse).startswith(b'event: stats\ndata: {')
+
+            db.session.add(AufmassEntry(material_id=material_id, mitarbeiter_id=max_id, ort='OG', menge=1.0))
+            db.session.commit()
+            assert next(ereignisse) == (
+                b'event: delta\ndata: {"total_entries": 1, "entries_today": 1, "entries_this_week": 1, '
+                b'"entries_this_month": 1, "recent_entries": 1}\n\n'
+            )
+        finally:
+            response.close()
+        assert not dashboard_events.get_broadcaster().abos
+
+    def test_mitarbeiter_only_sees_own_changes(self, app, sample_data):
+        _, _, max_, erika = sample_data['users']
+        material_id, max_id = sample_data['materials'][0].id, max_.id
+        response, ereignisse = self.oeffne(app, erika)
+        try:
+            next(ereignisse), next(ereignisse)
+
+            db.session.add(AufmassEntry(material_id=material_id, mitarbeiter_id=max_id, ort='OG', menge=1.0))
+            db.session.commit()
+            assert next(ereignisse) == b': ping\n\n'
+        finally:
+            response.close()
+
+    def test_material_change_requests_reload(self, app, sample_data):
+        material_id = sample_data['materials'][0].id
+        response, ereignisse = self.oeffne(app, sample_data['users'][0])
+        try:
+            next(ereignisse), next(ereignisse)
+
+            db.session.get(Material, material_id).is_active = False
+            db.session.commit()
+            assert next(ereignisse) == b'event: neu_laden\ndata: {}\n\n'
+        finally:
+            response.close()
+
+    def test_delta_per_period(self):
+        heute = datetime(2025, 3, 12).date()
+        deltas = [('2025-03-12', 1, 2), ('2025-03-03', 1, 1), ('2025-02-28', 2, 1), ('2025-03-12', 2, -1)]
+        assert dashboard_events.zaehler_delta(deltas, heute=heute) == {
+            'total_entries': 3, 'entries_today': 1, 'entries_this_week': 1,
+            'entries_this_month': 2, 'recent_entries': 1
+        }
+        assert dashboard_events.zaehler_delta(deltas, mitarbeiter_id=2, heute=heute) == {
+            'entries_today': -1, 'entries_this_week': -1, 'entries_this_month': -1, 'recent_entries': -1
+        }
+
+    def test_disabled_falls_back_to_polling(self, app, sample_data):
+        app.config['DASHBOARD_SSE_ENABLED'] = False
+        response = login(app, sample_data['users'][0]).get('/api/dashboard/stream')
+        assert response.status_code == 204
+
+    def test_streams_per_worker_are_capped(self, app, sample_data):
+        app.config['DASHBOARD_SSE_MAX_STREAMS'] = 2
+        admin = sample_data['users'][0]
+        offen = [self.oeffne(app, admin) for _ in range(2)]
+        try:
+            assert len(dashboard_events.get_broadcaster().abos) == 2
+            assert login(app, admin).get('/api/dashboard/stream').status_code == 204
+        finally:
+            # Die Streams halten ihren Request-Kontext, daher in umgekehrter Reihenfolge
+            for response, _ in reversed(offen):
+                response.close()
+        assert not dashboard_events.get_broadcaster().abos
+
+        # Geschlossene Streams geben ihren Platz frei
+        response, ereignisse = self.oeffne(app, admin)
+        try:
+            assert next(ereignisse) == b'retry: 5000\n\n'
+        finally:
+            response.close()
+
+    """Zeitreihen aus der Tagesstatistik mit begrenzter Punktzahl"""
+
+    def erwartet(self, intervall, gruppe=None, metrik='anzahl'):
+        summen = {}
+        for eintrag in AufmassEntry.query:
+            schluessel = (gruppe(eintrag) if gruppe else None, intervall_anfang(eintrag.tag, intervall))
+            summen[schluessel] = summen.get(schluessel, 0) + (1 if metrik == 'anzahl' else eintrag.menge)
+        return summen
+
+    def als_summen(self, daten):
+        return {
+            (reihe['name'], zeitpunkt): wert
+            for reihe in daten['reihen']
+            for zeitpunkt, wert in zip(daten['zeitpunkte'], reihe['werte']) if wert
+        }
+
+    @pytest.mark.parametrize('intervall', ['tag', 'woche', 'monat'])
+    def test_buckets_match_entries(self, sample_data, intervall):
+        with zaehle_anweisungen() as anweisungen:
+            daten = zeitreihe(intervall=intervall)
+        # Erster Tag, Summen je Intervall
+        assert len(anweisungen) == 2
+
+        assert daten['intervall'] == intervall
+        assert all(len(reihe['werte']) == len(daten['zeitpunkte']) for reihe in daten['reihen'])
+        assert self.als_summen(daten) == {
+            (None, anfang): wert for (_, anfang), wert in self.erwartet(intervall).items()
+        }
+
+    def test_grouped_by_material_quantity(self, sample_data):
+        daten = zeitreihe(metrik='menge', gruppierung='material', intervall='woche')
+        erwartet = self.erwartet('woche', lambda e: e.material.name, 'menge')
+        assert self.als_summen(daten) == {k: round(v, 3) for k, v in erwartet.items()}
+
+    def test_downsampling_caps_points(self, sample_data):
+        bis = date(2026, 6, 30)
+        daten = zeitreihe(von=date(2020, 1, 1), bis=bis, max_punkte=30)
+        assert daten['intervall'] == 'monat'
+        assert daten['schritt'] == 3
+        assert len(daten['zeitpunkte']) == 26
+        assert daten['zeitpunkte'][:2] == [date(2020, 1, 1), date(2020, 4, 1)]
+
+        # Zusammenfassen ändert die Summe nicht
+        assert sum(daten['reihen'][0]['werte']) == AufmassTagesstatistik.anzahl_aufmasse(von=date(2020, 1, 1), bis=bis)
+
+        assert zeitreihe(von=date(2026, 1, 1), bis=bis, max_punkte=100)['intervall'] == 'woche'
+
+    def test_other_series(self, sample_data):
+        daten = zeitreihe(gruppierung='mitarbeiter', max_reihen=2)
+        assert len(daten['reihen']) == 3
+        assert daten['reihen'][-1]['name'] == 'Sonstige'
+        assert sum(sum(reihe['werte']) for reihe in daten['reihen']) == 60
+
+    def test_api_columnar_response(self, app, sample_data):
+        client = login(app, sample_data['users'][1])
+        antwort = client.get('/api/stats/timeseries?metric=count&group_by=material&bucket=week&max_points=4')
+        daten = antwort.get_json()
+        assert antwort.status_code == 200
+        assert len(daten['buckets']) <= 4
+        assert {reihe['name'] for reihe in daten['series']} == {'Kabel', 'Rohr', 'Dose'}
+        assert sum(sum(reihe['values']) for reihe in daten['series']) == 60
+
+        assert client.get('/api/stats/timeseries?bucket=year').status_code == 400
+        assert client.get('/api/stats/timeseries?from=2026-02-01&to=2026-01-01').status_code == 400
+
+    def test_api_mitarbeiter_only_own(self, app, sample_data):
+        max_ = sample_data['users'][2]
+        erwartet = AufmassEntry.query.filter_by(mitarbeiter_id=max_.id).count()
+        daten = login(app, max_).get('/api/stats/timeseries?group_by=user').get_json()
+        assert [reihe['name'] for reihe in daten['series']] == ['max']
+        assert sum(daten['series'][0]['values']) == erwartet
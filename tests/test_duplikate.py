@@ -0,0 +1,456 @@
+"""
+Tests für die Duplikatserkennung
+"""
+import random
+import pytest
+from datetime import datetime, timedelta
+from app import create_app, db, cache
+from config.config import TestingConfig
+from app.models.user import User
+from app.models.material import Material
+from app.models.aufmass import AufmassEntry
+from app.models.duplikat import DuplikatKandidat, DuplikatAusnahme
+from app.routes.duplikate import BERICHT_CACHE_KEY, DuplikatBericht, DuplikatsPruefer
+from app.utils import geteilter_cache
+from app.utils.aehnlichkeit import AufmassSpalten, lade_aufmass_zeilen
+from scripts.testdaten import erzeuge_testdaten
+from app.utils.duplikat_index import LiveDuplikatIndex, get_live_index, normalisiere_ort
+
+
+@pytest.fixture
+def app():
+    """Create test app."""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def sample_data(app):
+    """Create users, materials and a mix of similar aufmass entries."""
+    rng = random.Random(42)
+
+    users = []
+    for name in ['max', 'Max', 'erika', 'paul']:
+        user = User(username=name, email=f'{name.lower()}{len(users)}@example.com', role='mitarbeiter')
+        user.set_password('testpassword')
+        users.append(user)
+    db.session.add_all(users)
+
+    materials = [
+        Material(name=name, unit='m')
+        for name in ['Kabel', 'Kabel NYM 3x1,5', 'Kabelkanal', 'Rohr', 'Dose']
+    ]
+    db.session.add_all(materials)
+    db.session.commit()
+
+    orte = ['EG', 'EG Flur', 'OG', 'OG Raum 1', 'Keller', 'eg']
+    mengen = [10.0, 10.5, 11.0, 20.0, 5.0]
+    start = datetime(2024, 3, 1, 8, 0)
+
+    for _ in range(160):
+        db.session.add(AufmassEntry(
+            material_id=rng.choice(materials).id,
+            mitarbeiter_id=rng.choice(users).id,
+            ort=rng.choice(orte),
+            menge=rng.choice(mengen),
+            datum=start + timedelta(days=rng.randint(0, 40), hours=rng.randint(0, 30))
+        ))
+    db.session.commit()
+
+
+def _id(eintrag):
+    return eintrag if isinstance(eintrag, int) else eintrag.id
+
+
+def gruppen_signatur(duplikate):
+    """Vergleichbare Darstellung der Duplikat-Gruppen."""
+    return [
+        (_id(g['haupteintrag']), [(_id(a['aufmass']), a['aehnlichkeit']) for a in g['aehnliche']],
+         [(p['a'], p['b'], p['aehnlichkeit']) for p in g['paare']], g['risiko'], g['kriterien'])
+        for g in duplikate
+    ]
+
+
+def finde_paare_paarweise():
+    """Referenz: vollständiger Paarvergleich wie vor der Kandidatenerzeugung."""
+    aufmaesse = lade_aufmass_zeilen()
+    paare = []
+    for i, aufmass in enumerate(aufmaesse):
+        for aehnlich in DuplikatsPruefer._finde_aehnliche_eintraege(aufmass, aufmaesse[i+1:]):
+            paare.append((aufmass.id, aehnlich['aufmass'].id, aehnlich['aehnlichkeit']))
+    return paare
+
+
+class TestAufmassSpalten:
+    """Test vectorized similarity scoring."""
+
+    def test_scores_match_scalar_function(self, sample_data):
+        """Die vektorisierte Bewertung liefert bitgenau dieselben Werte."""
+        aufmaesse = lade_aufmass_zeilen()
+        spalten = AufmassSpalten.aus_zeilen(aufmaesse)
+
+        idx_a, idx_b = zip(*[(i, j) for i in range(len(aufmaesse)) for j in range(len(aufmaesse)) if i != j])
+        scores = spalten.berechne_scores(idx_a, idx_b)
+
+        erwartet = [
+            DuplikatsPruefer._berechne_aehnlichkeit(aufmaesse[i], aufmaesse[j])
+            for i, j in zip(idx_a, idx_b)
+        ]
+        assert scores.tolist() == erwartet
+
+
+class TestDuplikatsPruefer:
+    """Test DuplikatsPruefer."""
+
+    def test_blocking_matches_pairwise_scan(self, sample_data):
+        """Blocking liefert dieselben Paare wie der vollständige Paarvergleich."""
+        erwartet = finde_paare_paarweise()
+        gefunden = [
+            (p['a'], p['b'], p['aehnlichkeit'])
+            for p in DuplikatsPruefer.finde_paare(lade_aufmass_zeilen())
+        ]
+
+        assert erwartet
+        assert gefunden == erwartet
+
+    def test_groups_are_connected_components(self, sample_data):
+        """Jedes Paar wird genau einmal gemeldet, jeder Eintrag in höchstens einer Gruppe."""
+        paare = {(a, b) for a, b, _ in finde_paare_paarweise()}
+        duplikate = DuplikatsPruefer.finde_duplikate()
+
+        gemeldet = [(p['a'], p['b']) for g in duplikate for p in g['paare']]
+        assert sorted(gemeldet) == sorted(paare)
+
+        mitglieder = [g['haupteintrag'] for g in duplikate] + \
+            [a['aufmass'] for g in duplikate for a in g['aehnliche']]
+        assert len(mitglieder) == len(set(mitglieder))
+
+        for gruppe in duplikate:
+            assert gruppe['risiko'] == max(p['risiko'] for p in gruppe['paare'])
+
+    def test_identical_entries_form_one_group(self, app):
+        """k identische Einträge ergeben eine Gruppe statt k-1 überlappender Gruppen."""
+        user = User(username='max', email='max@example.com', role='mitarbeiter')
+        user.set_password('testpassword')
+        material = Material(name='Kabel', unit='m')
+        db.session.add_all([user, material])
+        db.session.commit()
+
+        for _ in range(5):
+            db.session.add(AufmassEntry(
+                material_id=material.id, mitarbeiter_id=user.id, ort='EG', menge=10.0,
+                datum=datetime(2024, 3, 1, 8)
+            ))
+        db.session.commit()
+
+        duplikate = DuplikatsPruefer.finde_duplikate()
+
+        assert len(duplikate) == 1
+        assert len(duplikate[0]['aehnliche']) == 4
+        assert len(duplikate[0]['paare']) == 10
+        assert duplikate[0]['risiko'] == 3
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_parallel_scan_matches_full_scan(self, sample_data, workers):
+        """Der Scan über Shards mit Überlappung liefert dieselben Paare wie finde_paare."""
+        aufmaesse = lade_aufmass_zeilen()
+        erwartet = DuplikatsPruefer.finde_paare(aufmaesse)
+
+        aufgaben = DuplikatsPruefer._bilde_shards(aufmaesse, 15)
+        arten = {art for aufgabe in aufgaben for art, _, _ in aufgabe}
+        assert arten == {'abschnitt', 'fern', 'kanten'}
+
+        assert DuplikatsPruefer.finde_paare_parallel(aufmaesse, workers=workers, shard_groesse=15) == erwartet
+
+    def test_incremental_candidates_match_full_scan(self, sample_data):
+        """Die inkrementell gefüllte Kandidaten-Tabelle entspricht dem Komplett-Scan."""
+        assert DuplikatsPruefer.pruefe_offene_eintraege() == 160
+        assert AufmassEntry.query.filter_by(is_duplicate_checked=False).count() == 0
+
+        assert gruppen_signatur(DuplikatsPruefer.lade_duplikate()) == \
+            gruppen_signatur(DuplikatsPruefer.finde_duplikate())
+
+    def test_loading_groups_does_not_check_open_entries(self, sample_data):
+        """Das Laden der Gruppen liest nur, offene Einträge bleiben für den Hintergrund-Lauf."""
+        assert DuplikatsPruefer.lade_duplikate() == []
+        assert AufmassEntry.query.filter_by(is_duplicate_checked=False).count() == 160
+
+    def test_groups_materialized_for_display(self, sample_data):
+        """Nur die angezeigten Gruppen werden als ORM-Objekte geladen."""
+        duplikate = DuplikatsPruefer.materialisiere_gruppen(DuplikatsPruefer.finde_duplikate()[:3])
+
+        for gruppe in duplikate:
+            assert isinstance(gruppe['haupteintrag'], AufmassEntry)
+            assert all(isinstance(a['aufmass'], AufmassEntry) for a in gruppe['aehnliche'])
+
+    def test_edit_updates_candidates(self, sample_data):
+        """Nach einer Änderung werden nur die Paare des Eintrags neu berechnet."""
+        DuplikatsPruefer.baue_kandidaten_neu()
+        aufmass = DuplikatKandidat.query.first().entry_b
+
+        aufmass.datum = aufmass.datum + timedelta(days=400)
+        DuplikatsPruefer.pruefe_eintrag(aufmass)
+        db.session.commit()
+
+        assert gruppen_signatur(DuplikatsPruefer.lade_duplikate()) == \
+            gruppen_signatur(DuplikatsPruefer.finde_duplikate())
+
+    def test_suppressed_pairs_are_skipped(self, sample_data):
+        """Als "kein Duplikat" bestätigte Paare tauchen in keinem Scan wieder auf."""
+        DuplikatsPruefer.baue_kandidaten_neu()
+        kandidat = DuplikatKandidat.query.first()
+        a, b = kandidat.entry_a_id, kandidat.entry_b_id
+
+        DuplikatAusnahme.markiere(b, a, None)
+        db.session.commit()
+        assert DuplikatKandidat.query.filter_by(entry_a_id=a, entry_b_id=b).count() == 0
+
+        aufmaesse = lade_aufmass_zeilen()
+        paare = [(p['a'], p['b']) for p in DuplikatsPruefer.finde_paare(aufmaesse)]
+        assert (a, b) not in paare
+        assert DuplikatsPruefer.finde_paare_parallel(aufmaesse, workers=1, shard_groesse=15) == \
+            DuplikatsPruefer.finde_paare(aufmaesse)
+
+        aufmass = db.session.get(AufmassEntry, a)
+        aufmass.menge += 0.5
+        DuplikatsPruefer.pruefe_eintrag(aufmass)
+        db.session.commit()
+        assert DuplikatKandidat.query.filter_by(entry_a_id=a, entry_b_id=b).count() == 0
+
+        assert gruppen_signatur(DuplikatsPruefer.lade_duplikate()) == \
+            gruppen_signatur(DuplikatsPruefer.finde_duplikate())
+
+
+class TestDuplikatBericht:
+    """Test cached duplicate report."""
+
+    def test_report_is_cached_with_data_version(self, sample_data):
+        """Der Bericht liegt im Cache und trägt den aktuellen Datenstand."""
+        bericht = DuplikatBericht.erstelle()
+
+        assert DuplikatBericht.lade()['version'] == bericht['version'] == DuplikatBericht.datenstand()
+        assert gruppen_signatur(bericht['duplikate']) == \
+            gruppen_signatur(sorted(DuplikatsPruefer.finde_duplikate(), key=lambda d: d['risiko'], reverse=True))
+        assert bericht['stats']['gesamt_duplikate'] == len(bericht['duplikate'])
+
+    def test_data_version_changes_on_edit_and_delete(self, sample_data):
+        """Änderungen und Löschungen machen den Bericht veraltet."""
+        version = DuplikatBericht.erstelle()['version']
+
+        aufmass = AufmassEntry.query.first()
+        aufmass.menge += 1
+        db.session.commit()
+        assert DuplikatBericht.datenstand() != version
+
+        version = DuplikatBericht.erstelle()['version']
+        DuplikatKandidat.entferne_fuer_eintrag(aufmass.id)
+        db.session.delete(aufmass)
+        db.session.commit()
+        assert DuplikatBericht.datenstand() != version
+
+    def test_deleted_entries_skipped_when_materializing(self, sample_data):
+        """Ein älterer Bericht mit gelöschten Einträgen lässt sich weiterhin anzeigen."""
+        duplikate = DuplikatBericht.erstelle()['duplikate']
+        geloescht = duplikate[0]['haupteintrag']
+
+        DuplikatKandidat.entferne_fuer_eintrag(geloescht)
+        db.session.delete(db.session.get(AufmassEntry, geloescht))
+        db.session.commit()
+
+        materialisiert = DuplikatsPruefer.materialisiere_gruppen(DuplikatBericht.lade()['duplikate'])
+        ids = [g['haupteintrag'].id for g in materialisiert] + \
+            [a['aufmass'].id for g in materialisiert for a in g['aehnliche']]
+        assert geloescht not in ids
+
+    def test_suppressed_pairs_removed_from_cached_report(self, sample_data):
+        """Die Übersicht blendet nach dem Bericht bestätigte Paare sofort aus."""
+        bericht = DuplikatBericht.erstelle()
+        gruppe = max(bericht['duplikate'], key=lambda g: len(g['paare']))
+        paar = gruppe['paare'][0]
+
+        DuplikatAusnahme.markiere(paar['a'], paar['b'], None)
+        db.session.commit()
+        assert DuplikatBericht.datenstand() != bericht['version']
+
+        paare = {(p['a'], p['b']) for g in DuplikatsPruefer.entferne_ausnahmen(bericht['duplikate']) for p in g['paare']}
+        erwartet = {(p['a'], p['b']) for g in bericht['duplikate'] for p in g['paare']} - {(paar['a'], paar['b'])}
+        assert paare == erwartet
+
+
+    def test_overview_counts_and_pages_without_suppressed_groups(self, app, sample_data):
+        """Bestätigte Gruppen fehlen in Statistik und Seitenaufteilung, Seiten bleiben voll."""
+        from flask import template_rendered
+        bericht = DuplikatBericht.erstelle()
+        einzeln = [g for g in bericht['duplikate'] if len(g['paare']) == 1][:2]
+        assert len(bericht['duplikate']) - len(einzeln) > 2
+        for gruppe in einzeln:
+            DuplikatAusnahme.markiere(gruppe['paare'][0]['a'], gruppe['paare'][0]['b'], None)
+        db.session.commit()
+        # Bericht gilt als aktuell, damit keine Neuberechnung startet
+        bericht['version'] = DuplikatBericht.datenstand()
+        cache.set(BERICHT_CACHE_KEY, bericht, timeout=0)
+
+        admin = User(username='chef', email='chef@example.com', role='admin')
+        admin.set_password('testpassword')
+        db.session.add(admin)
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(admin.id)
+            session['_fresh'] = True
+
+        app.config['ITEMS_PER_PAGE'] = 2
+        kontexte = []
+
+        def merke(sender, template, context, **extra):
+            kontexte.append(context)
+        with template_rendered.connected_to(merke, app):
+            assert client.get('/duplikate/duplikate').status_code == 200
+
+        kontext = kontexte[-1]
+        erwartet = len(bericht['duplikate']) - len(einzeln)
+        assert kontext['stats']['gesamt_duplikate'] == erwartet
+        assert kontext['status']['seiten'] == -(-erwartet // 2)
+        assert len(kontext['duplikate']) == 2
+
+    def test_no_background_run_without_shared_cache(self, app, sample_data):
+        """Mit prozesslokalem Cache gibt es weder Sperre noch gespeicherten Bericht."""
+        app.config['CACHE_GETEILT'] = None
+        app.config['CACHE_TYPE'] = 'SimpleCache'
+        assert not geteilter_cache.ist_geteilt()
+        assert DuplikatBericht.starte_neuberechnung() is False
+
+        bericht = DuplikatBericht.erstelle(speichern=False)
+        assert bericht['version'] == DuplikatBericht.datenstand()
+        assert DuplikatBericht.lade() is None
+        assert AufmassEntry.query.filter_by(is_duplicate_checked=False).count() == 160
+
+        app.config['CACHE_TYPE'] = 'redis'
+        assert geteilter_cache.ist_geteilt()
+
+
+def suche_in_datenbank(material_id, tag, ort):
+    """Referenz: Suche über alle aktiven Aufmaße in der Datenbank."""
+    return sorted(
+        a.id for a in AufmassEntry.query.filter_by(material_id=material_id)
+        if not a.is_deleted and a.datum.date() == tag and normalisiere_ort(ort) in normalisiere_ort(a.ort)
+    )
+
+
+class TestLiveDuplikatIndex:
+    """Test live duplicate index."""
+
+    def test_index_matches_database(self, sample_data):
+        """Der Index liefert dieselben Treffer wie die Datenbank."""
+        index = get_live_index()
+        for aufmass in AufmassEntry.query.limit(40):
+            for ort in [aufmass.ort, aufmass.ort[:1], 'og raum']:
+                tag = aufmass.datum.date()
+                assert sorted(e.id for e in index.suche(aufmass.material_id, tag, ort)) == \
+                    suche_in_datenbank(aufmass.material_id, tag, ort)
+
+    def test_index_follows_insert_edit_and_delete(self, sample_data):
+        """Änderungen werden nach dem Commit übernommen, Rollbacks nicht."""
+        index = get_live_index()
+        aufmass = AufmassEntry.query.first()
+        tag = aufmass.datum.date()
+        index.suche(aufmass.material_id, tag, aufmass.ort)
+
+        neu = AufmassEntry(material_id=aufmass.material_id, mitarbeiter_id=aufmass.mitarbeiter_id,
+                           ort='Dachgeschoss Nord', menge=1.0, datum=aufmass.datum)
+        db.session.add(neu)
+        db.session.commit()
+        assert [e.id for e in index.suche(aufmass.material_id, tag, 'dachgeschoss')] == [neu.id]
+
+        neu.ort = 'Tiefgarage'
+        db.session.commit()
+        assert index.suche(aufmass.material_id, tag, 'dachgeschoss') == []
+        assert [e.id for e in index.suche(aufmass.material_id, tag, 'TIEFGARAGE')] == [neu.id]
+
+        neu.ort = 'Dachgeschoss Süd'
+        db.session.flush()
+        db.session.rollback()
+        assert [e.id for e in index.suche(aufmass.material_id, tag, 'tiefgarage')] == [neu.id]
+
+        neu.is_deleted = True
+        db.session.commit()
+        assert index.suche(aufmass.material_id, tag, 'tiefgarage') == []
+
+        neu.is_deleted = False
+        db.session.commit()
+        db.session.delete(neu)
+        db.session.commit()
+        assert index.suche(aufmass.material_id, tag, 'tiefgarage') == []
+
+    def test_other_processes_replay_journal(self, sample_data):
+        """Ein zweiter Index (anderer Worker) übernimmt Änderungen aus dem Journal."""
+        anderer_worker = LiveDuplikatIndex()
+        aufmass = AufmassEntry.query.first()
+        tag = aufmass.datum.date()
+        anderer_worker.suche(aufmass.material_id, tag, aufmass.ort)
+
+        aufmass.ort = 'Technikraum'
+        db.session.commit()
+        assert [e.id for e in anderer_worker.suche(aufmass.material_id, tag, 'technik')] == [aufmass.id]
+
+        material = db.session.get(Material, aufmass.material_id)
+        material.name = 'Leerrohr'
+        db.session.commit()
+        assert [e.id for e in anderer_worker.suche_aehnliche('leer', 'technik', tag)] == [aufmass.id]
+
+
+    def test_workers_without_shared_cache_query_database(self, tmp_path, monkeypatch):
+        """Zwei Worker mit eigenem simple-Cache sehen die Schreibzugriffe des anderen."""
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'worker.db'}")
+        monkeypatch.setattr(TestingConfig, 'CACHE_GETEILT', None)
+        worker_a, worker_b = create_app('testing'), create_app('testing')
+
+        with worker_a.app_context():
+            db.create_all()
+            user = User(username='max', email='max@example.com', role='mitarbeiter')
+            user.set_password('testpassword')
+            material = Material(name='Kabel', unit='m')
+            db.session.add_all([user, material])
+            db.session.commit()
+            user_id, material_id = user.id, material.id
+            tag = datetime(2024, 3, 1).date()
+            assert get_live_index().suche(material_id, tag, 'EG') == []
+            assert 'duplikat_index' not in worker_a.extensions
+
+        with worker_b.app_context():
+            db.session.add(AufmassEntry(material_id=material_id, mitarbeiter_id=user_id,
+                                        ort='EG Flur', menge=1.0, datum=datetime(2024, 3, 1, 9, 0)))
+            db.session.commit()
+
+        with worker_a.app_context():
+            index = get_live_index()
+            assert [e.ort for e in index.suche(material_id, tag, 'eg')] == ['EG Flur']
+            treffer = index.suche_aehnliche('kab', 'flur', tag + timedelta(days=1))
+            assert [index.material_name(e.material_id) for e in treffer] == ['Kabel']
+            assert [index.benutzername(e.mitarbeiter_id) for e in treffer] == ['max']
+            db.drop_all()
+
+
+class TestTestdaten:
+    """Test synthetic data generator."""
+
+    def test_generator_is_deterministic(self, app):
+        """Gleicher Seed ergibt dieselben Aufmaße."""
+        statistik = erzeuge_testdaten(300, duplikat_rate=0.1, tippfehler_rate=0.05, seed=7)
+        zeilen = [tuple(z) for z in lade_aufmass_zeilen()]
+
+        db.drop_all()
+        db.create_all()
+        assert erzeuge_testdaten(300, duplikat_rate=0.1, tippfehler_rate=0.05, seed=7) == statistik
+        assert [tuple(z) for z in lade_aufmass_zeilen()] == zeilen
+
+    def test_generated_duplicates_are_found(self, app):
+        """Die eingestreuten Duplikate landen in Duplikat-Gruppen."""
+        statistik = erzeuge_testdaten(500, duplikat_rate=0.1, tippfehler_rate=0.0, seed=1)
+        paare = sum(len(g['paare']) for g in DuplikatsPruefer.finde_duplikate())
+
+        assert statistik['duplikate'] > 0
+        assert paare >= statistik['duplikate'] * 0.8
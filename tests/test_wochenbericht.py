@@ -0,0 +1,429 @@
+"""
+Tests für den Export der Wochenberichte
+"""
+import os
+import time
+import pytest
+from datetime import datetime, timedelta
+from flask import g
+from app import create_app, db
+from app.models.user import User
+from app.models.material import Material
+from app.models.aufmass import AufmassEntry
+from app.models.bautagebuch import BautagebuchEntry, WochenExport, ExportAuftrag
+from app.utils import wochen_export
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create test app with exports below tmp_path."""
+    app = create_app('testing')
+    app.config['EXPORT_ORDNER'] = str(tmp_path / 'exports')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def sample_data(app):
+    """Create users and two weeks of aufmass entries (KW 10 and 11/2024)."""
+    users = []
+    for name, role in [('bauleiter', 'bauleiter'), ('bauleiter2', 'bauleiter'), ('max', 'mitarbeiter')]:
+        user = User(username=name, email=f'{name}@example.com', role=role)
+        user.set_password('testpassword')
+        users.append(user)
+    db.session.add_all(users)
+
+    material = Material(name='Kabel', unit='m')
+    db.session.add(material)
+    db.session.commit()
+
+    montag = datetime(2024, 3, 4, 8, 0)
+    for tag in range(10):
+        db.session.add(AufmassEntry(
+            material_id=material.id,
+            mitarbeiter_id=users[2].id,
+            ort=f'Raum {tag}',
+            menge=1.0 + tag,
+            datum=montag + timedelta(days=tag)
+        ))
+    db.session.commit()
+
+    return {'users': users}
+
+
+def login(app, user):
+    user_id = user.id
+    g.pop('_login_user', None)
+    db.session.expunge_all()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+JSON = {'Accept': 'application/json'}
+
+
+class TestExportAuftrag:
+    """Export über Aufträge mit Status- und Download-Endpunkt"""
+
+    def test_pdf_export_job(self, app, sample_data):
+        client = login(app, sample_data['users'][0])
+        antwort = client.get('/wochenbericht/wochenbericht/2024/10/export/pdf', headers=JSON)
+        # Ohne Hintergrund-Worker (Testkonfiguration) ist der Auftrag schon abgeschlossen
+        assert antwort.status_code == 200
+        job_id = antwort.get_json()['job_id']
+
+        status = client.get(f'/wochenbericht/wochenbericht/export/{job_id}', headers=JSON).get_json()
+        assert status['job']['status'] == 'fertig'
+        assert status['job']['dateiname'] == 'bautagebuch_kw10_2024.pdf'
+
+        datei = client.get(status['download_url'])
+        assert datei.status_code == 200
+        assert datei.mimetype == 'application/pdf'
+        assert datei.data.startswith(b'%PDF')
+
+        export = WochenExport.query.filter_by(kalenderwoche=10, jahr=2024).one()
+        assert export.exportiert_von == 'bauleiter'
+
+    def test_word_export_sent_directly(self, app, sample_data):
+        client = login(app, sample_data['users'][0])
+        datei = client.get('/wochenbericht/wochenbericht/2024/11/export/word')
+        assert datei.status_code == 200
+        assert datei.data.startswith(b'PK')
+        assert ExportAuftrag.query.one().status == 'fertig'
+
+    def test_background_worker(self, app, sample_data):
+        app.config['EXPORT_WORKER'] = 1
+        client = login(app, sample_data['users'][0])
+        antwort = client.get('/wochenbericht/wochenbericht/2024/10/export/pdf', headers=JSON)
+        assert antwort.status_code == 202
+        job_id = antwort.get_json()['job_id']
+
+        ende = time.monotonic() + 30
+        while time.monotonic() < ende:
+            db.session.expire_all()
+            if db.session.get(ExportAuftrag, job_id).abgeschlossen:
+                break
+            time.sleep(0.05)
+
+        assert db.session.get(ExportAuftrag, job_id).status == 'fertig'
+        assert WochenExport.query.filter_by(kalenderwoche=10, jahr=2024).count() == 1
+
+    def test_week_without_entries(self, app, sample_data):
+        client = login(app, sample_data['users'][0])
+        antwort = client.get('/wochenbericht/wochenbericht/2024/20/export/pdf')
+        assert antwort.status_code == 302
+        assert ExportAuftrag.query.count() == 0
+
+    def test_access(self, app, sample_data):
+        bauleiter, bauleiter2, max_ = sample_data['users']
+        for user in sample_data['users']:
+            user.id  # vor dem Abmelden laden
+
+        client = login(app, bauleiter)
+        job_id = client.get('/wochenbericht/wochenbericht/2024/10/export/pdf', headers=JSON).get_json()['job_id']
+
+        # Andere Bauleiter sehen den Auftrag nicht, Mitarbeiter haben keinen Zugriff
+        assert login(app, bauleiter2).get(f'/wochenbericht/wochenbericht/export/{job_id}').status_code == 404
+        assert login(app, max_).get(f'/wochenbericht/wochenbericht/export/{job_id}/download').status_code == 403
+        assert login(app, max_).get('/wochenbericht/wochenbericht/2024/10/export/pdf').status_code == 302
+
+    def test_timeout_counts_from_last_progress(self, app, sample_data):
+        auftrag = ExportAuftrag(id='a' * 32, kalenderwoche=1, kalenderwoche_bis=52, jahr=2024, format='pdf',
+                                angefordert_von='bauleiter', status='laeuft', fortschritt=30, gesamt=52)
+        db.session.add(auftrag)
+        db.session.commit()
+        # Angelegt vor 20 Minuten, letzte Woche aber gerade fertig: läuft weiter
+        jetzt = datetime.utcnow()
+        auftrag.erstellt_am = jetzt - timedelta(minutes=20)
+        auftrag.fortschritt_am = jetzt - timedelta(seconds=10)
+        db.session.commit()
+        assert wochen_export.pruefe_zeitueberschreitung(auftrag).status == 'laeuft'
+
+        auftrag.fortschritt_am = jetzt - timedelta(minutes=11)
+        db.session.commit()
+        assert wochen_export.pruefe_zeitueberschreitung(auftrag).status == 'fehler'
+        assert auftrag.fehler == 'Zeitüberschreitung'
+
+    def test_finished_export_clears_timeout(self, app, sample_data, monkeypatch):
+        original = wochen_export._erstelle_woche
+        def haengt(auftrag):
+            # Währenddessen markiert der Status-Endpunkt den Auftrag als hängend
+            db.session.query(ExportAuftrag).filter_by(id=auftrag.id).update(
+                {'status': 'fehler', 'fehler': 'Zeitüberschreitung'})
+            return original(auftrag)
+        monkeypatch.setattr(wochen_export, '_erstelle_woche', haengt)
+
+        client = login(app, sample_data['users'][0])
+        job_id = client.get('/wochenbericht/wochenbericht/2024/10/export/pdf', headers=JSON).get_json()['job_id']
+
+        db.session.expire_all()
+        auftrag = db.session.get(ExportAuftrag, job_id)
+        assert (auftrag.status, auftrag.fehler) == ('fertig', None)
+
+    def test_bautagebuch_entries_created(self, sample_data):
+        assert BautagebuchEntry.query.filter_by(kalenderwoche=10, jahr=2024).count() == 7
+
+
+class TestExportCache:
+    """Dateien nach Datenstand wiederverwenden"""
+
+    def export(self, client, kw=10, format='pdf'):
+        return client.get(f'/wochenbericht/wochenbericht/2024/{kw}/export/{format}', headers=JSON).get_json()
+
+    def test_unchanged_week_is_not_rendered_again(self, app, sample_data, monkeypatch):
+        client = login(app, sample_data['users'][0])
+        erster = db.session.get(ExportAuftrag, self.export(client)['job_id']).datei
+
+        def nicht_rendern(*args, **kwargs):
+            raise AssertionError('Datei hätte aus dem Cache kommen sollen')
+        monkeypatch.setattr(wochen_export, 'export_pdf', nicht_rendern)
+
+        antwort = self.export(client)
+        assert antwort['status'] == 'fertig'
+        assert antwort['download_url']
+        assert db.session.get(ExportAuftrag, antwort['job_id']).datei == erster
+
+    def test_changed_text_renders_new_file(self, app, sample_data):
+        client = login(app, sample_data['users'][0])
+        erster = db.session.get(ExportAuftrag, self.export(client)['job_id']).datei
+
+        eintrag = BautagebuchEntry.query.filter_by(kalenderwoche=10, jahr=2024).first()
+        eintrag.text = eintrag.text + ' (korrigiert)'
+        db.session.commit()
+
+        zweiter = db.session.get(ExportAuftrag, self.export(client)['job_id']).datei
+        assert zweiter != erster
+        assert self.export(client, format='word')['job_id']
+
+    def test_least_recently_used_evicted(self, app, sample_data):
+        client = login(app, sample_data['users'][0])
+        kw10 = db.session.get(ExportAuftrag, self.export(client, kw=10)['job_id']).datei
+        kw11 = db.session.get(ExportAuftrag, self.export(client, kw=11)['job_id']).datei
+        os.utime(kw10, (1, 1))
+
+        app.config['EXPORT_CACHE_MAX_MB'] = (os.path.getsize(kw11) + 1) / (1024 * 1024)
+        assert wochen_export.begrenze_cache() == 1
+        assert not os.path.exists(kw10)
+        assert os.path.exists(kw11)
+
+    def test_x_accel_redirect(self, app, sample_data):
+        app.config['EXPORT_X_ACCEL_PREFIX'] = '/_exporte/'
+        client = login(app, sample_data['users'][0])
+        antwort = client.get('/wochenbericht/wochenbericht/2024/10/export/pdf')
+        datei = ExportAuftrag.query.one().datei
+
+        assert antwort.headers['X-Accel-Redirect'] == '/_exporte/' + os.path.basename(datei)
+        assert antwort.headers['Content-Disposition'] == 'attachment; filename=bautagebuch_kw10_2024.pdf'
+        assert antwort.data == b''
+
+
+class TestBereichExport:
+    """Mehrere Wochen als ein PDF oder ZIP"""
+
+    def test_year_as_merged_pdf(self, app, sample_data):
+        from pypdf import PdfReader
+        client = login(app, sample_data['users'][0])
+        antwort = client.get('/wochenbericht/wochenbericht/2024/export/pdf', headers=JSON)
+        assert antwort.status_code == 200
+
+        auftrag = db.session.get(ExportAuftrag, antwort.get_json()['job_id'])
+        assert (auftrag.status, auftrag.fortschritt, auftrag.gesamt) == ('fertig', 2, 2)
+        assert auftrag.dateiname == 'bautagebuch_kw1-52_2024.pdf'
+
+        datei = client.get(antwort.get_json()['download_url'])
+        assert datei.mimetype == 'application/pdf'
+        reader = PdfReader(auftrag.datei)
+        assert [eintrag.title for eintrag in reader.outline] == ['KW 10/2024', 'KW 11/2024']
+        assert WochenExport.query.filter_by(jahr=2024).count() == 2
+
+    def test_word_as_zip(self, app, sample_data):
+        import zipfile
+        client = login(app, sample_data['users'][0])
+        datei = client.get('/wochenbericht/wochenbericht/2024/export/word?von=10&bis=11')
+        assert datei.status_code == 200
+        assert datei.mimetype == 'application/zip'
+
+        auftrag = ExportAuftrag.query.one()
+        with zipfile.ZipFile(auftrag.datei) as archiv:
+            assert archiv.namelist() == ['bautagebuch_kw10_2024.docx', 'bautagebuch_kw11_2024.docx']
+
+    def test_cached_weeks_are_reused(self, app, sample_data, monkeypatch):
+        client = login(app, sample_data['users'][0])
+        client.get('/wochenbericht/wochenbericht/2024/10/export/pdf', headers=JSON)
+
+        gerendert = []
+        original = wochen_export.rendere
+        def zaehle(format, pfad, eintraege, kw, jahr, temp):
+            gerendert.append(kw)
+            return original(format, pfad, eintraege, kw, jahr, temp)
+        monkeypatch.setattr(wochen_export, 'rendere', zaehle)
+
+        client.get('/wochenbericht/wochenbericht/2024/export/zip', headers=JSON)
+        assert gerendert == [11]
+
+    def test_weeks_rendered_in_process_pool(self, app, sample_data, monkeypatch):
+        app.config['EXPORT_PROZESSE'] = 2
+        monkeypatch.setattr(wochen_export, '_prozess_pool', None)
+        client = login(app, sample_data['users'][0])
+        status = client.get('/wochenbericht/wochenbericht/2024/export/zip', headers=JSON).get_json()
+        assert status['status'] == 'fertig'
+        assert db.session.get(ExportAuftrag, status['job_id']).fortschritt == 2
+
+        # Ein Pool je Worker, Prozesse nicht per fork aus dem Worker mit seinen Threads
+        pool = wochen_export._prozess_pool
+        try:
+            assert pool._max_workers == 2
+            assert pool._mp_context.get_start_method() in ('forkserver', 'spawn')
+        finally:
+            pool.shutdown()
+
+    def test_invalid_range(self, app, sample_data):
+        client = login(app, sample_data['users'][0])
+        assert client.get('/wochenbericht/wochenbericht/2024/export/pdf?von=12&bis=11', headers=JSON).status_code == 400
+        assert client.get('/wochenbericht/wochenbericht/2024/export/docx', headers=JSON).status_code == 400
+        assert client.get('/wochenbericht/wochenbericht/2024/export/pdf?bis=9', headers=JSON).status_code == 404
+        assert ExportAuftrag.query.count() == 0
+
+
+class TestGestreamterBericht:
+    """Große PDF-Berichte blockweise lesen und setzen"""
+
+    def test_story_built_in_blocks(self, app, tmp_path, monkeypatch):
+        monkeypatch.setattr(wochen_export, 'STORY_BLOCK', 5)
+        erzeugt = []
+
+        def eintraege():
+            for i in range(200):
+                erzeugt.append(i)
+                yield i, datetime(2024, 3, 4 + i // 50).date(), f'Eintrag {i}'
+
+        quelle = eintraege()
+        story = wochen_export._StoryInBloecken(wochen_export._wochen_story(quelle, 10, 2024, *wochen_export._pdf_stile()))
+        assert len(story) == 5
+        assert len(erzeugt) < 5
+
+        wochen_export.export_pdf(str(tmp_path / 'gross.pdf'), eintraege(), 10, 2024)
+        assert (tmp_path / 'gross.pdf').read_bytes().startswith(b'%PDF')
+
+    def test_build_loop_consumes_story_in_blocks(self, tmp_path):
+        """Vertrag mit BaseDocTemplate.build, auf dem _StoryInBloecken beruht (ReportLab aus requirements.txt)"""
+        from pypdf import PdfReader
+        from reportlab.platypus import Paragraph, SimpleDocTemplate
+        stil = wochen_export._pdf_stile()[0]['Normal']
+        erzeugt = []
+        vorlauf = []
+
+        class Zeile(Paragraph):
+            def wrap(self, *args):
+                # Beim Setzen dieser Zeile höchstens ein Block im Voraus erzeugt
+                vorlauf.append(len(erzeugt) - self.nummer)
+                return super().wrap(*args)
+
+        def zeilen():
+            for nummer in range(300):
+                erzeugt.append(nummer)
+                zeile = Zeile(f'Zeile {nummer:03d}', stil)
+                zeile.nummer = nummer
+                yield zeile
+
+        ziel = tmp_path / 'vertrag.pdf'
+        wochen_export._StoryInBloecken(zeilen(), block=7).baue(SimpleDocTemplate(str(ziel)))
+        assert len(erzeugt) == 300
+        assert 0 < max(vorlauf) <= 7
+
+        text = ''.join(seite.extract_text() for seite in PdfReader(str(ziel)).pages)
+        positionen = [text.index(f'Zeile {nummer:03d}') for nummer in range(300)]
+        assert positionen == sorted(positionen)
+
+    def test_incomplete_build_is_detected(self, tmp_path):
+        from reportlab.platypus import Paragraph, SimpleDocTemplate
+        stil = wochen_export._pdf_stile()[0]['Normal']
+
+        class KopierendesTemplate(SimpleDocTemplate):
+            # Ein build(), das die Story vorab kopiert, sähe nur den leeren Anfang
+            def build(self, flowables, **kwargs):
+                return super().build(list(flowables) or [Paragraph('leer', stil)], **kwargs)
+
+        story = wochen_export._StoryInBloecken(Paragraph(f'Zeile {i}', stil) for i in range(20))
+        with pytest.raises(RuntimeError):
+            story.baue(KopierendesTemplate(str(tmp_path / 'kopie.pdf')))
+
+    def test_range_streamed_above_threshold(self, app, sample_data, monkeypatch):
+        from pypdf import PdfReader
+        app.config['EXPORT_STREAMING_AB'] = 0
+        monkeypatch.setattr(wochen_export, 'LESE_BLOCK', 2)
+
+        def nicht_einzeln(*args, **kwargs):
+            raise AssertionError('Gestreamter Bericht rendert keine einzelnen Wochen')
+        monkeypatch.setattr(wochen_export, 'rendere', nicht_einzeln)
+
+        client = login(app, sample_data['users'][0])
+        antwort = client.get('/wochenbericht/wochenbericht/2024/export/pdf', headers=JSON).get_json()
+        auftrag = db.session.get(ExportAuftrag, antwort['job_id'])
+        assert (auftrag.status, auftrag.fortschritt, auftrag.gesamt) == ('fertig', 2, 2)
+
+        reader = PdfReader(auftrag.datei)
+        assert [eintrag.title for eintrag in reader.outline] == ['KW 10/2024', 'KW 11/2024']
+        assert 'Kalenderwoche 11/2024' in ''.join(seite.extract_text() for seite in reader.pages)
+
+        # Unveränderte Wochen: dieselbe Datei
+        zweiter = client.get('/wochenbericht/wochenbericht/2024/export/pdf', headers=JSON).get_json()
+        assert db.session.get(ExportAuftrag, zweiter['job_id']).datei == auftrag.datei
+
+
+class TestUebersicht:
+    """Übersicht je Jahr mit Exportstatus aus einer Abfrage"""
+
+    def anweisungen(self, client, url):
+        from sqlalchemy import event
+        gezaehlt = []
+
+        def zaehle(*args):
+            gezaehlt.append(1)
+        event.listen(db.engine, 'before_cursor_execute', zaehle)
+        try:
+            antwort = client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', zaehle)
+        assert antwort.status_code == 200
+        return antwort, len(gezaehlt)
+
+    def test_paginated_by_year(self, app, sample_data):
+        db.session.add(BautagebuchEntry(text='Altbestand', datum=datetime(2023, 6, 5).date(), kalenderwoche=23, jahr=2023))
+        db.session.add(WochenExport(kalenderwoche=10, jahr=2024, exportiert_von='bauleiter', dateiname='x.pdf'))
+        db.session.commit()
+        client = login(app, sample_data['users'][0])
+
+        antwort, _ = self.anweisungen(client, '/wochenbericht/wochenbericht')
+        html = antwort.get_data(as_text=True)
+        assert 'Kalenderwoche 10/2024' in html
+        assert 'Kalenderwoche 23/2023' not in html
+        assert html.count('Exportiert am') == 1
+
+        antwort, _ = self.anweisungen(client, '/wochenbericht/wochenbericht?jahr=2023')
+        html = antwort.get_data(as_text=True)
+        assert 'Kalenderwoche 23/2023' in html
+        assert 'Kalenderwoche 10/2024' not in html
+
+    def test_query_count_independent_of_weeks(self, app, sample_data):
+        client = login(app, sample_data['users'][0])
+        _, vorher = self.anweisungen(client, '/wochenbericht/wochenbericht')
+
+        for kw in range(12, 30):
+            db.session.add(BautagebuchEntry(
+                text=f'KW {kw}', datum=wochen_export.wochen_grenzen(2024, kw)[0], kalenderwoche=kw, jahr=2024
+            ))
+            db.session.add(WochenExport(kalenderwoche=kw, jahr=2024, exportiert_von='bauleiter'))
+        # Doppelter Vermerk darf die Woche nicht doppelt anzeigen
+        db.session.add(WochenExport(kalenderwoche=12, jahr=2024, exportiert_von='bauleiter2'))
+        db.session.commit()
+
+        antwort, nachher = self.anweisungen(client, '/wochenbericht/wochenbericht')
+        assert nachher == vorher
+        assert antwort.get_data(as_text=True).count('Kalenderwoche 12/2024') == 1